@@ -30,7 +30,15 @@ speedchange = 0.05
 occ_bins = [-1, 0, 100, 101]
 stop_distance = 0.25
 front_angle = 30
-front_angles = range(-front_angle,front_angle+1,1)
+# the front arc as two plain slices, 0 to front_angle and the last
+# front_angle beams, so checking it does not copy the scan with fancy indexing
+front_slices = (slice(0, front_angle + 1), slice(-front_angle, None))
+robot_radius = 0.12 # turtlebot3 burger footprint
+gap_margin = 0.05 # room kept either side of the robot in a gap
+gap_depth = 1.0 # range a beam must clear to count as free for a gap
+max_range = 3.5 # LDS-01 range, beams with no return count as this far
+turn_cost = 0.5 # metres of gap depth given up per radian of turning
+heading_slack = 5 # degrees added to front_angle when checking a heading, for rotatebot overshoot
 scanfile = 'lidar.txt'
 mapfile = 'map.txt'
 
@@ -57,6 +65,90 @@ def euler_from_quaternion(x, y, z, w):
 
     return roll_x, pitch_y, yaw_z # in radians
 
+def find_gaps(laser_range, depth=gap_depth):
+    """
+    Contiguous arcs of beams clearing depth, wide enough for the robot
+    beams are one per 360 / len(laser_range) degrees anticlockwise from the
+    front, nan for no return; returns (start, stop, width, mean range)
+    arrays, start and stop in beams with stop past the end of the arc
+    """
+    count = laser_range.size
+    ranges = np.nan_to_num(laser_range, nan=max_range)
+    free = ranges > depth
+    empty = np.zeros(0)
+    if free.all():
+        return np.array([0]), np.array([count]), np.array([np.inf]), np.array([ranges.mean()])
+    if not free.any():
+        return empty, empty, empty, empty
+    # start the scan on a blocked beam so no arc wraps around the end
+    shift = int(np.argmin(free))
+    free = np.roll(free, -shift)
+    edges = np.diff(np.concatenate([[0], free.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    # chord across each arc at the clearance depth
+    spans = (stops - starts) * 2 * math.pi / count
+    widths = 2 * depth * np.sin(np.minimum(spans, math.pi) / 2)
+    # mean range inside every arc at once from a running sum
+    totals = np.concatenate([[0.0], np.cumsum(np.minimum(np.roll(ranges, -shift), max_range))])
+    means = (totals[stops] - totals[starts]) / (stops - starts)
+    wide = widths > 2 * (robot_radius + gap_margin)
+    return (starts[wide] + shift), (stops[wide] + shift), widths[wide], means[wide]
+
+
+def blocked_headings(laser_range):
+    """
+    For every beam, whether mover would stop straight away facing it: a
+    return under stop_distance within front_angle (plus heading_slack)
+    of it, counted for all beams at once from a running sum of the scan
+    """
+    count = laser_range.size
+    half = int(math.ceil((front_angle + heading_slack) * count / 360.0))
+    # nan for no return compares False
+    close = (np.nan_to_num(laser_range, nan=max_range) < stop_distance).astype(np.int32)
+    wrapped = np.concatenate([close[count - half:], close, close[:half]])
+    totals = np.concatenate([[0], np.cumsum(wrapped)])
+    return totals[2 * half + 1:2 * half + 1 + count] - totals[:count] > 0
+
+
+def pick_gap(laser_range, front_blocked=False):
+    """
+    (heading, width, mean range) of the best gap, the heading in degrees
+    anticlockwise from the front, or None when no gap fits the robot
+    headings keep the robot's half width inside the gap and have no return
+    under stop_distance in mover's front arc around them; each gap is
+    scored on its mean range less the turn needed to face it, so within a
+    gap the heading nearest the front wins
+    """
+    starts, stops, widths, means = find_gaps(laser_range)
+    if not len(starts):
+        return None
+    count = laser_range.size
+    beam = 360.0 / count
+    margin = int(math.ceil(math.degrees(math.asin(
+        min(1.0, (robot_radius + gap_margin) / gap_depth))) / beam))
+    # gap of every beam, -1 outside the gaps and in their edge margins
+    gap_of = np.full(count, -1)
+    for gap, (start, stop) in enumerate(zip(starts, stops)):
+        if np.isinf(widths[gap]):
+            gap_of[:] = gap
+        elif stop - start > 2 * margin:
+            gap_of[np.arange(start + margin, stop - margin) % count] = gap
+        else:
+            gap_of[((start + stop - 1) // 2) % count] = gap
+    usable = (gap_of >= 0) & ~blocked_headings(laser_range)
+    if front_blocked:
+        # never hand back the heading mover just stopped on
+        usable[0] = False
+    if not usable.any():
+        return None
+    headings = (np.arange(count) * beam + 180) % 360 - 180
+    scores = np.where(usable, means[gap_of] - turn_cost * np.radians(np.abs(headings)), -np.inf)
+    best = int(np.argmax(scores))
+    gap = gap_of[best]
+    return float(headings[best]), float(widths[gap]), float(means[gap])
+
+
 class AutoNav(Node):
 
     def __init__(self):
@@ -188,12 +280,26 @@ class AutoNav(Node):
         self.publisher_.publish(twist)
 
 
-    def pick_direction(self):
+    def pick_direction(self, front_blocked=False):
         # self.get_logger().info('In pick_direction')
-        if self.laser_range.size != 0:
-            # use nanargmax as there are nan's in laser_range added to replace 0's
-            lr2i = np.nanargmax(self.laser_range)
-            self.get_logger().info('Picked direction: %d %f m' % (lr2i, self.laser_range[lr2i]))
+        gap = pick_gap(self.laser_range, front_blocked) if self.laser_range.size != 0 else None
+        if gap is not None:
+            lr2i, width, depth = gap
+            self.get_logger().info('Picked direction: %d deg, gap %.2f m wide %.2f m deep' % (lr2i, width, depth))
+        elif self.laser_range.size != 0 and not np.all(np.isnan(self.laser_range)):
+            # nothing wide enough, fall back on the longest beam, preferring
+            # beams mover would not stop on straight away
+            ranges = np.nan_to_num(self.laser_range, nan=max_range)
+            blocked = blocked_headings(self.laser_range)
+            if front_blocked:
+                blocked[0] = True
+            if not blocked.all():
+                ranges = np.where(blocked, -1.0, ranges)
+            elif front_blocked:
+                # boxed in, at least face somewhere else
+                ranges[0] = -1.0
+            lr2i = int(np.argmax(ranges))
+            self.get_logger().info('Picked direction: %d %f m' % (lr2i, ranges[lr2i]))
         else:
             lr2i = 0
             self.get_logger().info('No data!')
@@ -235,17 +341,17 @@ class AutoNav(Node):
                 if self.laser_range.size != 0:
                     # check distances in front of TurtleBot and find values less
                     # than stop_distance
-                    lri = (self.laser_range[front_angles]<float(stop_distance)).nonzero()
-                    # self.get_logger().info('Distances: %s' % str(lri))
+                    # nan for no return compares False
+                    blocked = any((self.laser_range[front] < stop_distance).any()
+                                  for front in front_slices)
 
-                    # if the list is not empty
-                    if(len(lri[0])>0):
+                    if blocked:
                         # stop moving
                         self.stopbot()
                         # find direction with the largest distance from the Lidar
                         # rotate to that direction
                         # start moving
-                        self.pick_direction()
+                        self.pick_direction(front_blocked=True)
                     
                 # allow the callback functions to run
                 rclpy.spin_once(self)
@@ -20,13 +20,22 @@ import tf2_ros
 from tf2_ros import LookupException, ConnectivityException, ExtrapolationException
 import numpy as np
 import matplotlib.pyplot as plt
-from PIL import Image
 import math
-import scipy.stats
+import os
 
 # constants
 occ_bins = [-1, 0, 50, 100]
 map_bg_color = 1
+view_cells = 200 # width and height of the robot-centric view, in map cells
+render_period = 0.2 # seconds between renders, maps arriving in between are dropped
+frame_dir = None # directory to write numbered frames to instead of showing them
+
+# cell classes by occupancy value, the bins of occ_bins: 1 unknown, 2 free,
+# 3 occupied, indexed by the value as a uint8 so -1 lands on 255
+occ_lut = np.full(256, map_bg_color, dtype=np.uint8)
+occ_lut[occ_bins[1]:occ_bins[2]] = 2
+occ_lut[occ_bins[2]:occ_bins[3] + 1] = 3
+occ_lut[np.uint8(np.int8(occ_bins[0]))] = 1
 
 # code from https://automaticaddison.com/how-to-convert-a-quaternion-into-euler-angles-in-python/
 def euler_from_quaternion(x, y, z, w):
@@ -64,22 +73,25 @@ class Occupy(Node):
         self.subscription  # prevent unused variable warning
         self.tfBuffer = tf2_ros.Buffer()
         self.tfListener = tf2_ros.TransformListener(self.tfBuffer, self)
+        # only the newest map is kept, render() drops the ones it never got to
+        self.latest_map = None
+        self.classes = np.array([], dtype=np.uint8)
+        # output cell offsets from the robot, computed once for every render
+        offsets = np.arange(view_cells, dtype=np.float32) - view_cells // 2
+        self.view_dx, self.view_dy = np.meshgrid(offsets, offsets)
+        self.view = np.full((view_cells, view_cells), map_bg_color, dtype=np.uint8)
+        self.frame = 0
+        self.image = None
+        self.background = None
+        self.timer = self.create_timer(render_period, self.render)
 
     def listener_callback(self, msg):
-        # create numpy array
-        occdata = np.array(msg.data)
-        # compute histogram to identify bins with -1, values between 0 and below 50, 
-        # and values between 50 and 100. The binned_statistic function will also
-        # return the bin numbers so we can use that easily to create the image 
-        occ_counts, edges, binnum = scipy.stats.binned_statistic(occdata, np.nan, statistic='count', bins=occ_bins)
-        # get width and height of map
-        iwidth = msg.info.width
-        iheight = msg.info.height
-        # calculate total number of bins
-        total_bins = iwidth * iheight
-        # log the info
-        # self.get_logger().info('Unmapped: %i Unoccupied: %i Occupied: %i Total: %i' % (occ_counts[0], occ_counts[1], occ_counts[2], total_bins))
+        self.latest_map = msg
 
+    def render(self):
+        msg = self.latest_map
+        if msg is None:
+            return
         # find transform to obtain base_link coordinates in the map frame
         # lookup_transform(target_frame, source_frame, time)
         try:
@@ -87,74 +99,65 @@ class Occupy(Node):
         except (LookupException, ConnectivityException, ExtrapolationException) as e:
             self.get_logger().info('No transformation found')
             return
-            
+        self.latest_map = None
+
         cur_pos = trans.transform.translation
         cur_rot = trans.transform.rotation
-        # self.get_logger().info('Trans: %f, %f' % (cur_pos.x, cur_pos.y))
         # convert quaternion to Euler angles
         roll, pitch, yaw = euler_from_quaternion(cur_rot.x, cur_rot.y, cur_rot.z, cur_rot.w)
-        # self.get_logger().info('Rot-Yaw: R: %f D: %f' % (yaw, np.degrees(yaw)))
 
-        # get map resolution
+        # classify every cell with one table lookup, 1 unknown, 2 free, 3 occupied
+        occdata = np.asarray(msg.data, dtype=np.int8).view(np.uint8)
+        self.classes = occ_lut[occdata].reshape(msg.info.height, msg.info.width)
+        # log the info
+        # occ_counts = np.bincount(self.classes.ravel(), minlength=4)
+        # self.get_logger().info('Unmapped: %i Unoccupied: %i Occupied: %i Total: %i' % (occ_counts[1], occ_counts[2], occ_counts[3], self.classes.size))
+
+        # get map resolution and origin, grid position of the robot
         map_res = msg.info.resolution
-        # get map origin struct has fields of x, y, and z
         map_origin = msg.info.origin.position
-        # get map grid positions for x, y position
-        grid_x = round((cur_pos.x - map_origin.x) / map_res)
-        grid_y = round(((cur_pos.y - map_origin.y) / map_res))
-        # self.get_logger().info('Grid Y: %i Grid X: %i' % (grid_y, grid_x))
-
-        # binnum go from 1 to 3 so we can use uint8
-        # convert into 2D array using column order
-        odata = np.uint8(binnum.reshape(msg.info.height,msg.info.width))
-        # set current robot location to 0
-        odata[grid_y][grid_x] = 0
-        # create image from 2D array using PIL
-        img = Image.fromarray(odata)
-        # find center of image
-        i_centerx = iwidth/2
-        i_centery = iheight/2
-        # find how much to shift the image to move grid_x and grid_y to center of image
-        shift_x = round(grid_x - i_centerx)
-        shift_y = round(grid_y - i_centery)
-        # self.get_logger().info('Shift Y: %i Shift X: %i' % (shift_y, shift_x))
-
-        # pad image to move robot position to the center
-        # adapted from https://note.nkmk.me/en/python-pillow-add-margin-expand-canvas/ 
-        left = 0
-        right = 0
-        top = 0
-        bottom = 0
-        if shift_x > 0:
-            # pad right margin
-            right = 2 * shift_x
-        else:
-            # pad left margin
-            left = 2 * (-shift_x)
-            
-        if shift_y > 0:
-            # pad bottom margin
-            bottom = 2 * shift_y
-        else:
-            # pad top margin
-            top = 2 * (-shift_y)
-            
-        # create new image
-        new_width = iwidth + right + left
-        new_height = iheight + top + bottom
-        img_transformed = Image.new(img.mode, (new_width, new_height), map_bg_color)
-        img_transformed.paste(img, (left, top))
-
-        # rotate by 90 degrees so that the forward direction is at the top of the image
-        rotated = img_transformed.rotate(np.degrees(yaw)-90, expand=True, fillcolor=map_bg_color)
-
-        # show the image using grayscale map
-        # plt.imshow(img, cmap='gray', origin='lower')
-        # plt.imshow(img_transformed, cmap='gray', origin='lower')
-        plt.imshow(rotated, cmap='gray', origin='lower')
-        plt.draw_all()
-        # pause to make sure the plot gets created
-        plt.pause(0.00000000001)
+        grid_x = (cur_pos.x - map_origin.x) / map_res
+        grid_y = (cur_pos.y - map_origin.y) / map_res
+        self.warp(grid_x, grid_y, yaw)
+        self.show()
+
+    def warp(self, grid_x, grid_y, yaw):
+        """
+        Crop and rotate the classified map around the robot in one affine
+        map from output cells to map cells, nearest cell, into self.view
+        the robot sits at the centre with its heading up, origin='lower'
+        """
+        # rotate by yaw - 90 degrees so that the forward direction is at the top
+        cos, sin = math.cos(yaw - math.pi / 2), math.sin(yaw - math.pi / 2)
+        cols = np.floor(grid_x + cos * self.view_dx - sin * self.view_dy + 0.5).astype(np.intp)
+        rows = np.floor(grid_y + sin * self.view_dx + cos * self.view_dy + 0.5).astype(np.intp)
+        height, width = self.classes.shape
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        self.view.fill(map_bg_color)
+        self.view[inside] = self.classes[rows[inside], cols[inside]]
+        # mark the robot
+        self.view[view_cells // 2, view_cells // 2] = 0
+
+    def show(self):
+        if frame_dir is not None:
+            plt.imsave(os.path.join(frame_dir, 'map%05d.png' % self.frame),
+                       self.view, cmap='gray', vmin=0, vmax=3, origin='lower')
+            self.frame += 1
+            return
+        if self.image is None:
+            # draw the figure once, later renders only blit the image
+            fig, ax = plt.subplots()
+            self.image = ax.imshow(self.view, cmap='gray', origin='lower', vmin=0, vmax=3,
+                                   animated=True)
+            plt.show(block=False)
+            plt.pause(0.1)
+            self.background = fig.canvas.copy_from_bbox(ax.bbox)
+        canvas = self.image.figure.canvas
+        self.image.set_data(self.view)
+        canvas.restore_region(self.background)
+        self.image.axes.draw_artist(self.image)
+        canvas.blit(self.image.axes.bbox)
+        canvas.flush_events()
 
 
 def main(args=None):
@@ -162,10 +165,7 @@ def main(args=None):
 
     occupy = Occupy()
 
-    # create matplotlib figure
-    plt.ion()
-    plt.show()
-
+    # the figure is created on the first render
     rclpy.spin(occupy)
 
     # Destroy the node explicitly
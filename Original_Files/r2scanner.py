@@ -16,7 +16,78 @@ import rclpy
 from rclpy.node import Node
 from rclpy.qos import qos_profile_sensor_data
 from sensor_msgs.msg import LaserScan
+from std_msgs.msg import String
 import numpy as np
+import math
+import time
+import json
+
+# constants, the defaults of the node's parameters
+window_scans = 50 # scans kept in the rolling window, 10 s of LDS-01 scans
+summary_period = 5.0 # seconds between summaries on scan_stats
+worst_beams = 5 # beams with the most dropouts listed in each summary
+
+
+class ScanStats:
+    """
+    Per-beam statistics over a rolling window of scans
+    the window is preallocated, and the sums behind the mean, variance and
+    dropout rates move by one scan in and one scan out per update; the
+    minimum, needed only for summaries, is reduced over the window then
+    """
+    def __init__(self, window, beams):
+        self.window = window
+        # ranges of the scans in the window, inf for dropouts
+        self.ranges = np.full((window, beams), np.inf)
+        self.valid = np.zeros((window, beams), dtype=bool)
+        self.sum = np.zeros(beams)
+        self.sum_sq = np.zeros(beams)
+        self.count = np.zeros(beams, dtype=np.int64)
+        self.head = 0 # row the next scan goes into
+        self.scans = 0 # scans in the window
+
+    def add(self, ranges, range_min, range_max):
+        ranges = np.asarray(ranges, dtype=float)
+        row, valid = self.ranges[self.head], self.valid[self.head]
+        # drop the oldest scan from the sums once the window is full
+        if self.scans == self.window:
+            old = np.where(valid, row, 0.0)
+            self.sum -= old
+            self.sum_sq -= old * old
+            self.count -= valid
+        # no return is 0, nan or inf, and anything outside the sensor's limits
+        with np.errstate(invalid='ignore'):
+            np.logical_and(ranges >= max(range_min, 1e-6), ranges <= range_max, out=valid)
+        row[:] = np.where(valid, ranges, np.inf)
+        new = np.where(valid, ranges, 0.0)
+        self.sum += new
+        self.sum_sq += new * new
+        self.count += valid
+        self.head = (self.head + 1) % self.window
+        self.scans = min(self.scans + 1, self.window)
+        if self.head == 0:
+            # recompute exactly once per lap so rounding cannot build up
+            kept = np.where(self.valid, self.ranges, 0.0)
+            self.sum = kept.sum(axis=0)
+            self.sum_sq = (kept * kept).sum(axis=0)
+            self.count = self.valid.sum(axis=0)
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum / self.count
+
+    def variance(self):
+        mean = self.mean()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.maximum(self.sum_sq / self.count - mean * mean, 0.0)
+
+    def dropout(self):
+        if not self.scans:
+            return np.zeros(self.count.shape)
+        return 1.0 - self.count / self.scans
+
+    def minimum(self):
+        return self.ranges[:self.scans].min(axis=0)
 
 
 class Scanner(Node):
@@ -29,17 +100,58 @@ class Scanner(Node):
             self.listener_callback,
             qos_profile_sensor_data)
         self.subscription  # prevent unused variable warning
+        self.declare_parameter('window_scans', window_scans)
+        self.declare_parameter('summary_period', summary_period)
+        self.window = self.get_parameter('window_scans').get_parameter_value().integer_value
+        period = self.get_parameter('summary_period').get_parameter_value().double_value
+        self.stats = None
+        self.angle_min = 0.0
+        self.angle_increment = 0.0
+        self.received = 0
+        self.last_summary = time.time()
+        self.stats_publisher_ = self.create_publisher(String, 'scan_stats', 10)
+        self.timer = self.create_timer(period, self.send_summary)
 
     def listener_callback(self, msg):
-        # create numpy array
-        laser_range = np.array(msg.ranges)
-        # replace 0's with nan
-        laser_range[laser_range==0] = np.nan
-        # find index with minimum value
-        lr2i = np.nanargmin(laser_range)
+        beams = len(msg.ranges)
+        if self.stats is None or self.stats.ranges.shape[1] != beams:
+            # first scan, or the scan changed size
+            self.stats = ScanStats(self.window, beams)
+        self.angle_min = msg.angle_min
+        self.angle_increment = msg.angle_increment
+        self.stats.add(msg.ranges, msg.range_min, msg.range_max)
+        self.received += 1
+
+    def summary(self):
+        stats = self.stats
+        now = time.time()
+        rate = self.received / (now - self.last_summary)
+        self.received, self.last_summary = 0, now
+        if stats is None or not stats.scans:
+            return {'scans': 0, 'rate': 0.0}
+        dropout = stats.dropout()
+        minimum = stats.minimum()
+        nearest = int(np.argmin(minimum))
+        worst = np.argsort(dropout)[::-1][:worst_beams]
+        def bearing(beam):
+            return round(math.degrees(self.angle_min + beam * self.angle_increment), 1)
+        summary = {
+            'scans': stats.scans,
+            'rate': round(rate, 2),
+            'dropout': round(float(dropout.mean()), 3),
+            'worst': [[bearing(beam), round(float(dropout[beam]), 3)] for beam in worst],
+            'max_std': round(float(np.nanmax(np.sqrt(stats.variance()), initial=0.0)), 4),
+        }
+        if np.isfinite(minimum[nearest]):
+            summary['nearest'] = [bearing(nearest), round(float(minimum[nearest]), 3)]
+        return summary
 
+    def send_summary(self):
+        msg = String()
+        msg.data = json.dumps(self.summary())
+        self.stats_publisher_.publish(msg)
         # log the info
-        self.get_logger().info('Shortest distance at %i degrees' % lr2i)
+        self.get_logger().info('Scan stats: %s' % msg.data)
 
 
 def main(args=None):
@@ -26,13 +26,8 @@ def main(args=None):
         print('Found PN532 with firmware version: {0}.{1}'.format(ver, rev))
         pn532.SAM_configuration()
         print('Waiting for RFID/NFC card...')
-        while True:
-            # Check if a card is available to read
-            uid = pn532.read_passive_target(timeout=0.5)
-            print('.', end="")
-            # Try again if no card is available.
-            if uid is None:
-                continue
+        # The PN532 polls for cards on its own and only reports when one is found
+        for uid in pn532.iter_auto_poll():
             print('Found card with UID:', [hex(i) for i in uid])
             rclpy.spin_once(nfc_publisher)
     except Exception as e:
@@ -3,11 +3,29 @@ __all__ = [
     'i2c',
     'spi',
     'uart',
+    'irq',
     'PN532_I2C',
     'PN532_SPI',
-    'PN532_UART'
+    'PN532_UART',
+    'IRQPin',
+    'FakeGPIO',
+    'Backoff',
+    'FrameCodec',
+    'AsyncPN532',
+    'I2CBusScheduler',
+    'FakeI2CBus',
+    'AMG8833',
+    'PRIORITY_HIGH',
+    'PRIORITY_NORMAL',
+    'PRIORITY_LOW'
 ]
 from . import pn532
 from .i2c import PN532_I2C
 from .spi import PN532_SPI
 from .uart import PN532_UART
+from .irq import IRQPin, FakeGPIO
+from .timing import Backoff
+from .frame import FrameCodec
+from .aio import AsyncPN532
+from .bus import (I2CBusScheduler, FakeI2CBus, AMG8833,
+                  PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
@@ -0,0 +1,175 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+asyncio front end for the PN532 drivers.  Wraps a PN532_I2C, PN532_SPI or
+PN532_UART instance so commands can be awaited: readiness is awaited on
+the IRQ edge when the pin is wired, otherwise by polling the status with
+backoff between event loop turns.  Every access to the chip runs on one
+worker thread of its own, since the transports sleep inside their transfers
+(settling delays, the I2C read pause without backoff, wakeups), and a
+single worker keeps the transfers of an aborted command and the abort in
+order on the bus.
+
+    nfc = AsyncPN532(PN532_I2C(reset=4, req=17, irq=16))
+    uid = await nfc.read_passive_target(timeout=None)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .pn532 import (_COMMAND_GETFIRMWAREVERSION, _COMMAND_SAMCONFIGURATION,
+                    _COMMAND_INLISTPASSIVETARGET, _COMMAND_INDATAEXCHANGE,
+                    _MIFARE_ISO14443A, MIFARE_CMD_READ, PN532Error)
+from .timing import Backoff
+
+
+class AsyncPN532:
+    """Awaitable PN532 commands over an existing transport instance.
+
+    Only one command is in flight at a time.  A command that times out or
+    is cancelled is aborted on the chip so the next one starts clean.
+    """
+    def __init__(self, pn532, backoff=None):
+        self._pn532 = pn532
+        self._backoff = backoff if backoff is not None else Backoff(
+            tight_polls=2, initial=0.001, maximum=0.02)
+        self._lock = None
+        self._edge = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _run(self, function, *args):
+        # one bus transfer off the event loop, in order with all the others
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _attach(self):
+        # event loop objects are created on first use inside the loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            irq_pin = self._pn532._irq_pin # pylint: disable=protected-access
+            if irq_pin:
+                loop = asyncio.get_running_loop()
+                self._edge = asyncio.Event()
+                irq_pin.add_listener(lambda: loop.call_soon_threadsafe(self._edge.set))
+
+    async def wait_ready(self):
+        """Return once the PN532 has a response ready"""
+        pn532 = self._pn532
+        if self._edge is not None:
+            while True:
+                self._edge.clear()
+                if await self._run(pn532.is_ready):
+                    return
+                await self._edge.wait()
+        for delay in self._backoff:
+            pn532.stats.polls += 1
+            if await self._run(pn532.is_ready):
+                return
+            await asyncio.sleep(delay)
+
+    async def call_function(self, command, response_length=0, params=None, timeout=1):
+        """Send command and await up to response_length bytes of response.
+        Returns the response bytes, or None if the PN532 does not answer
+        within timeout seconds (None waits forever).
+        """
+        self._attach()
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(
+                    self._call(command, response_length, params), timeout)
+            except asyncio.TimeoutError:
+                # queued behind any transfer still running for the command
+                await self._run(self._pn532.abort_command)
+                return None
+            except asyncio.CancelledError:
+                await asyncio.shield(self._run(self._pn532.abort_command))
+                raise
+
+    async def _call(self, command, response_length, params):
+        # pylint: disable=protected-access
+        pn532 = self._pn532
+        try:
+            await self._run(pn532._write_command, command, params)
+        except OSError:
+            await self._run(pn532._wakeup)
+            return None
+        await self.wait_ready()
+        await self._run(pn532._read_ack)
+        await self.wait_ready()
+        return await self._run(pn532._read_response, command, response_length)
+
+    async def get_firmware_version(self):
+        """Return a tuple with the IC, Ver, Rev, and Support values."""
+        response = await self.call_function(_COMMAND_GETFIRMWAREVERSION, 4, timeout=0.5)
+        if response is None:
+            raise RuntimeError('Failed to detect the PN532')
+        return tuple(response)
+
+    async def SAM_configuration(self):   # pylint: disable=invalid-name
+        """Configure the PN532 to read MiFare cards."""
+        await self.call_function(_COMMAND_SAMCONFIGURATION, params=[0x01, 0x14, 0x01])
+
+    async def read_passive_target(self, card_baud=_MIFARE_ISO14443A, timeout=1):
+        """Await a MiFare card for up to timeout seconds (None waits until
+        one arrives) and return its UID, or None if no card is found.
+        """
+        response = await self.call_function(_COMMAND_INLISTPASSIVETARGET,
+                                            params=[0x01, card_baud],
+                                            response_length=19,
+                                            timeout=timeout)
+        if response is None:
+            return None
+        return self._pn532._passive_target_uid(response) # pylint: disable=protected-access
+
+    async def mifare_classic_authenticate_block(self, uid, block_number, key_number, key):   # pylint: disable=invalid-name
+        """Authenticate block_number of a MiFare classic card, see
+        PN532.mifare_classic_authenticate_block.  Returns False if the
+        PN532 does not answer."""
+        params = bytearray([0x01, key_number & 0xFF, block_number & 0xFF]) + bytearray(key) + bytearray(uid)
+        response = await self.call_function(_COMMAND_INDATAEXCHANGE,
+                                            params=params,
+                                            response_length=1)
+        if response is None:
+            return False
+        if response[0]:
+            raise PN532Error(response[0])
+        return True
+
+    async def mifare_classic_read_block(self, block_number):
+        """Read the 16 bytes starting at block_number, or None if the
+        PN532 does not answer."""
+        response = await self.call_function(_COMMAND_INDATAEXCHANGE,
+                                            params=[0x01, MIFARE_CMD_READ, block_number & 0xFF],
+                                            response_length=17)
+        if response is None:
+            return None
+        if response[0]:
+            raise PN532Error(response[0])
+        return response[1:]
+
+    async def ntag2xx_read_block(self, block_number):
+        """Read the 4 byte page block_number of an NTAG2xx card, or None
+        if the PN532 does not answer."""
+        block = await self.mifare_classic_read_block(block_number)
+        if block is None:
+            return None
+        return block[0:4]
@@ -0,0 +1,307 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+Driver latency benchmarks against the software PN532, runnable on any
+Linux box from the nfc directory with:
+
+    python3 -m pn532.benchmark
+"""
+
+import time
+from .emulator import (PN532Emulator, EmulatedI2CDevice, EmulatedSpiDev, EmulatedSerial,
+                       PtyPN532, TAG_MIFARE_CLASSIC)
+from .frame import FrameCodec, FRAME_DATA, FRAME_ACK
+from .i2c import PN532_I2C
+from .spi import PN532_SPI, reverse_bit, reverse_bytes
+from .timing import Backoff
+from .uart import PN532_UART, BAUD_RATE
+from .bus import (I2CBusScheduler, FakeI2CBus, FakeAMG8833, AMG8833, AMG8833_ADDRESS,
+                  PRIORITY_HIGH, PRIORITY_NORMAL)
+from .i2c import I2C_ADDRESS
+
+
+def bench_i2c(calls=20, latency=0.005):
+    """Time read_passive_target over I2C in the legacy and latency-tuned modes"""
+    print('I2C read_passive_target, %d calls, %.1f ms chip latency' % (calls, 1000 * latency))
+    modes = (
+        ('legacy', {}),
+        ('tuned', {'backoff': Backoff(), 'wakeup_delay': 0.01}),
+    )
+    for label, kwargs in modes:
+        device = EmulatedI2CDevice(PN532Emulator(latency=latency))
+        pn532 = PN532_I2C(i2c=device, **kwargs)
+        pn532.stats.reset()
+        timestamp = time.monotonic()
+        for _ in range(calls):
+            pn532.read_passive_target(timeout=1)
+        elapsed = time.monotonic() - timestamp
+        print('  %-6s %.2f ms/read, %d bus reads' % (label, 1000 * elapsed / calls, device.reads))
+        print('  ' + pn532.stats.report().replace('\n', '\n  '))
+
+
+def bench_bit_reversal(size=65536):
+    """Compare per-byte reverse_bit with the translation table"""
+    buf = bytes(range(256)) * (size // 256)
+    timestamp = time.monotonic()
+    [reverse_bit(x) for x in buf]
+    loop = time.monotonic() - timestamp
+    timestamp = time.monotonic()
+    reverse_bytes(buf)
+    table = time.monotonic() - timestamp
+    print('Bit reversal of %d bytes: loop %.2f MB/s, table %.2f MB/s' % (
+        size, size / loop / 1e6, size / table / 1e6))
+
+
+def bench_spi(calls=20, latency=0.005):
+    """Time read_passive_target and firmware reads over SPI in the legacy and
+    tuned modes"""
+    print('SPI read_passive_target + get_firmware_version, %d calls, %.1f ms chip latency' % (
+        calls, 1000 * latency))
+    modes = (
+        ('legacy', {'wakeup_delay': 0.01}),
+        ('tuned', {'backoff': Backoff(), 'wakeup_delay': 0.01,
+                   'speed_hz': 5000000, 'cs_settle': 0}),
+    )
+    for label, kwargs in modes:
+        spi = EmulatedSpiDev(PN532Emulator(latency=latency))
+        pn532 = PN532_SPI(spi=spi, **kwargs)
+        pn532.stats.reset()
+        spi.bytes_clocked = 0
+        timestamp = time.monotonic()
+        for _ in range(calls):
+            pn532.read_passive_target(timeout=1)
+            pn532.get_firmware_version()
+        elapsed = time.monotonic() - timestamp
+        print('  %-6s %.2f ms/call pair, %.1f kB/s on the bus' % (
+            label, 1000 * elapsed / calls, spi.bytes_clocked / elapsed / 1e3))
+        print('  ' + pn532.stats.report().replace('\n', '\n  '))
+
+
+def bench_uart(calls=20, latency=0.005):
+    """Time read_passive_target over a pty in the legacy and threaded modes"""
+    print('UART read_passive_target, %d calls, %.1f ms chip latency' % (calls, 1000 * latency))
+    for label, threaded in (('legacy', False), ('thread', True)):
+        fake = PtyPN532(PN532Emulator(latency=latency))
+        pn532 = PN532_UART(dev=fake.port, baudrate=BAUD_RATE, threaded=threaded)
+        pn532.stats.reset()
+        timestamp = time.monotonic()
+        for _ in range(calls):
+            pn532.read_passive_target(timeout=1)
+        elapsed = time.monotonic() - timestamp
+        pn532.close()
+        fake.close()
+        print('  %-6s %.2f ms/read' % (label, 1000 * elapsed / calls))
+        print('  ' + pn532.stats.report().replace('\n', '\n  '))
+
+
+def _transports(chip):
+    """The three drivers in their fastest modes, on fake buses sharing chip"""
+    yield 'i2c', PN532_I2C(i2c=EmulatedI2CDevice(chip, bus_hz=400000),
+                           backoff=Backoff(), wakeup_delay=0)
+    yield 'spi', PN532_SPI(spi=EmulatedSpiDev(chip), backoff=Backoff(), wakeup_delay=0,
+                           speed_hz=5000000, cs_settle=0)
+    uart = PN532_UART(uart=EmulatedSerial(chip), threaded=True)
+    yield 'uart', uart
+    uart.close()
+
+
+def bench_tag_read(latency=0.002):
+    """Throughput of whole-tag reads on each transport: an NTAG215 page by
+    page, in 4 page strides and with FAST_READ, then a MIFARE Classic 1K"""
+    print('Whole tag reads, %.1f ms chip latency' % (1000 * latency))
+    ntag = PN532Emulator(latency=latency)
+    for label, pn532 in _transports(ntag):
+        expected = bytes(ntag.memory[:4 * 135])
+        for method, read in (
+                ('page', lambda: b''.join(pn532.ntag2xx_read_block(p) for p in range(135))),
+                ('stride', lambda: pn532.ntag2xx_read_pages(0, 134)),
+                ('fast', lambda: pn532.ntag2xx_fast_read(0, 134))):
+            timestamp = time.monotonic()
+            data = read()
+            elapsed = time.monotonic() - timestamp
+            assert data == expected, (label, method)
+            print('  %-4s NTAG215 %-6s %7.1f ms, %5.2f kB/s' % (
+                label, method, 1000 * elapsed, len(data) / elapsed / 1e3))
+    classic = PN532Emulator(latency=latency, tag_type=TAG_MIFARE_CLASSIC)
+    for label, pn532 in _transports(classic):
+        timestamp = time.monotonic()
+        data = pn532.mifare_classic_read_sectors(classic.uid, range(16))
+        elapsed = time.monotonic() - timestamp
+        assert len(data) == 16 * 48, label
+        print('  %-4s Classic 1K data   %7.1f ms, %5.2f kB/s' % (
+            label, 1000 * elapsed, len(data) / elapsed / 1e3))
+
+
+class _StretchingDevice:
+    """Wraps an I2C device, stretching every `every`th read by `stretch` s"""
+    def __init__(self, device, stretch=0.02, every=10):
+        self.device = device
+        self.stretch = stretch
+        self.every = every
+        self.reads = 0
+
+    def write(self, buf):
+        return self.device.write(buf)
+
+    def read(self, count):
+        self.reads += 1
+        if self.reads % self.every == 0:
+            time.sleep(self.stretch)
+        return self.device.read(count)
+
+
+def bench_bus(duration=3.0, period=0.1):
+    """Thermal frame timing on a shared bus while the PN532 polls for
+    cards with occasional 20 ms clock stretches"""
+    print('Shared I2C bus, AMG8833 every %.0f ms with PN532 polling, %.0f s' % (
+        1000 * period, duration))
+    fake = FakeI2CBus({
+        AMG8833_ADDRESS: FakeAMG8833(),
+        I2C_ADDRESS: _StretchingDevice(EmulatedI2CDevice(PN532Emulator(latency=0.002), bus_hz=0)),
+    }, bus_hz=400000)
+    scheduler = I2CBusScheduler(fake)
+    camera = AMG8833(scheduler.client('amg8833', AMG8833_ADDRESS, PRIORITY_HIGH, period=period))
+    pn532 = PN532_I2C(i2c=scheduler.client('pn532', I2C_ADDRESS, PRIORITY_NORMAL),
+                      backoff=Backoff(), wakeup_delay=0)
+    for client in scheduler.clients:
+        client.stats.__init__()
+    scheduler.started = time.monotonic()
+    stop = time.monotonic() + duration
+    lateness = []
+
+    def thermal():
+        next_time = time.monotonic()
+        while next_time < stop:
+            time.sleep(max(0.0, next_time - time.monotonic()))
+            camera.pixels
+            lateness.append(time.monotonic() - next_time)
+            next_time += period
+
+    import threading
+    thread = threading.Thread(target=thermal)
+    thread.start()
+    reads = 0
+    while time.monotonic() < stop:
+        pn532.read_passive_target(timeout=1)
+        reads += 1
+    thread.join()
+    print('  %d frames, frame done %.2f ms mean, %.2f ms max after its slot; %d card reads' % (
+        len(lateness), 1000 * sum(lateness) / len(lateness), 1000 * max(lateness), reads))
+    print('  ' + scheduler.report().replace('\n', '\n  '))
+    scheduler.close()
+
+
+# Frames captured from the NFC Hat: (command, params, host frame, response frame)
+RECORDED_FRAMES = (
+    (0x02, b'',
+     bytes.fromhex('0000ff02fed4022a00'),
+     bytes.fromhex('0000ff06fad50332010607e800')),
+    (0x14, b'\x01\x14\x01',
+     bytes.fromhex('0000ff05fbd4140114010200'),
+     bytes.fromhex('0000ff02fed5151600')),
+    (0x4A, b'\x01\x00',
+     bytes.fromhex('0000ff04fcd44a0100e100'),
+     bytes.fromhex('0000ff0bf5d54b010100040804a23b1cd500')),
+)
+RECORDED_ACK = bytes.fromhex('0000ff00ff00')
+
+
+def check_codec():
+    """Round-trip the codec against the recorded frames, raising on mismatch"""
+    codec = FrameCodec()
+    for command, params, host, response in RECORDED_FRAMES:
+        assert bytes(codec.encode(command, params)) == host, hex(command)
+        # a response is read with leading padding and trailing junk
+        padded = b'\x00\x00' + response + b'\x00' * 4
+        kind, offset, length, _ = codec.parse(padded)
+        assert kind == FRAME_DATA and padded[offset] == 0xD5
+        assert padded[offset+1] == command + 1
+        # every truncation of the frame is reported as incomplete
+        for cut in range(len(response) - 1):
+            assert codec.parse(response[:cut]) is None, (hex(command), cut)
+    assert codec.parse(RECORDED_ACK)[0] == FRAME_ACK
+    # extended frame round trip
+    params = bytes(range(256)) + bytes(7)
+    frame = bytes(codec.encode(0x40, params))
+    kind, offset, length, end = codec.parse(frame)
+    assert kind == FRAME_DATA and frame[offset+2:offset+length] == params and end == len(frame)
+    print('Frame codec matches %d recorded frames' % len(RECORDED_FRAMES))
+
+
+def _legacy_encode(command, params):
+    # frame building as done before the codec, for comparison
+    data = bytearray(2+len(params))
+    data[0] = 0xD4
+    data[1] = command & 0xFF
+    for i, val in enumerate(params):
+        data[2+i] = val
+    length = len(data)
+    frame = bytearray(length+7)
+    frame[0] = 0x00
+    frame[1] = 0x00
+    frame[2] = 0xFF
+    checksum = sum(frame[0:3])
+    frame[3] = length & 0xFF
+    frame[4] = (~length + 1) & 0xFF
+    frame[5:-2] = data
+    checksum += sum(data)
+    frame[-2] = ~checksum & 0xFF
+    frame[-1] = 0x00
+    return bytes(frame)
+
+
+def bench_codec(rounds=20000):
+    """Compare the codec with the previous per-call frame building"""
+    check_codec()
+    codec = FrameCodec()
+    params = bytes(16)
+    response = RECORDED_FRAMES[2][3] + bytes(12)
+    timestamp = time.monotonic()
+    for _ in range(rounds):
+        _legacy_encode(0x40, params)
+    legacy = time.monotonic() - timestamp
+    timestamp = time.monotonic()
+    for _ in range(rounds):
+        codec.encode(0x40, params)
+    encode = time.monotonic() - timestamp
+    timestamp = time.monotonic()
+    for _ in range(rounds):
+        codec.parse(response)
+    parse = time.monotonic() - timestamp
+    print('Frame encode: legacy %.2f us, codec %.2f us; parse %.2f us' % (
+        1e6 * legacy / rounds, 1e6 * encode / rounds, 1e6 * parse / rounds))
+
+
+def main():
+    bench_codec()
+    bench_i2c()
+    bench_bit_reversal()
+    bench_spi()
+    bench_uart()
+    bench_tag_read()
+    bench_bus()
+
+
+if __name__ == '__main__':
+    main()
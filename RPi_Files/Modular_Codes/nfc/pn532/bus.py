@@ -0,0 +1,363 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+Shared I2C bus scheduler.  One worker thread owns the bus and runs the
+transactions submitted by each client in priority order, so a slow PN532
+transaction never interleaves with, and cannot indefinitely delay, the
+thermal camera's frame reads.  A client declaring a `period` has bus time
+reserved for it: lower priority transactions that would run into its next
+expected request are held back until it has been served.
+"""
+
+import fcntl
+import heapq
+import itertools
+import os
+import threading
+import time
+
+
+# pylint: disable=bad-whitespace
+PRIORITY_HIGH                  = 0
+PRIORITY_NORMAL                = 1
+PRIORITY_LOW                   = 2
+
+# ctypes defines for i2c, see <linux/i2c-dev.h>
+I2C_SLAVE                      = 1795
+
+AMG8833_ADDRESS                = 0x69
+_AMG_POWER_CONTROL             = 0x00
+_AMG_RESET                     = 0x01
+_AMG_FRAME_RATE                = 0x02
+_AMG_PIXELS                    = 0x80
+# pylint: enable=bad-whitespace
+
+
+class DeadlineMissed(RuntimeError):
+    """A transaction could not start before its deadline"""
+    pass
+
+
+class LinuxI2CBus:
+    """Raw /dev/i2c-N backend, selecting the slave address per transaction"""
+    def __init__(self, channel=1):
+        self._fd = os.open('/dev/i2c-%d' % channel, os.O_RDWR)
+        self._address = None
+
+    def _select(self, address):
+        if address != self._address:
+            fcntl.ioctl(self._fd, I2C_SLAVE, address)
+            self._address = address
+
+    def write(self, address, buf):
+        self._select(address)
+        return os.write(self._fd, bytes(buf))
+
+    def read(self, address, count):
+        self._select(address)
+        return os.read(self._fd, count)
+
+    def scan(self):
+        found = []
+        for address in range(0x08, 0x78):
+            try:
+                self.read(address, 1)
+                found.append(address)
+            except OSError:
+                pass
+        return found
+
+    def close(self):
+        os.close(self._fd)
+
+
+class FakeI2CBus:
+    """In-memory bus backend for testing.  `devices` maps addresses to
+    objects with read(count) and write(buf), such as EmulatedI2CDevice
+    (with bus_hz=0) or FakeAMG8833.  Each byte, plus the address byte,
+    takes 9 clocks at `bus_hz`.
+    """
+    def __init__(self, devices=None, bus_hz=400000):
+        self.devices = dict(devices or {})
+        self._byte_time = 9.0 / bus_hz if bus_hz else 0.0
+
+    def _device(self, address):
+        try:
+            return self.devices[address]
+        except KeyError:
+            raise OSError('No device at I2C address 0x%02X' % address)
+
+    def _transfer(self, count):
+        if self._byte_time:
+            time.sleep(self._byte_time * (count + 1))
+
+    def write(self, address, buf):
+        device = self._device(address)
+        self._transfer(len(buf))
+        return device.write(bytes(buf))
+
+    def read(self, address, count):
+        device = self._device(address)
+        self._transfer(count)
+        return device.read(count)
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def close(self):
+        pass
+
+
+class FakeAMG8833:
+    """Register model of the AMG8833 for FakeI2CBus.  A write sets the
+    register pointer (and writes any further bytes); reads return
+    registers from the pointer on.  set_frame() loads 8x8 temperatures.
+    `stretch` adds seconds to every transaction.
+    """
+    def __init__(self, stretch=0.0):
+        self.registers = bytearray(256)
+        self.registers[0x0E] = 0x50     # thermistor, 20 C at 0.0625 C/LSB
+        self.stretch = stretch
+        self._pointer = 0
+        self.set_frame([[20.0] * 8 for _ in range(8)])
+
+    def set_frame(self, temperatures):
+        for index, value in enumerate(t for row in temperatures for t in row):
+            raw = int(round(value / 0.25)) & 0xFFF
+            self.registers[0x80 + 2*index] = raw & 0xFF
+            self.registers[0x81 + 2*index] = raw >> 8
+
+    def write(self, buf):
+        if self.stretch:
+            time.sleep(self.stretch)
+        if buf:
+            self._pointer = buf[0]
+            for offset, value in enumerate(buf[1:]):
+                self.registers[(self._pointer + offset) & 0xFF] = value
+        return len(buf)
+
+    def read(self, count):
+        if self.stretch:
+            time.sleep(self.stretch)
+        start = self._pointer
+        return bytes(self.registers[(start + i) & 0xFF] for i in range(count))
+
+
+class ClientStats:
+    """Counters for one client: transactions, queueing latency, bus time"""
+    def __init__(self):
+        self.transactions = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.busy = 0.0
+        self.max_busy = 0.0
+        self.missed = 0
+
+
+class _Transaction:
+    def __init__(self, client, operation, deadline):
+        self.client = client
+        self.operation = operation
+        self.deadline = deadline
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class I2CBusScheduler:
+    """Owns an I2C bus backend and serialises every transaction on it.
+
+    Transactions run in order of client priority, then deadline, then
+    submission.  The bus defaults to LinuxI2CBus(1); pass a FakeI2CBus to
+    run without hardware.
+    """
+    def __init__(self, bus=None):
+        self.bus = bus if bus is not None else LinuxI2CBus()
+        self.clients = []
+        self.started = time.monotonic()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Condition()
+        self._closing = False
+        self._worker = threading.Thread(target=self._run, name='i2c-scheduler', daemon=True)
+        self._worker.start()
+
+    def client(self, name, address, priority=PRIORITY_NORMAL, period=None):
+        """Return a client for the device at address.  A client with a
+        `period` in seconds is expected to make a request that often and
+        lower priority transactions are kept out of its way.
+        """
+        client = I2CClient(self, name, address, priority, period)
+        self.clients.append(client)
+        return client
+
+    def submit(self, client, operation, deadline=None):
+        """Run operation(bus) on the worker thread and return its result.
+        `deadline` is a time.monotonic() value by which it must start."""
+        transaction = _Transaction(client, operation, deadline)
+        with self._lock:
+            if self._closing:
+                raise RuntimeError('I2C bus scheduler is closed')
+            key = (client.priority, deadline if deadline is not None else float('inf'),
+                   next(self._sequence))
+            heapq.heappush(self._queue, (key, transaction))
+            self._lock.notify()
+        transaction.done.wait()
+        if transaction.error is not None:
+            raise transaction.error
+        return transaction.result
+
+    def _hold_off(self, transaction, now):
+        """Seconds to hold transaction back for a periodic higher priority
+        client due before it would finish, 0.0 to run it now"""
+        hold = 0.0
+        for client in self.clients:
+            if client.period is None or client.priority >= transaction.client.priority:
+                continue
+            if client.last_request is None:
+                continue
+            due = client.last_request + client.period
+            # the worst bus time seen so far for this client's transactions
+            if now < due < now + transaction.client.stats.max_busy:
+                hold = max(hold, due - now)
+        return hold
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while True:
+                    while not self._queue and not self._closing:
+                        self._lock.wait()
+                    if not self._queue:
+                        return
+                    _, transaction = self._queue[0]
+                    hold = self._hold_off(transaction, time.monotonic())
+                    if hold <= 0:
+                        heapq.heappop(self._queue)
+                        break
+                    # woken early by a new submission, which may outrank this one
+                    self._lock.wait(hold)
+            self._execute(transaction)
+
+    def _execute(self, transaction):
+        stats = transaction.client.stats
+        start = time.monotonic()
+        if transaction.deadline is not None and start > transaction.deadline:
+            stats.missed += 1
+            transaction.error = DeadlineMissed('%s transaction started %.1f ms late' % (
+                transaction.client.name, 1000 * (start - transaction.deadline)))
+        else:
+            try:
+                transaction.result = transaction.operation(self.bus)
+            except Exception as err:    # pylint: disable=broad-except
+                transaction.error = err
+        busy = time.monotonic() - start
+        latency = start - transaction.submitted
+        stats.transactions += 1
+        stats.latency += latency
+        stats.max_latency = max(stats.max_latency, latency)
+        stats.busy += busy
+        stats.max_busy = max(stats.max_busy, busy)
+        transaction.done.set()
+
+    def report(self):
+        """Return one line per client with mean/max queueing latency in ms,
+        bus utilisation and missed deadlines"""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        lines = []
+        for client in self.clients:
+            stats = client.stats
+            if not stats.transactions:
+                continue
+            lines.append('%s: %d transactions, latency mean %.2f ms, max %.2f ms, '
+                         'bus %.1f%%, %d missed' % (
+                             client.name, stats.transactions,
+                             1000 * stats.latency / stats.transactions,
+                             1000 * stats.max_latency, 100 * stats.busy / elapsed,
+                             stats.missed))
+        return '\n'.join(lines)
+
+    def close(self):
+        with self._lock:
+            self._closing = True
+            self._lock.notify()
+        self._worker.join()
+        self.bus.close()
+
+
+class I2CClient:
+    """One device on a scheduled bus.  read/write match I2CDevice, so a
+    client can be passed as PN532_I2C(i2c=...)."""
+    def __init__(self, scheduler, name, address, priority, period):
+        self.scheduler = scheduler
+        self.name = name
+        self.address = address
+        self.priority = priority
+        self.period = period
+        self.last_request = None
+        self.stats = ClientStats()
+
+    def transaction(self, operation, deadline=None):
+        """Run operation(bus) as one uninterrupted bus transaction"""
+        self.last_request = time.monotonic()
+        return self.scheduler.submit(self, operation, deadline)
+
+    def write(self, buf, deadline=None):
+        return self.transaction(lambda bus: bus.write(self.address, buf), deadline)
+
+    def read(self, count, deadline=None):
+        return self.transaction(lambda bus: bus.read(self.address, count), deadline)
+
+    def write_then_read(self, buf, count, deadline=None):
+        """Register read: write buf then read count bytes with no other
+        transaction in between"""
+        def operation(bus):
+            bus.write(self.address, buf)
+            return bus.read(self.address, count)
+        return self.transaction(operation, deadline)
+
+
+class AMG8833:
+    """AMG8833 thermal camera on a scheduled bus.  pixels reads the whole
+    8x8 frame in one 128 byte transaction, where adafruit_amg88xx makes 64
+    separate register reads."""
+    def __init__(self, client):
+        self._client = client
+        client.write(bytes([_AMG_POWER_CONTROL, 0x00]))    # normal mode
+        client.write(bytes([_AMG_RESET, 0x3F]))            # initial reset
+        client.write(bytes([_AMG_FRAME_RATE, 0x00]))       # 10 frames per second
+        time.sleep(0.1)
+
+    @property
+    def pixels(self):
+        """8 rows of 8 temperatures in degrees C"""
+        raw = self._client.write_then_read(bytes([_AMG_PIXELS]), 128)
+        temperatures = []
+        for index in range(0, 128, 2):
+            value = raw[index] | (raw[index+1] << 8)
+            if value & 0x800:
+                value -= 0x1000
+            temperatures.append(value * 0.25)
+        return [temperatures[row:row+8] for row in range(0, 64, 8)]
@@ -0,0 +1,429 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Software PN532 for exercising the drivers without the NFC Hat.
+The emulator speaks the host-side frame protocol (ACK, status byte,
+checksums) and answers GetFirmwareVersion, SAMConfiguration,
+InListPassiveTarget, InAutoPoll, InDataExchange and InCommunicateThru
+for one NTAG2xx or MIFARE Classic tag, with configurable latency.
+EmulatedI2CDevice, EmulatedSpiDev and EmulatedSerial (or PtyPN532 for a
+real serial port) stand in for the buses of PN532_I2C, PN532_SPI and
+PN532_UART.
+"""
+
+import os
+import select
+import threading
+import time
+import tty
+from .frame import FrameCodec, FrameError, FRAME_DATA, FRAME_ACK
+
+
+# pylint: disable=bad-whitespace
+_ACK                = b'\x00\x00\xFF\x00\xFF\x00'
+
+TAG_NTAG            = 'ntag'
+TAG_MIFARE_CLASSIC  = 'mifare_classic'
+
+_ERROR_TIMEOUT      = 0x01
+_ERROR_MIFARE_AUTH  = 0x14
+
+# NTAG215: 135 pages of 4 bytes
+_NTAG_PAGES         = 135
+# MIFARE Classic 1K: 64 blocks of 16 bytes
+_CLASSIC_BLOCKS     = 64
+# pylint: enable=bad-whitespace
+
+
+def build_frame(data):
+    """Wrap PN532-to-host data bytes in a normal information frame"""
+    length = len(data)
+    return (bytes([0x00, 0x00, 0xFF, length, (~length + 1) & 0xFF]) + bytes(data) +
+            bytes([(~sum(data) + 1) & 0xFF, 0x00]))
+
+
+def parse_frame(frame):
+    """Return the data bytes of a host frame, or None if it is malformed"""
+    start = bytes(frame).find(b'\x00\xFF')
+    if start < 0 or start + 4 > len(frame):
+        return None
+    length = frame[start+2]
+    if (length + frame[start+3]) & 0xFF:
+        return None
+    data = bytes(frame[start+4:start+4+length])
+    if len(data) != length or start+4+length >= len(frame):
+        return None
+    if (sum(data) + frame[start+4+length]) & 0xFF:
+        return None
+    return data
+
+
+class PN532Emulator:
+    """Protocol-level model of a PN532.
+
+    `ack_latency` and `latency` are the seconds before the ACK and the
+    response become ready.  `tag_present` can be toggled at any time; an
+    InListPassiveTarget issued with no tag in range stays pending until
+    one appears, as on the real chip.
+
+    The tag is an NTAG215 or, with tag_type=TAG_MIFARE_CLASSIC, a MIFARE
+    Classic 1K whose sectors all open with `key` (either key type).
+    `memory` is its contents, by default counting bytes.  A failed
+    authentication halts the tag until the next InListPassiveTarget.
+    """
+    def __init__(self, latency=0.005, ack_latency=0.0005,
+                 firmware=b'\x32\x01\x06\x07', uid=b'\x04\xA2\x3B\x1C',
+                 tag_present=True, tag_type=TAG_NTAG, memory=None,
+                 key=b'\xFF\xFF\xFF\xFF\xFF\xFF'):
+        self.latency = latency
+        self.ack_latency = ack_latency
+        self.firmware = bytes(firmware)
+        self.uid = bytes(uid)
+        self.tag_present = tag_present
+        self.tag_type = tag_type
+        size = 4 * _NTAG_PAGES if tag_type == TAG_NTAG else 16 * _CLASSIC_BLOCKS
+        self.memory = bytearray(memory if memory is not None else
+                                (bytes(range(256)) * (size // 256 + 1))[:size])
+        self.key = bytes(key)
+        self._authenticated = None  # sector opened on a MIFARE Classic tag
+        self._halted = False
+        self.commands = []
+        self._outgoing = None    # frame currently readable by the host
+        self._ready_at = 0.0
+        self._next = None        # response queued behind the ACK
+        self._waiting_tag = None # builds the response once a tag is in range
+        self.handlers = {
+            0x02: self._get_firmware_version,
+            0x14: self._sam_configuration,
+            0x4A: self._in_list_passive_target,
+            0x60: self._in_auto_poll,
+            0x40: self._in_data_exchange,
+            0x42: self._in_communicate_thru,
+        }
+
+    def receive(self, frame):
+        """Handle a frame written by the host"""
+        if bytes(frame) == _ACK:
+            # the host aborts the command in progress
+            self._outgoing = self._next = self._waiting_tag = None
+            return
+        data = parse_frame(frame)
+        if data is None or len(data) < 2 or data[0] != 0xD4:
+            return
+        command = data[1]
+        self.commands.append(command)
+        self._waiting_tag = None
+        self._queue(_ACK, self.ack_latency)
+        handler = self.handlers.get(command)
+        self._next = handler(data[2:]) if handler else None
+
+    def _queue(self, frame, delay):
+        self._outgoing = frame
+        self._ready_at = time.monotonic() + delay
+
+    def ready(self):
+        """True if the host can read a frame now"""
+        if self._outgoing is None and self._waiting_tag is not None and self.tag_present:
+            self._queue(build_frame(self._waiting_tag()), self.latency)
+            self._waiting_tag = None
+        return self._outgoing is not None and time.monotonic() >= self._ready_at
+
+    def take(self):
+        """Return the ready frame and release the ready state, queuing any
+        response that was waiting behind an ACK.
+        """
+        frame = self._outgoing
+        self._outgoing = None
+        if frame == _ACK and self._next is not None:
+            response, self._next = self._next, None
+            if callable(response):
+                # deferred until a tag is in range
+                self._waiting_tag = response
+            else:
+                self._queue(build_frame(response), self.latency)
+        return frame
+
+    def _get_firmware_version(self, params):
+        return b'\xD5\x03' + self.firmware
+
+    def _sam_configuration(self, params):
+        return b'\xD5\x15'
+
+    def _target_data(self):
+        # Tg, SENS_RES, SEL_RES, NFCID length, NFCID
+        return b'\x01\x00\x44\x00' + bytes([len(self.uid)]) + self.uid
+
+    def _select(self):
+        self._halted = False
+        self._authenticated = None
+        return self._target_data()
+
+    def _in_list_passive_target(self, params):
+        response = lambda: b'\xD5\x4B\x01' + self._select()
+        return response() if self.tag_present else response
+
+    def _in_auto_poll(self, params):
+        # report the first requested type as the one that answered
+        target_type = params[2] if len(params) > 2 else 0x10
+        data = self._target_data()
+        response = lambda: b'\xD5\x61\x01' + bytes([target_type, len(data)]) + self._select()
+        return response() if self.tag_present else response
+
+    @staticmethod
+    def _sector(block):
+        return block // 4 if block < 128 else 32 + (block - 128) // 16
+
+    def _tag_command(self, data):
+        """Run a tag command, returning (status, reply bytes)"""
+        if not self.tag_present or self._halted or not data:
+            return _ERROR_TIMEOUT, b''
+        command = data[0]
+        classic = self.tag_type == TAG_MIFARE_CLASSIC
+        if command in (0x60, 0x61) and classic and len(data) >= 8:
+            if bytes(data[2:8]) != self.key:
+                self._halted = True
+                return _ERROR_MIFARE_AUTH, b''
+            self._authenticated = self._sector(data[1])
+            return 0x00, b''
+        if command == 0x30 and len(data) >= 2:    # READ
+            if not classic:
+                start = 4 * data[1]
+                # reads past the last page wrap round to page 0
+                return 0x00, (self.memory[start:] + self.memory)[:16]
+            if self._sector(data[1]) != self._authenticated:
+                self._halted = True
+                return _ERROR_MIFARE_AUTH, b''
+            return 0x00, bytes(self.memory[16*data[1]:16*data[1]+16])
+        if command == 0x3A and len(data) >= 3 and not classic:    # FAST_READ
+            if data[1] > data[2] or 4 * data[2] >= len(self.memory):
+                return 0x00, b'\x00'    # NAK
+            return 0x00, bytes(self.memory[4*data[1]:4*data[2]+4])
+        if command == 0xA0 and len(data) >= 18 and classic:    # WRITE
+            if self._sector(data[1]) != self._authenticated:
+                self._halted = True
+                return _ERROR_MIFARE_AUTH, b''
+            self.memory[16*data[1]:16*data[1]+16] = data[2:18]
+            return 0x00, b''
+        if command == 0xA2 and len(data) >= 6 and not classic:    # WRITE (page)
+            self.memory[4*data[1]:4*data[1]+4] = data[2:6]
+            return 0x00, b''
+        return _ERROR_TIMEOUT, b''
+
+    def _in_data_exchange(self, params):
+        # Tg, then the tag command; authentication carries key and UID
+        status, reply = self._tag_command(params[1:])
+        return b'\xD5\x41' + bytes([status]) + reply
+
+    def _in_communicate_thru(self, params):
+        status, reply = self._tag_command(params)
+        return b'\xD5\x43' + bytes([status]) + reply
+
+
+class EmulatedI2CDevice:
+    """Stands in for I2CDevice; pass as PN532_I2C(i2c=...).
+
+    Every read starts with the status byte.  A read of more than the
+    status byte transfers (and consumes) the ready frame, zero padded.
+    `bus_hz` adds the transfer time of each byte (9 clocks) at that clock.
+    """
+    def __init__(self, chip=None, bus_hz=100000):
+        self.chip = chip if chip is not None else PN532Emulator()
+        self._byte_time = 9.0 / bus_hz if bus_hz else 0.0
+        self.reads = 0
+        self.writes = 0
+
+    def _transfer(self, count):
+        if self._byte_time:
+            time.sleep(self._byte_time * (count + 1)) # plus the address byte
+
+    def write(self, buf):
+        self.writes += 1
+        self._transfer(len(buf))
+        self.chip.receive(bytes(buf))
+        return len(buf)
+
+    def read(self, count):
+        self.reads += 1
+        self._transfer(count)
+        if not self.chip.ready():
+            return bytes(count)
+        if count == 1:
+            return b'\x01'
+        frame = self.chip.take()
+        return (b'\x01' + frame + bytes(count))[:count]
+
+
+# SPI carries every byte LSB first
+_REVERSE_TABLE = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+
+class EmulatedSpiDev:
+    """Stands in for spidev.SpiDev; pass as PN532_SPI(spi=...).
+
+    The first byte of each transfer selects status read, data write or
+    data read as on the real chip.  Each transfer takes the time to clock
+    its bytes at max_speed_hz.
+    """
+    def __init__(self, chip=None):
+        self.chip = chip if chip is not None else PN532Emulator()
+        self.max_speed_hz = 1000000
+        self.mode = 0
+        self.transfers = 0
+        self.bytes_clocked = 0
+
+    def xfer2(self, buf):
+        buf = bytes(buf).translate(_REVERSE_TABLE)
+        self.transfers += 1
+        self.bytes_clocked += len(buf)
+        if self.max_speed_hz:
+            time.sleep(8.0 * len(buf) / self.max_speed_hz)
+        out = bytes(len(buf))
+        if buf[:1] == b'\x02':      # status read
+            out = b'\x00' + (b'\x01' if self.chip.ready() else b'\x00') + bytes(len(buf) - 2)
+        elif buf[:1] == b'\x01':    # data write
+            self.chip.receive(buf[1:])
+        elif buf[:1] == b'\x03' and self.chip.ready():    # data read
+            out = (b'\x00' + self.chip.take() + bytes(len(buf)))[:len(buf)]
+        return list(out.translate(_REVERSE_TABLE))
+
+    xfer = xfer2
+
+    def writebytes(self, buf):
+        self.xfer2(buf)
+
+    def readbytes(self, count):
+        return self.xfer2(bytes(count))
+
+
+def feed_host_bytes(chip, buf):
+    """Pass each whole host frame at the start of the serial byte stream
+    buf to chip, removing it from buf.  Anything before a start code, such
+    as the 0x55 wakeup preamble, is skipped.
+    """
+    while True:
+        try:
+            frame = FrameCodec.parse(buf)
+        except FrameError:
+            del buf[:buf.find(b'\x00\xFF') + 2]
+            continue
+        if frame is None:
+            return
+        kind, offset, length, end = frame
+        if kind == FRAME_DATA:
+            end = offset + length + 2
+        if end > len(buf):
+            return
+        if kind == FRAME_ACK:
+            chip.receive(_ACK)
+        elif kind == FRAME_DATA:
+            chip.receive(build_frame(buf[offset:offset+length]))
+        del buf[:end]
+
+
+class EmulatedSerial:
+    """Stands in for serial.Serial; pass as PN532_UART(uart=...).
+
+    Frames become readable once the chip has them ready.  Each byte takes
+    10 bit times at `baudrate` to send or receive.  read() honours
+    `timeout` like pyserial, None blocking until size bytes arrive.
+    """
+    def __init__(self, chip=None, baudrate=115200):
+        self.chip = chip if chip is not None else PN532Emulator()
+        self._byte_time = 10.0 / baudrate if baudrate else 0.0
+        self.timeout = None
+        self.is_open = True
+        self._tx = bytearray()
+        self._rx = bytearray()
+        # PN532_UART(threaded=True) reads from its own thread
+        self._lock = threading.Lock()
+
+    def _pump(self):
+        with self._lock:
+            if self.chip.ready():
+                self._rx += self.chip.take()
+
+    @property
+    def in_waiting(self):
+        self._pump()
+        return len(self._rx)
+
+    def write(self, buf):
+        if self._byte_time:
+            time.sleep(self._byte_time * len(buf))
+        with self._lock:
+            self._tx += buf
+            feed_host_bytes(self.chip, self._tx)
+        return len(buf)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._pump()
+        while len(self._rx) < size and (deadline is None or time.monotonic() < deadline):
+            time.sleep(0.0001)
+            self._pump()
+        with self._lock:
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+        if self._byte_time:
+            time.sleep(self._byte_time * len(data))
+        return data
+
+    def close(self):
+        self.is_open = False
+
+
+class PtyPN532:
+    """PN532 on the far side of a pseudo terminal, for PN532_UART.
+
+    Open `port` as the serial device.  A thread feeds the host's frames
+    to the emulator and writes each frame to the port once it is ready,
+    so the driver sees the byte stream of a real UART link.
+    """
+    def __init__(self, chip=None, poll=0.0002):
+        self.chip = chip if chip is not None else PN532Emulator()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._poll = poll
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name='pty-pn532', daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        buf = bytearray()
+        while not self._closing.is_set():
+            readable, _, _ = select.select([self._master], [], [], self._poll)
+            if readable:
+                try:
+                    buf += os.read(self._master, 1024)
+                except OSError:
+                    break
+                feed_host_bytes(self.chip, buf)
+            if self.chip.ready():
+                os.write(self._master, self.chip.take())
+
+    def close(self):
+        self._closing.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
@@ -0,0 +1,122 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+PN532 frame codec working on reusable buffers.  Host frames are encoded
+into one preallocated bytearray and response frames are located and
+checked in place, so a command/response round trip makes no intermediate
+copies.  Normal and extended information frames are supported, as are
+ACK/NACK frames and buffers holding only part of a frame.
+"""
+
+# pylint: disable=bad-whitespace
+_HOSTTOPN532                   = 0xD4
+
+FRAME_DATA                     = 0
+FRAME_ACK                      = 1
+FRAME_NACK                     = 2
+
+# Longest information frame data: TFI + command + 263 bytes of parameters
+MAX_DATA                       = 265
+# pylint: enable=bad-whitespace
+
+
+class FrameError(RuntimeError):
+    """A frame failed its length or data checksum"""
+    pass
+
+
+class FrameCodec:
+    """Encode host frames into, and parse PN532 frames from, reusable buffers"""
+    def __init__(self):
+        # preamble, start code, extended length header, data, DCS, postamble
+        self._out = bytearray(8 + MAX_DATA + 2)
+        self._out_view = memoryview(self._out)
+
+    def encode(self, command, params=b''):
+        """Encode a host-to-PN532 frame for command and params.  Returns a
+        memoryview into the codec's buffer, valid until the next encode.
+        """
+        out = self._out
+        length = 2 + len(params)
+        if length > MAX_DATA:
+            raise ValueError('Frame data must be at most %d bytes' % MAX_DATA)
+        out[0] = 0x00
+        out[1] = 0x00
+        out[2] = 0xFF
+        if length < 255:
+            out[3] = length
+            out[4] = (~length + 1) & 0xFF
+            start = 5
+        else:
+            # extended frame: 0xFF 0xFF marker, then 16 bit length and its checksum
+            out[3] = 0xFF
+            out[4] = 0xFF
+            out[5] = length >> 8
+            out[6] = length & 0xFF
+            out[7] = (~(out[5] + out[6]) + 1) & 0xFF
+            start = 8
+        out[start] = _HOSTTOPN532
+        out[start+1] = command & 0xFF
+        end = start + length
+        out[start+2:end] = params
+        out[end] = (~sum(self._out_view[start:end]) + 1) & 0xFF
+        out[end+1] = 0x00
+        return self._out_view[:end+2]
+
+    @staticmethod
+    def parse(buf, start=0):
+        """Locate the first frame in buf at or after start.
+
+        Returns (kind, data offset, data length, end offset) where kind is
+        FRAME_DATA, FRAME_ACK or FRAME_NACK, or None if buf does not yet hold
+        a whole frame.  Raises FrameError on a checksum mismatch.
+        """
+        view = memoryview(buf)
+        index = buf.find(b'\x00\xFF', start)
+        if index < 0 or index + 4 > len(buf):
+            return None
+        index += 2
+        length = buf[index]
+        checksum = buf[index+1]
+        if length == 0x00 and checksum == 0xFF:
+            return FRAME_ACK, index + 2, 0, index + 3
+        if length == 0xFF and checksum == 0x00:
+            return FRAME_NACK, index + 2, 0, index + 3
+        if length == 0xFF and checksum == 0xFF:
+            if index + 5 > len(buf):
+                return None
+            length = (buf[index+2] << 8) | buf[index+3]
+            if (buf[index+2] + buf[index+3] + buf[index+4]) & 0xFF:
+                raise FrameError('Response length checksum did not match length!')
+            data = index + 5
+        else:
+            if (length + checksum) & 0xFF:
+                raise FrameError('Response length checksum did not match length!')
+            data = index + 2
+        if data + length + 1 > len(buf):
+            return None
+        # data bytes plus DCS sum to zero, checked through the view without copying
+        if sum(view[data:data+length+1]) & 0xFF:
+            raise FrameError('Response checksum did not match expected value')
+        return FRAME_DATA, data, length, min(data + length + 2, len(buf))
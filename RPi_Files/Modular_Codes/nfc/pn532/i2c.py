@@ -32,8 +32,9 @@ using I2C on the Raspberry Pi.
 import fcntl
 import os
 import time
-import RPi.GPIO as GPIO
+from .gpio import GPIO
 from .pn532 import PN532, BusyError
+from .irq import IRQPin
 
 # pylint: disable=bad-whitespace
 # PN532 address without R/W bit, i.e. (0x48 >> 1)
@@ -65,14 +66,23 @@ class I2CDevice:
 
 class PN532_I2C(PN532):
     """Driver for the PN532 connected over I2C."""
-    def __init__(self, irq=None, reset=None, req=None, debug=False):
+    def __init__(self, irq=None, reset=None, req=None, debug=False,
+                 backoff=None, wakeup_delay=0.5, i2c=None):
         """Create an instance of the PN532 class using I2C. Note that PN532
-        uses clock stretching. Optional IRQ pin (not used),
-        reset pin and debugging output.
+        uses clock stretching. Optional IRQ pin (waited on instead of
+        polling the status byte), reset pin and debugging output.
+
+        Passing a `Backoff` selects the latency-tuned mode: the status byte
+        is polled with adaptive backoff instead of fixed sleeps and reads
+        are not followed by a settling sleep.  `wakeup_delay` is the time
+        allowed for the PN532 to wake after a H_Request pulse.  `i2c` may
+        be any object with read/write methods in place of /dev/i2c-1.
         """
         self.debug = debug
         self._irq = irq
         self._req = req
+        self._backoff = backoff
+        self._wakeup_delay = wakeup_delay
         GPIO.setmode(GPIO.BCM)
         # With I2C, we recommend connecting RSTPD_N (reset) to a digital pin for manual
         # harware reset
@@ -81,7 +91,8 @@ class PN532_I2C(PN532):
         # wakeup! this means we don't need to do the I2C clock-stretch thing
         GPIO.setup(req, GPIO.OUT)
         self._gpio_init(irq=irq, req=req, reset=reset)
-        self._i2c = I2CDevice(I2C_CHANNEL, I2C_ADDRESS)
+        self._irq_pin = IRQPin(irq, GPIO) if irq else None
+        self._i2c = i2c if i2c is not None else I2CDevice(I2C_CHANNEL, I2C_ADDRESS)
         super().__init__(debug=debug, reset=reset)
 
     def _gpio_init(self, reset, irq=None, req=None):
@@ -114,10 +125,16 @@ class PN532_I2C(PN532):
             GPIO.output(self._req, False)
             time.sleep(0.1)
             GPIO.output(self._req, True)
-        time.sleep(0.5)
+        time.sleep(self._wakeup_delay)
 
     def _wait_ready(self, timeout=10):
         """Poll PN532 if status byte is ready, up to `timeout` seconds"""
+        if self._irq_pin:
+            return self._irq_pin.wait(timeout)
+        if self._backoff:
+            ready, polls = self._backoff.poll(self.is_ready, timeout)
+            self.stats.polls += polls
+            return ready
         time.sleep(0.01) # required after _wait_ready()
         status = bytearray(1)
         timestamp = time.monotonic()
@@ -127,12 +144,23 @@ class PN532_I2C(PN532):
             except OSError:
                 self._wakeup()
                 continue
+            self.stats.polls += 1
             if status == b'\x01':
                 return True  # No longer busy
             time.sleep(0.005)  # lets ask again soon!
         # Timed out!
         return False
 
+    def is_ready(self):
+        """Check once, without waiting, if the PN532 has a response ready"""
+        if self._irq_pin:
+            return self._irq_pin.is_ready()
+        try:
+            return self._i2c.read(1)[0] == 0x01
+        except OSError:
+            self._wakeup()
+            return False
+
     def _read_data(self, count):
         """Read a specified count of bytes from the PN532."""
         try:
@@ -147,7 +175,7 @@ class PN532_I2C(PN532):
 
         if self.debug:
             print("Reading: ", [hex(i) for i in frame[1:]])
-        else:
+        elif not self._backoff:
             time.sleep(0.1)
         return frame[1:]   # don't return the status byte
 
@@ -0,0 +1,143 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+This module lets the PN532 drivers wait on the chip's IRQ line instead of
+polling the status byte.  The PN532 pulls IRQ low when a response (or ACK)
+is ready to be read and releases it once the host has read it.
+"""
+
+import threading
+
+
+class IRQPin:
+    """Edge-triggered wait on the PN532 IRQ line (active low).
+
+    `gpio` is any module or object with the RPi.GPIO interface, so a
+    FakeGPIO can be passed in for testing off the Raspberry Pi.
+    """
+    def __init__(self, pin, gpio=None):
+        if gpio is None:
+            from .gpio import GPIO as gpio
+        self.pin = pin
+        self._gpio = gpio
+        self._edge = threading.Event()
+        self._listeners = []
+        gpio.setmode(gpio.BCM)
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.add_event_detect(pin, gpio.FALLING, callback=self._on_edge)
+
+    def _on_edge(self, channel):
+        self._edge.set()
+        for listener in self._listeners:
+            listener()
+
+    def add_listener(self, listener):
+        """Call listener() from the GPIO event thread on every falling edge"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def is_ready(self):
+        """Non-blocking check whether the PN532 has a response waiting"""
+        return self._gpio.input(self.pin) == self._gpio.LOW
+
+    def wait(self, timeout):
+        """Block until IRQ is low, up to `timeout` seconds.  Costs no CPU
+        while waiting as the edge is delivered by the GPIO event thread.
+        """
+        # Clear before sampling the level so an edge between the two is
+        # caught by either the level check or the event.
+        self._edge.clear()
+        if self.is_ready():
+            return True
+        self._edge.wait(timeout)
+        return self.is_ready()
+
+    def close(self):
+        self._gpio.remove_event_detect(self.pin)
+
+
+class FakeGPIO:
+    """Minimal stand-in for RPi.GPIO used to exercise IRQ handling in tests.
+
+    Pins default high; call set_input(pin, level) to drive an input and
+    fire any registered edge callbacks.
+    """
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 22
+    PUD_DOWN = 21
+    FALLING = 32
+    RISING = 31
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self._callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        if initial is not None:
+            self.levels[pin] = initial
+        elif direction == self.OUT:
+            self.levels.setdefault(pin, self.LOW)
+        else:
+            self.levels.setdefault(pin, self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH)
+
+    def output(self, pin, level):
+        self.levels[pin] = int(bool(level))
+
+    def input(self, pin):
+        return self.levels.get(pin, self.HIGH)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        self._callbacks.pop(pin, None)
+
+    def set_input(self, pin, level):
+        """Drive an input pin, firing edge callbacks like the real library"""
+        previous = self.input(pin)
+        level = int(bool(level))
+        self.levels[pin] = level
+        if pin not in self._callbacks or previous == level:
+            return
+        edge, callback = self._callbacks[pin]
+        falling = previous == self.HIGH and level == self.LOW
+        if callback and (edge == self.BOTH or
+                         (edge == self.FALLING) == falling):
+            callback(pin)
+
+    def cleanup(self, *args):
+        self.levels.clear()
+        self._callbacks.clear()
@@ -32,7 +32,10 @@ This module will let you communicate with a PN532 NFC Hat using I2C, SPI or UART
 The main difference is the interfaces implements.
 """
 
-import RPi.GPIO as GPIO
+import time
+from .gpio import GPIO
+from .timing import CallStats
+from .frame import FrameCodec, FRAME_DATA
 
 
 # pylint: disable=bad-whitespace
@@ -83,6 +86,12 @@ _RESPONSE_INLISTPASSIVETARGET  = 0x4B
 
 _WAKEUP                        = 0x55
 
+# InAutoPoll target types
+AUTOPOLL_TYPE_GENERIC_106           = 0x00
+AUTOPOLL_TYPE_MIFARE                = 0x10
+AUTOPOLL_TYPE_ISO14443_4A           = 0x20
+_AUTOPOLL_ENDLESS                   = 0xFF
+
 _MIFARE_ISO14443A              = 0x00
 
 # Mifare Commands
@@ -95,6 +104,13 @@ MIFARE_CMD_DECREMENT                = 0xC0
 MIFARE_CMD_INCREMENT                = 0xC1
 MIFARE_CMD_STORE                    = 0xC2
 MIFARE_ULTRALIGHT_CMD_WRITE         = 0xA2
+NTAG_CMD_FAST_READ                  = 0x3A
+
+# Default MIFARE Classic transport key
+MIFARE_DEFAULT_KEY                  = b'\xFF\xFF\xFF\xFF\xFF\xFF'
+
+# Pages per FAST_READ so the response fits in a normal information frame
+_NTAG_FAST_READ_PAGES               = 60
 
 # Prefixes for NDEF Records (to identify record type)
 NDEF_URIPREFIX_NONE                 = 0x00
@@ -186,10 +202,18 @@ class BusyError(Exception):
 class PN532:
     """PN532 driver base, must be extended for I2C/SPI/UART interfacing"""
 
+    # IRQPin waited on by transports that support it
+    _irq_pin = None
+
     def __init__(self, *, debug=False, reset=None):
         """Create an instance of the PN532 class
         """
         self.debug = debug
+        self.stats = CallStats()
+        self._codec = FrameCodec()
+        # (uid, sector) -> (key_number, key) that authenticated it
+        self._sector_keys = {}
+        self._sent = (time.monotonic(), 0)
         if reset:
             if debug:
                 print("Resetting")
@@ -230,33 +254,10 @@ class PN532:
         # Send special command to wake up
         raise NotImplementedError
 
-    def _write_frame(self, data):
-        """Write a frame to the PN532 with the specified data bytearray."""
-        assert data is not None and 1 < len(data) < 255, 'Data must be array of 1 to 255 bytes.'
-        # Build frame to send as:
-        # - Preamble (0x00)
-        # - Start code  (0x00, 0xFF)
-        # - Command length (1 byte)
-        # - Command length checksum
-        # - Command bytes
-        # - Checksum
-        # - Postamble (0x00)
-        length = len(data)
-        frame = bytearray(length+7)
-        frame[0] = _PREAMBLE
-        frame[1] = _STARTCODE1
-        frame[2] = _STARTCODE2
-        checksum = sum(frame[0:3])
-        frame[3] = length & 0xFF
-        frame[4] = (~length + 1) & 0xFF
-        frame[5:-2] = data
-        checksum += sum(data)
-        frame[-2] = ~checksum & 0xFF
-        frame[-1] = _POSTAMBLE
-        # Send frame.
-        if self.debug:
-            print('Write frame: ', [hex(i) for i in frame])
-        self._write_data(bytes(frame))
+    def is_ready(self):
+        # Check once, without waiting, if a response is ready
+        # Subclasses MUST implement this!
+        raise NotImplementedError
 
     def _read_frame(self, length):
         """Read a response frame from the PN532 of at most length bytes in size.
@@ -264,32 +265,19 @@ class PN532:
         if there is an error parsing the frame.  Note that less than length bytes
         might be returned!
         """
-        # Read frame with expected length of data.
-        response = self._read_data(length+7)
+        # Read frame with expected length of data, extended frames have 3 more header bytes.
+        response = self._read_data(length + (7 if length < 255 else 10))
         if self.debug:
             print('Read frame:', [hex(i) for i in response])
-
-        # Swallow all the 0x00 values that preceed 0xFF.
-        offset = 0
-        while response[offset] == 0x00:
-            offset += 1
-            if offset >= len(response):
-                raise RuntimeError('Response frame preamble does not contain 0x00FF!')
-        if response[offset] != 0xFF:
-            raise RuntimeError('Response frame preamble does not contain 0x00FF!')
-        offset += 1
-        if offset >= len(response):
+        # Locate the frame and check both checksums in place.
+        frame = self._codec.parse(response)
+        if frame is None:
+            raise RuntimeError('Response frame is incomplete!')
+        kind, offset, frame_len, _ = frame
+        if kind != FRAME_DATA:
             raise RuntimeError('Response contains no data!')
-        # Check length & length checksum match.
-        frame_len = response[offset]
-        if (frame_len + response[offset+1]) & 0xFF != 0:
-            raise RuntimeError('Response length checksum did not match length!')
-        # Check frame checksum value matches bytes.
-        checksum = sum(response[offset+2:offset+2+frame_len+1]) & 0xFF
-        if checksum != 0:
-            raise RuntimeError('Response checksum did not match expected value: ', checksum)
         # Return frame data.
-        return response[offset+2:offset+2+frame_len]
+        return response[offset:offset+frame_len]
 
     def call_function(self, command, response_length=0, params=None, timeout=1):
         """Send specified command to the PN532 and expect up to response_length
@@ -299,27 +287,61 @@ class PN532:
         for a response and return a bytearray of response bytes, or None if no
         response is available within the timeout.
         """
-        # Build frame data with command and parameters.
-        if params is None:
-            params = []
-        data = bytearray(2+len(params))
-        data[0] = _HOSTTOPN532
-        data[1] = command & 0xFF
-        for i, val in enumerate(params):
-            data[2+i] = val
+        if not self.send_command(command, params=params, timeout=timeout):
+            return None
+        return self.process_response(command, response_length=response_length,
+                                     timeout=timeout)
+
+    def send_command(self, command, params=None, timeout=1):
+        """Send specified command to the PN532 and wait for the ACK.  Returns
+        True if the command was acknowledged, or False if the PN532 did not
+        respond within timeout seconds.  The response itself is left on the
+        chip to be collected later with process_response.
+        """
+        # Start the timing counters, stopped by process_response.
+        self._sent = (time.monotonic(), self.stats.polls)
         # Send frame and wait for response.
         try:
-            self._write_frame(data)
+            self._write_command(command, params)
         except OSError:
             self._wakeup()
-            return None
+            self._record(command)
+            return False
         if not self._wait_ready(timeout):
-            return None
+            self._record(command)
+            return False
         # Verify ACK response and wait to be ready for function response.
+        self._read_ack()
+        return True
+
+    def process_response(self, command, response_length=0, timeout=1):
+        """Wait up to timeout seconds for the response to a command previously
+        sent with send_command and return up to response_length bytes of it,
+        or None if no response is available within the timeout.
+        """
+        try:
+            if not self._wait_ready(timeout):
+                return None
+            return self._read_response(command, response_length)
+        finally:
+            self._record(command)
+
+    def _write_command(self, command, params=None):
+        """Write the frame for command and params, raising OSError if the
+        PN532 does not accept it."""
+        # Build frame with command and parameters in the codec's buffer.
+        frame = self._codec.encode(command, params if params is not None else b'')
+        if self.debug:
+            print('Write frame: ', [hex(i) for i in frame])
+        self._write_data(frame)
+
+    def _read_ack(self):
+        """Read the ACK frame, once the PN532 is ready"""
         if not _ACK == self._read_data(len(_ACK)):
             raise RuntimeError('Did not receive expected ACK from PN532!')
-        if not self._wait_ready(timeout):
-            return None
+
+    def _read_response(self, command, response_length):
+        """Read the response to command, once the PN532 is ready"""
         # Read response bytes.
         response = self._read_frame(response_length+2)
         # Check that response is for the called function.
@@ -328,6 +350,16 @@ class PN532:
         # Return response data.
         return response[2:]
 
+    def _record(self, command):
+        """Add the time and polls since the command was sent to the stats.
+        A response collected over several process_response calls is
+        recorded once per call, each covering its own wait.
+        """
+        timestamp, polls = self._sent
+        now = time.monotonic()
+        self.stats.record(command, now - timestamp, self.stats.polls - polls)
+        self._sent = (now, self.stats.polls)
+
     def get_firmware_version(self):
         """Call PN532 GetFirmwareVersion function and return a tuple with the IC,
         Ver, Rev, and Support values.
@@ -353,16 +385,42 @@ class PN532:
         otherwise a bytearray with the UID of the found card is returned.
         """
         # Send passive read command for 1 card.  Expect at most a 7 byte UUID.
+        if not self.listen_for_passive_target(card_baud=card_baud, timeout=timeout):
+            return None
+        return self.get_passive_target(timeout=timeout)
+
+    def listen_for_passive_target(self, card_baud=_MIFARE_ISO14443A, timeout=1):
+        """Arm the PN532 to detect one MiFare card without waiting for it.
+        Returns True once the InListPassiveTarget command is acknowledged.
+        The PN532 keeps searching on its own and signals on IRQ (or the
+        status byte) when a card is found; collect it with get_passive_target.
+        """
         try:
-            response = self.call_function(_COMMAND_INLISTPASSIVETARGET,
-                                          params=[0x01, card_baud],
-                                          response_length=19,
-                                          timeout=timeout)
+            return self.send_command(_COMMAND_INLISTPASSIVETARGET,
+                                     params=[0x01, card_baud],
+                                     timeout=timeout)
+        except BusyError:
+            return False # no card found!
+
+    def get_passive_target(self, timeout=1):
+        """Collect the result of listen_for_passive_target.  Will wait up to
+        timeout seconds and return None if no card is found, otherwise a
+        bytearray with the UID of the found card is returned.
+        """
+        try:
+            response = self.process_response(_COMMAND_INLISTPASSIVETARGET,
+                                             response_length=19,
+                                             timeout=timeout)
         except BusyError:
             return None # no card found!
         # If no response is available return None to indicate no card is present.
         if response is None:
             return None
+        return self._passive_target_uid(response)
+
+    @staticmethod
+    def _passive_target_uid(response):
+        """Return the UID from an InListPassiveTarget response"""
         # Check only 1 card with up to a 7 byte UID is present.
         if response[0] != 0x01:
             raise RuntimeError('More than one card detected!')
@@ -371,13 +429,115 @@ class PN532:
         # Return UID of card.
         return response[6:6+response[5]]
 
+    def start_auto_poll(self, period=1, types=(AUTOPOLL_TYPE_MIFARE,),
+                        poll_count=_AUTOPOLL_ENDLESS, timeout=1):
+        """Start the PN532 InAutoPoll command.  The chip then polls for the
+        given target types on its own, every period * 150 ms, up to
+        poll_count times (0xFF polls until a target is found), and only
+        raises IRQ/status once a target answers.  Returns True if the
+        command was acknowledged.
+        """
+        params = bytearray([poll_count & 0xFF, period & 0xFF]) + bytearray(types)
+        try:
+            return self.send_command(_COMMAND_INAUTOPOLL, params=params, timeout=timeout)
+        except BusyError:
+            return False
+
+    def get_auto_poll_targets(self, timeout=1):
+        """Collect the result of start_auto_poll.  Returns a list of
+        (target type, UID) tuples, an empty list if polling finished without
+        a target, or None if no result is available within timeout seconds.
+        """
+        try:
+            response = self.process_response(_COMMAND_INAUTOPOLL,
+                                             response_length=40,
+                                             timeout=timeout)
+        except BusyError:
+            return None
+        if response is None:
+            return None
+        targets = []
+        offset = 1
+        for _ in range(response[0]):
+            target_type = response[offset]
+            length = response[offset+1]
+            data = response[offset+2:offset+2+length]
+            offset += 2 + length
+            if target_type in (AUTOPOLL_TYPE_GENERIC_106, AUTOPOLL_TYPE_MIFARE,
+                               AUTOPOLL_TYPE_ISO14443_4A):
+                # Tg, SENS_RES (2), SEL_RES, NFCID length, NFCID
+                targets.append((target_type, data[5:5+data[4]]))
+            else:
+                targets.append((target_type, data))
+        return targets
+
+    def wait_for_response(self, timeout, poll_interval=0.05):
+        """Wait up to timeout seconds for a pending response while keeping
+        bus traffic low: on the IRQ edge if wired, otherwise by checking the
+        status every poll_interval seconds.
+        """
+        if self._irq_pin:
+            return self._irq_pin.wait(timeout)
+        timestamp = time.monotonic()
+        while True:
+            self.stats.polls += 1
+            if self.is_ready():
+                return True
+            remaining = timeout - (time.monotonic() - timestamp)
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll_interval, remaining))
+
+    def iter_auto_poll(self, period=1, types=(AUTOPOLL_TYPE_MIFARE,),
+                       poll_interval=0.05, timeout=None):
+        """Yield the UID of every target found by InAutoPoll, re-arming the
+        chip after each detection.  Stops after timeout seconds if given.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        armed = False
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                if not armed:
+                    armed = self.start_auto_poll(period=period, types=types)
+                    continue
+                wait = 1.0 if deadline is None else max(0.0, deadline - time.monotonic())
+                if not self.wait_for_response(min(wait, 1.0), poll_interval):
+                    continue
+                targets = self.get_auto_poll_targets(timeout=0.1)
+                if targets is None:
+                    continue
+                armed = False
+                for _, uid in targets:
+                    yield uid
+        finally:
+            if armed:
+                self.abort_command()
+
+    def abort_command(self):
+        """Abort the command in progress by sending an ACK frame"""
+        try:
+            self._write_data(_ACK)
+        except OSError:
+            self._wakeup()
+
+    def auto_poll(self, callback, period=1, types=(AUTOPOLL_TYPE_MIFARE,),
+                  poll_interval=0.05, timeout=None):
+        """Call callback(uid) for every target found by InAutoPoll until the
+        callback returns False or timeout seconds pass.
+        """
+        for uid in self.iter_auto_poll(period=period, types=types,
+                                       poll_interval=poll_interval,
+                                       timeout=timeout):
+            if callback(uid) is False:
+                return
+
     def mifare_classic_authenticate_block(self, uid, block_number, key_number, key):   # pylint: disable=invalid-name
         """Authenticate specified block number for a MiFare classic card.  Uid
         should be a byte array with the UID of the card, block number should be
         the block to authenticate, key number should be the key type (like
         MIFARE_CMD_AUTH_A or MIFARE_CMD_AUTH_B), and key should be a byte array
         with the key data.  Returns True if the block was authenticated, or False
-        if not authenticated.
+        if not authenticated or the PN532 did not answer.
         """
         # Build parameters for InDataExchange command to authenticate MiFare card.
         uidlen = len(uid)
@@ -392,6 +552,8 @@ class PN532:
         response = self.call_function(_COMMAND_INDATAEXCHANGE,
                                       params=params,
                                       response_length=1)
+        if response is None:
+            return False
         if response[0]:
             raise PN532Error(response[0])
         return response[0] == 0x00
@@ -463,6 +625,94 @@ class PN532:
         """
         return self.mifare_classic_read_block(block_number)[0:4] # only 4 bytes per page
 
+    def ntag2xx_read_pages(self, first_page, last_page):
+        """Read pages first_page to last_page (inclusive) of an NTAG2xx with
+        the READ command, which returns 4 pages per round trip.  Returns
+        the pages as one bytes object, or None if a read fails.
+        """
+        data = bytearray()
+        for page in range(first_page, last_page + 1, 4):
+            response = self.call_function(_COMMAND_INDATAEXCHANGE,
+                                          params=[0x01, MIFARE_CMD_READ, page & 0xFF],
+                                          response_length=17)
+            if response is None:
+                return None
+            if response[0]:
+                raise PN532Error(response[0])
+            data += response[1:17]
+        return bytes(data[:4 * (last_page - first_page + 1)])
+
+    def ntag2xx_fast_read(self, first_page, last_page):
+        """Read pages first_page to last_page (inclusive) of an NTAG21x with
+        FAST_READ sent through InCommunicateThru, up to 60 pages per round
+        trip.  Returns the pages as one bytes object, or None if a read fails.
+        """
+        data = bytearray()
+        for start in range(first_page, last_page + 1, _NTAG_FAST_READ_PAGES):
+            end = min(start + _NTAG_FAST_READ_PAGES - 1, last_page)
+            length = 4 * (end - start + 1)
+            response = self.call_function(_COMMAND_INCOMMUNICATETHRU,
+                                          params=[NTAG_CMD_FAST_READ, start & 0xFF, end & 0xFF],
+                                          response_length=1 + length)
+            if response is None:
+                return None
+            if response[0]:
+                raise PN532Error(response[0])
+            if len(response) - 1 != length:
+                # NAK from the tag, e.g. pages past the end of its memory
+                return None
+            data += response[1:]
+        return bytes(data)
+
+    @staticmethod
+    def mifare_classic_sector_blocks(sector):
+        """Return (first block, block count) of a MIFARE Classic 1K/4K sector;
+        the last block of each sector is its trailer."""
+        if sector < 32:
+            return 4 * sector, 4
+        return 128 + 16 * (sector - 32), 16
+
+    def mifare_classic_read_sectors(self, uid, sectors, keys=None, trailers=False):
+        """Read whole sectors of a MIFARE Classic card, authenticating once
+        per sector.  keys is a list of (key_number, key) pairs to try, by
+        default key A 0xFFFFFFFFFFFF.  The pair that opened each sector is
+        cached per card and tried first next time.  Returns the data blocks
+        of the sectors (with their trailers if `trailers`) as one bytes
+        object, or None if a sector cannot be authenticated or read.
+        """
+        if keys is None:
+            keys = [(MIFARE_CMD_AUTH_A, MIFARE_DEFAULT_KEY)]
+        cache = self._sector_keys
+        uid = bytes(uid)
+        data = bytearray()
+        for sector in sectors:
+            first, count = self.mifare_classic_sector_blocks(sector)
+            cached = cache.get((uid, sector))
+            candidates = ([cached] + [k for k in keys if k != cached]) if cached else keys
+            for key_number, key in candidates:
+                try:
+                    if self.mifare_classic_authenticate_block(uid, first, key_number, key):
+                        cache[(uid, sector)] = (key_number, key)
+                        break
+                except PN532Error:
+                    pass
+                # a failed authentication halts the card, select it again
+                cache.pop((uid, sector), None)
+                if self.read_passive_target(timeout=0.5) != uid:
+                    return None
+            else:
+                return None
+            for block in range(first, first + count - (0 if trailers else 1)):
+                response = self.call_function(_COMMAND_INDATAEXCHANGE,
+                                              params=[0x01, MIFARE_CMD_READ, block & 0xFF],
+                                              response_length=17)
+                if response is None:
+                    return None
+                if response[0]:
+                    raise PN532Error(response[0])
+                data += response[1:17]
+        return bytes(data)
+
     def read_gpio(self, pin=None):
         """Read the state of the PN532's GPIO pins.
         :params pin: <str> specified the pin to read
@@ -31,9 +31,9 @@ using SPI on the Raspberry Pi.
 
 
 import time
-import spidev
-import RPi.GPIO as GPIO
+from .gpio import GPIO
 from .pn532 import PN532
+from .irq import IRQPin
 
 # pylint: disable=bad-whitespace
 _SPI_STATREAD                  = 0x02
@@ -43,47 +43,62 @@ _SPI_READY                     = 0x01
 
 
 class SPIDevice:
-    """Implements SPI device on spidev"""
-    def __init__(self, cs=None):
-        self.spi = spidev.SpiDev(0, 0)
+    """Implements SPI device on spidev. `spi` may be any object with the
+    spidev interface in place of /dev/spidev0.0. `cs_settle` is the time
+    in seconds the GPIO chip select is held before and after a transfer.
+    """
+    def __init__(self, cs=None, spi=None, max_speed_hz=1000000, cs_settle=0.001):
+        if spi is None:
+            import spidev
+            spi = spidev.SpiDev(0, 0)
+        self.spi = spi
         GPIO.setmode(GPIO.BCM)
         self._cs = cs
+        self._cs_settle = cs_settle
         if cs:
             GPIO.setup(self._cs, GPIO.OUT)
             GPIO.output(self._cs, GPIO.HIGH)
-        self.spi.max_speed_hz = 1000000
+        self.spi.max_speed_hz = max_speed_hz
         self.spi.mode = 0b10    # CPOL=1 & CPHA=0
 
-    def writebytes(self, buf):
+    def _select(self):
         if self._cs:
             GPIO.output(self._cs, GPIO.LOW)
-            time.sleep(0.001);
-        ret = self.spi.writebytes(list(buf))
+            if self._cs_settle:
+                time.sleep(self._cs_settle)
+
+    def _deselect(self):
         if self._cs:
-            time.sleep(0.001);
+            if self._cs_settle:
+                time.sleep(self._cs_settle)
             GPIO.output(self._cs, GPIO.HIGH)
+
+    def writebytes(self, buf):
+        self._select()
+        ret = self.spi.writebytes(list(buf))
+        self._deselect()
         return ret
 
     def readbytes(self, count):
-        if self._cs:
-            GPIO.output(self._cs, GPIO.LOW)
-            time.sleep(0.001);
+        self._select()
         ret = bytearray(self.spi.readbytes(count))
-        if self._cs:
-            time.sleep(0.001);
-            GPIO.output(self._cs, GPIO.HIGH)
+        self._deselect()
         return ret
 
     def xfer(self, buf):
-        if self._cs:
-            GPIO.output(self._cs, GPIO.LOW)
-            time.sleep(0.001);
+        self._select()
         buf = bytearray(self.spi.xfer(buf))
-        if self._cs:
-            time.sleep(0.001);
-            GPIO.output(self._cs, GPIO.HIGH)
+        self._deselect()
         return buf
 
+    def transfer(self, buf):
+        """Full-duplex transfer of a whole buffer under one chip select,
+        returning the bytes clocked in"""
+        self._select()
+        ret = bytes(self.spi.xfer2(list(buf)))
+        self._deselect()
+        return ret
+
 
 def reverse_bit(num):
     """Turn an LSB byte to an MSB byte, and vice versa. Used for SPI as
@@ -96,15 +111,41 @@ def reverse_bit(num):
     return result
 
 
+# Bit-reversed value of every byte, for reversing whole buffers at once
+_REVERSE_TABLE = bytes(reverse_bit(i) for i in range(256))
+
+
+def reverse_bytes(buf):
+    """Bit-reverse every byte of buf with a single translate call"""
+    return bytes(buf).translate(_REVERSE_TABLE)
+
+
+# Prefixes already in LSB order
+_STATREAD_PREFIX = reverse_bytes([_SPI_STATREAD, 0])
+_DATAREAD_PREFIX = reverse_bytes([_SPI_DATAREAD])
+_DATAWRITE_PREFIX = reverse_bytes([_SPI_DATAWRITE])
+
+
 class PN532_SPI(PN532):
     """Driver for the PN532 connected over SPI. Pass in a hardware SPI device
-    & chip select digitalInOut pin. Optional IRQ pin (not used), reset pin and
-    debugging output."""
-    def __init__(self, cs=None, irq=None, reset=None, debug=False):
-        """Create an instance of the PN532 class using SPI"""
+    & chip select digitalInOut pin. Optional IRQ pin (waited on instead of
+    polling the status byte), reset pin and debugging output."""
+    def __init__(self, cs=None, irq=None, reset=None, debug=False,
+                 spi=None, speed_hz=1000000, cs_settle=0.001,
+                 backoff=None, wakeup_delay=1):
+        """Create an instance of the PN532 class using SPI
+
+        Passing a `Backoff` selects the latency-tuned mode: the status byte
+        is polled with adaptive backoff instead of the fixed settling sleeps
+        around every transfer.  `speed_hz` and `cs_settle` set the SPI clock
+        and chip select settle time; `spi` may be a spidev-like object.
+        """
         self.debug = debug
+        self._backoff = backoff
+        self._wakeup_delay = wakeup_delay
         self._gpio_init(cs=cs, irq=irq, reset=reset)
-        self._spi = SPIDevice(cs)
+        self._irq_pin = IRQPin(irq, GPIO) if irq else None
+        self._spi = SPIDevice(cs, spi=spi, max_speed_hz=speed_hz, cs_settle=cs_settle)
         super().__init__(debug=debug, reset=reset)
 
     def _gpio_init(self, reset=None, cs=None, irq=None):
@@ -131,47 +172,54 @@ class PN532_SPI(PN532):
 
     def _wakeup(self):
         """Send any special commands/data to wake up PN532"""
-        time.sleep(1)
+        time.sleep(self._wakeup_delay)
         if self._cs:
             GPIO.output(self._cs, GPIO.LOW)
         time.sleep(0.002)   # T_osc_start
         self._spi.writebytes(bytearray([0x00])) #pylint: disable=no-member
-        time.sleep(1)
+        time.sleep(self._wakeup_delay)
 
     def _wait_ready(self, timeout=1):
         """Poll PN532 if status byte is ready, up to `timeout` seconds"""
-        status = bytearray([reverse_bit(_SPI_STATREAD), 0])
+        if self._irq_pin:
+            return self._irq_pin.wait(timeout)
+        if self._backoff:
+            ready, polls = self._backoff.poll(self.is_ready, timeout)
+            self.stats.polls += polls
+            return ready
         timestamp = time.monotonic()
         while (time.monotonic() - timestamp) < timeout:
             time.sleep(0.01)   # required
-            status = self._spi.xfer(status) #pylint: disable=no-member
-            if reverse_bit(status[1]) == _SPI_READY:  # LSB data is read in MSB
+            self.stats.polls += 1
+            if self.is_ready():
                 return True      # Not busy anymore!
             else:
                 time.sleep(0.005)  # pause a bit till we ask again
         # We timed out!
         return False
 
+    def is_ready(self):
+        """Check once, without waiting, if the PN532 has a response ready"""
+        status = self._spi.transfer(_STATREAD_PREFIX) #pylint: disable=no-member
+        return _REVERSE_TABLE[status[1]] == _SPI_READY  # LSB data is read in MSB
+
     def _read_data(self, count):
         """Read a specified count of bytes from the PN532."""
-        # Build a read request frame.
-        frame = bytearray(count+1)
-        # Add the SPI data read signal byte, but LSB'ify it
-        frame[0] = reverse_bit(_SPI_DATAREAD)
-        time.sleep(0.005)   # required
-        frame = self._spi.xfer(frame) #pylint: disable=no-member
-        for i, val in enumerate(frame):
-            frame[i] = reverse_bit(val) # turn LSB data to MSB
+        # Data read signal byte followed by count clocking bytes, in one transfer
+        if not self._backoff:
+            time.sleep(0.005)   # required
+        frame = self._spi.transfer(_DATAREAD_PREFIX + bytes(count)) #pylint: disable=no-member
+        frame = bytearray(reverse_bytes(frame[1:])) # turn LSB data to MSB
         if self.debug:
-            print("Reading: ", [hex(i) for i in frame[1:]])
-        return frame[1:]
+            print("Reading: ", [hex(i) for i in frame])
+        return frame
 
     def _write_data(self, framebytes):
         """Write a specified count of bytes to the PN532"""
-        # start by making a frame with data write in front,
-        # then rest of bytes, and LSBify it
-        rev_frame = [reverse_bit(x) for x in bytes([_SPI_DATAWRITE]) + framebytes]
+        # data write signal byte in front of the LSBified frame, in one transfer
+        rev_frame = _DATAWRITE_PREFIX + reverse_bytes(framebytes)
         if self.debug:
             print("Writing: ", [hex(i) for i in rev_frame])
-        time.sleep(0.02)   # required
-        self._spi.writebytes(bytes(rev_frame))
+        if not self._backoff:
+            time.sleep(0.02)   # required
+        self._spi.transfer(rev_frame)
@@ -0,0 +1,91 @@
+# Waveshare PN532 NFC Hat control library.
+#
+# The MIT License (MIT)
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Polling backoff and per-command timing counters shared by the PN532
+transports.
+"""
+
+import time
+
+
+class Backoff:
+    """Adaptive delays between readiness polls.
+
+    The first `tight_polls` polls go back to back, as most responses are
+    ready within a few bus transactions.  After that the delay starts at
+    `initial` seconds and grows by `factor` up to `maximum`.
+    """
+    def __init__(self, tight_polls=8, initial=0.0002, factor=2.0, maximum=0.005):
+        self.tight_polls = tight_polls
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+
+    def __iter__(self):
+        for _ in range(self.tight_polls):
+            yield 0.0
+        delay = self.initial
+        while True:
+            yield delay
+            delay = min(delay * self.factor, self.maximum)
+
+    def poll(self, ready, timeout):
+        """Call `ready()` with backoff until it returns True or `timeout`
+        seconds pass.  Returns (result, number of polls).
+        """
+        timestamp = time.monotonic()
+        polls = 0
+        for delay in self:
+            polls += 1
+            if ready():
+                return True, polls
+            if (time.monotonic() - timestamp) >= timeout:
+                return False, polls
+            if delay:
+                time.sleep(delay)
+
+
+class CallStats:
+    """Per-command call counters: calls, total/max seconds and readiness polls"""
+    def __init__(self):
+        self.commands = {}
+        self.polls = 0
+
+    def record(self, command, elapsed, polls=0):
+        entry = self.commands.setdefault(command, [0, 0.0, 0.0, 0])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        entry[3] += polls
+
+    def reset(self):
+        self.commands.clear()
+        self.polls = 0
+
+    def report(self):
+        """Return one line per command with mean/max time in ms and polls per call"""
+        lines = []
+        for command, (calls, total, worst, polls) in sorted(self.commands.items()):
+            lines.append('0x%02X: %d calls, mean %.2f ms, max %.2f ms, %.1f polls/call' % (
+                command, calls, 1000 * total / calls, 1000 * worst, polls / calls))
+        return '\n'.join(lines)
@@ -30,15 +30,19 @@ using UART (ttyS0) on the Raspberry Pi.
 """
 
 
+import collections
+import threading
 import time
-import serial
-import RPi.GPIO as GPIO
+from .gpio import GPIO
 from .pn532 import PN532, BusyError
+from .frame import FrameCodec, FrameError, FRAME_DATA
 
 
 # pylint: disable=bad-whitespace
 DEV_SERIAL          = '/dev/ttyS0'
 BAUD_RATE           = 115200
+# Serial read timeout of the reader thread, bounds how long close() waits
+READER_TIMEOUT      = 0.05
 
 
 class PN532_UART(PN532):
@@ -46,19 +50,36 @@ class PN532_UART(PN532):
     Optional IRQ pin (not used), reset pin and debugging output. 
     """
     def __init__(self, dev=DEV_SERIAL, baudrate=BAUD_RATE,
-                irq=None, reset=None, debug=False):
+                irq=None, reset=None, debug=False, threaded=False, uart=None):
         """Create an instance of the PN532 class using UART
         before running __init__, you should
         1.  disable serial login shell
         2.  enable serial port hardware
         using 'sudo raspi-config' --> 'Interfacing Options' --> 'Serial'
+
+        With `threaded` a reader thread reassembles PN532 frames from the
+        byte stream as they arrive, so waiting for a response blocks on a
+        condition instead of sleep-polling the port.  `uart` may be any
+        open pyserial-like object in place of opening `dev`.
         """
 
         self.debug = debug
         self._gpio_init(irq=irq, reset=reset)
-        self._uart = serial.Serial(dev, baudrate)
+        if uart is None:
+            import serial
+            uart = serial.Serial(dev, baudrate)
+        self._uart = uart
         if not self._uart.is_open:
             raise RuntimeError('cannot open {0}'.format(dev))
+        self._frames = None
+        if threaded:
+            self._frames = collections.deque()
+            self._arrived = threading.Condition()
+            self._closing = threading.Event()
+            self._uart.timeout = READER_TIMEOUT
+            self._reader = threading.Thread(target=self._read_frames,
+                                            name='pn532-uart', daemon=True)
+            self._reader.start()
         super().__init__(debug=debug, reset=reset)
 
     def _gpio_init(self, reset=None,irq=None):
@@ -84,8 +105,57 @@ class PN532_UART(PN532):
         self._uart.write(b'\x55\x55\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00') # wake up!
         self.SAM_configuration()
 
+    def _read_frames(self):
+        """Reader thread: split the byte stream into whole frames.  Each
+        frame is queued from its preamble to its postamble, so an ACK is
+        queued exactly as the 6 byte ACK frame.
+        """
+        buf = bytearray()
+        while not self._closing.is_set():
+            try:
+                chunk = self._uart.read(self._uart.in_waiting or 1)
+            except OSError:
+                # port closed underneath us
+                break
+            if not chunk:
+                continue
+            buf += chunk
+            frames = []
+            while True:
+                try:
+                    frame = FrameCodec.parse(buf)
+                except FrameError:
+                    # corrupt frame, resynchronise on the next start code
+                    del buf[:buf.find(b'\x00\xFF') + 2]
+                    continue
+                if frame is None:
+                    break
+                kind, offset, length, end = frame
+                if kind == FRAME_DATA:
+                    end = offset + length + 2
+                if end > len(buf):
+                    # postamble still in flight
+                    break
+                start = buf.find(b'\x00\xFF')
+                frames.append(b'\x00' + bytes(buf[start:end]))
+                del buf[:end]
+            if frames:
+                with self._arrived:
+                    self._frames.extend(frames)
+                    self._arrived.notify_all()
+
+    def close(self):
+        """Stop the reader thread, if any, and close the port"""
+        if self._frames is not None:
+            self._closing.set()
+            self._reader.join()
+        self._uart.close()
+
     def _wait_ready(self, timeout=0.001):
         """Wait for response frame, up to `timeout` seconds"""
+        if self._frames is not None:
+            with self._arrived:
+                return self._arrived.wait_for(lambda: self._frames, timeout)
         timestamp = time.monotonic()
         while (time.monotonic() - timestamp) < timeout:
             if self._uart.in_waiting:
@@ -95,18 +165,34 @@ class PN532_UART(PN532):
         # Timed out!
         return False
 
+    def is_ready(self):
+        """Check once, without waiting, if the PN532 has a response ready"""
+        if self._frames is not None:
+            return bool(self._frames)
+        return bool(self._uart.in_waiting)
+
     def _read_data(self, count):
         """Read a specified count of bytes from the PN532."""
-        frame = self._uart.read(min(self._uart.in_waiting, count))
+        if self._frames is not None:
+            # one whole frame, whatever count asks for
+            with self._arrived:
+                frame = self._frames.popleft() if self._frames else None
+        else:
+            frame = self._uart.read(min(self._uart.in_waiting, count))
         if not frame:
             raise BusyError("No data read from PN532")
         if self.debug:
             print("Reading: ", [hex(i) for i in frame])
-        else:
+        elif self._frames is None:
             time.sleep(0.005)
         return frame
 
     def _write_data(self, framebytes):
         """Write a specified count of bytes to the PN532"""
-        self._uart.read(self._uart.in_waiting)    # clear FIFO queue of UART
+        if self._frames is not None:
+            # drop frames left over from an abandoned command
+            with self._arrived:
+                self._frames.clear()
+        else:
+            self._uart.read(self._uart.in_waiting)    # clear FIFO queue of UART
         self._uart.write(framebytes)
@@ -2,257 +2,235 @@
 
 # import ros stuff
 import rclpy
-from rclpy.node import Node
 from geometry_msgs.msg import Twist, Point
-from sensor_msgs.msg import LaserScan
-from rclpy.qos import qos_profile_sensor_data
-from nav_msgs.msg import Odometry
-import time
 import numpy as np
 
 import math
 import navigation as nav
+import bug_planner
+import motion_control
 
 
+## Bug 0 runs as a behaviour of the navigation node: one node, one set of
+## subscriptions and one lidar cache shared with the wall follower, so
+## switching between go-to-goal and wall following is only a mode change
 
-bugSwitch = True
-fd = 0.3
+fd = 0.3 # front distance that hands over to the wall follower
+range_max = 3.5 # LDS-01 range, scan_callback keeps only the ranges
+
+# modes
+GO_TO_GOAL = 0
+WALL_FOLLOW = 1
 
-# robot state variables
-position_ = Point()
-yaw_ = 0
 # machine state
-bug_state_ = -1
 bug_state_dict_ = {
     -1: 'init',
     0: 'Turn',
     1: 'Go Straight',
-    2: 'Halt',}
+    2: 'Halt',
+    3: 'Switch',
+}
 
 # goal
-'''
-desired_position_ = Point()
-desired_position_.x = float(0)
-desired_position_.y = float(-3.7)
-desired_position_.z = float(0)
-'''
-# parameters
-yaw_precision_ = math.pi / 90 # +/- 2 degree allowed
+default_goal = (0.0, -3.7)
 
+# parameters
 dist_precision_ = 0.2
 
-isArrived = False
-# publishers
-pub = None
-
-def euler_from_quaternion(x, y, z, w):
-    t0 = +2.0 * (w * x + y * z)
-    t1 = +1.0 - 2.0 * (x * x + y * y)
-    roll_x = math.atan2(t0, t1)
-
-    t2 = +2.0 * (w * y - z * x)
-    t2 = +1.0 if t2 > +1.0 else t2
-    t2 = -1.0 if t2 < -1.0 else t2
-    pitch_y = math.asin(t2)
 
-    t3 = +2.0 * (w * z + x * y)
-    t4 = +1.0 - 2.0 * (y * y + z * z)
-    yaw_z = math.atan2(t3, t4)
-
-    return roll_x, pitch_y, yaw_z,# in radians
-
-def getTarget(x_coord,y_coord,z_coord):
-    global desired_position_
-    desired_position_ = Point()
-    desired_position_.x = x_coord
-    desired_position_.y = y_coord
-    desired_position_.z = z_coord
-
-class BugNav(Node):
-    def __init__(self):
-        super().__init__('bug_nav')
-        self.bug_publisher_ = self.create_publisher(Twist, 'cmd_vel', 10)
-        self.bug_odom_subscription = self.create_subscription(Odometry, 'odom', self.clbk_odom, 10)
-        self.bug_scan_subscription = self.create_subscription(LaserScan, 'scan', self.bug_scan_callback, qos_profile_sensor_data)
-        self.laser_range = np.array([])
-        #self.tfBuffer = tf2_ros.Buffer()
-        #self.tfListener = tf2_ros.TransformListener(self.tfBuffer, self)
-    
-    def bug_scan_callback(self, msg):
-        global regions_
-        # self.get_logger().info('In scan_callback')
-        # create numpy array
-        self.laser_range = np.array(msg.ranges)
-        # replace 0's with nan
-        self.laser_range[self.laser_range == 0] = np.nan
-        self.laserFront = self.laser_range[354:359]
-        self.laserFront = np.append(self.laserFront, self.laser_range[0:6])
-        self.front_dist = np.nan_to_num(np.nanmean(self.laserFront), copy = False, nan = 100)
-        self.leftfront_dist = np.nan_to_num(np.nanmean(self.laser_range[43:48]), copy = False, nan = 100)
-        self.rightfront_dist = np.nan_to_num(np.nanmean(self.laser_range[313:318]), copy = False, nan = 100)
-        self.leftback_dist = np.nan_to_num(np.nanmean(self.laser_range[132:138]), copy = False, nan = 100)
-        self.back_dist = np.nan_to_num(np.nanmean(self.laser_range[175:186]), copy = False, nan = 100)
-        
-        regions_ = {
-        'right':  min(min(self.laser_range[265:276]), 10),
-        'fright': min(self.rightfront_dist, 10),
+def normalize_angle(angle):
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+def sector_min(laser_range, start, stop):
+    # nearest return in a sector of one degree beams, 10 when nothing is in range
+    sector = laser_range[start:stop]
+    if sector.size == 0 or np.all(np.isnan(sector)):
+        return 10
+    return min(float(np.nanmin(sector)), 10)
+
+
+def sector_mean(laser_range, start, stop):
+    sector = laser_range[start:stop]
+    if sector.size == 0 or np.all(np.isnan(sector)):
+        return 100
+    return float(np.nanmean(sector))
+
+
+class BugNav:
+    """
+    Bug 0 go-to-goal on top of a navigation.AutoNav node
+    the node's scan and odom callbacks keep the sensor state, this class
+    only reads it, and obstacles are handed to the node's own pick_direction
+    """
+    def __init__(self, nav_node):
+        self.nav = nav_node
+        self.desired_position_ = None
+        self.mode = GO_TO_GOAL
+        self.bug_state_ = -1
+        self.isArrived = False
+        # lidar regions, recomputed once per scan message
+        self._scan = None
+        self.regions_ = {}
+        self.front_dist = 100
+        self.clear_ahead = range_max
+        # steers and drives at once, and logs the time and path of the run
+        self.controller = motion_control.GoToGoal(dist_precision_)
+
+    def getTarget(self, x_coord, y_coord, z_coord=0.0):
+        self.desired_position_ = Point()
+        self.desired_position_.x = x_coord
+        self.desired_position_.y = y_coord
+        self.desired_position_.z = z_coord
+        self.isArrived = False
+        self.controller.start(self.nav.x, self.nav.y, (x_coord, y_coord))
+        self.change_bug_state(-1)
+
+    def update_regions(self):
+        laser_range = self.nav.laser_range
+        if laser_range is self._scan:
+            return
+        # scan_callback builds a new array per message, nan for no return
+        self._scan = laser_range
+        laserFront = np.append(laser_range[354:359], laser_range[0:6])
+        self.front_dist = sector_mean(laserFront, 0, laserFront.size)
+        self.regions_ = {
+        'right':  sector_min(laser_range, 265, 276),
+        'fright': min(sector_mean(laser_range, 313, 318), 10),
         'front':  min(self.front_dist, 10),
-        'fleft':  min(self.leftfront_dist, 10),
-        'left':   min(min(msg.ranges[85:96]), 10),
+        'fleft':  min(sector_mean(laser_range, 43, 48), 10),
+        'left':   sector_min(laser_range, 85, 96),
         }
+        # free distance straight ahead for the robot's footprint, beams from the heading
+        geometry = bug_planner.scan_geometry(laser_range, 0.0, 2 * math.pi / laser_range.size, range_max)
+        self.clear_ahead = bug_planner.free_distance(*geometry, bearing=0.0, range_max=range_max)
+
+    def goal_error(self):
+        # heading and distance errors to the goal from the shared odometry
+        des_pos = self.desired_position_
+        desired_yaw = math.atan2(des_pos.y - self.nav.y, des_pos.x - self.nav.x)
+        err_yaw = normalize_angle(desired_yaw - self.nav.yaw)
+        err_pos = math.hypot(des_pos.y - self.nav.y, des_pos.x - self.nav.x)
+        return err_yaw, err_pos
 
-  
     def start(self):
-        global isArrived
         try:
-            rclpy.spin_once(self)
+            rclpy.spin_once(self.nav)
             print("Acquiring lidar data")
-            while (self.laser_range.size == 0):    
-                rclpy.spin_once(self)
-            
-            while not isArrived:
-                if bug_state_ == 0:
-                    self.fix_yaw(desired_position_)
-                elif bug_state_ == 1:
-                    self.go_straight_ahead(desired_position_)
-                elif bug_state_ == 2:
-                    self.stopbot()
-                    isArrived = True
-                    pass
-                elif bug_state_ == -1:
-                    self.change_bug_state(0)
-                else:
-                    print('Unknown bug state!')
-                    pass
+            while (self.nav.laser_range.size == 0):
+                rclpy.spin_once(self.nav)
+
+            while not self.isArrived:
+                rclpy.spin_once(self.nav)
+                self.step()
         except Exception as e:
             print(e)
         # Ctrl-c detected
         finally:
             # stop moving
-            self.stopbot()
-            
-    def clbk_odom(self, msg):
-        global position_
-        global yaw_
-        # position
-        position_ = msg.pose.pose.position
-        #print(position_)
-        # yaw
-        euler = euler_from_quaternion(msg.pose.pose.orientation.x,
-            msg.pose.pose.orientation.y,
-            msg.pose.pose.orientation.z,
-            msg.pose.pose.orientation.w)
-        yaw_ = euler[2]
-            
-    def fix_yaw(self,des_pos):
-        global yaw_, pub, yaw_precision_, bug_state_
-        rclpy.spin_once(self)
-        desired_yaw = math.atan2(des_pos.y - position_.y, des_pos.x - position_.x)
-        err_yaw = desired_yaw - yaw_
+            self.nav.stopbot()
+
+    def step(self):
+        """One control step in the current mode, call after each spin"""
+        self.update_regions()
+        self.controller.track(self.nav.x, self.nav.y)
+        if self.mode == WALL_FOLLOW:
+            if self.check_whether_to_switch():
+                self.change_bug_switch(GO_TO_GOAL)
+            else:
+                self.nav.pick_direction()
+            return
+        if self.bug_state_ == 0:
+            self.fix_yaw()
+        elif self.bug_state_ == 1:
+            self.go_straight_ahead()
+        elif self.bug_state_ == 2:
+            self.nav.stopbot()
+            self.isArrived = True
+        elif self.bug_state_ == -1:
+            self.change_bug_state(0)
+        else:
+            print('Unknown bug state!')
+
+    def fix_yaw(self):
+        # turn on the spot until the goal is close enough ahead to drive at
+        err_yaw, _ = self.goal_error()
         twist_msg = Twist()
-        if math.fabs(err_yaw) > yaw_precision_:
-            #turn left if deired yaw -ve
-            twist_msg.angular.z = 0.3 if err_yaw > 0 else -0.3
-        
-        self.bug_publisher_.publish(twist_msg)
+        twist_msg.angular.z = motion_control.clamp(
+            motion_control.heading_gain * err_yaw, -motion_control.max_turn, motion_control.max_turn)
+        self.nav.publisher_.publish(twist_msg)
         # state change conditions
-        if math.fabs(err_yaw) <= yaw_precision_:
-            #print ('Yaw error: [%s]' % err_yaw)
+        if math.fabs(err_yaw) <= motion_control.drive_heading_error:
             self.change_bug_state(1)
-    
-    def go_straight_ahead(self,des_pos):
-        global yaw_, pub, yaw_precision_, bug_state_, fd, bugSwitch
-        desired_yaw = math.atan2(des_pos.y - position_.y, des_pos.x - position_.x)
-        err_yaw = desired_yaw - yaw_
-        err_pos = math.sqrt(pow(des_pos.y - position_.y, 2) + pow(des_pos.x - position_.x, 2))
-        if err_pos > dist_precision_ and bugSwitch: 
-            rclpy.spin_once(self)
-            if self.front_dist > fd:
-                twist_msg = Twist()
-                twist_msg.linear.x = 0.2
-                self.bug_publisher_.publish(twist_msg)
-            elif self.front_dist < fd:
-                self.stopbot()
-                print('Time to change to wall')
-                self.change_bug_switch(0)
-                nav.AutoNav().bugWall()
-                
 
+    def go_straight_ahead(self):
+        # steer and drive at once, slowing for the heading error, the
+        # obstacles ahead and the goal
+        err_yaw, _ = self.goal_error()
+        if self.controller.arrived(self.nav.x, self.nav.y):
+            self.nav.stopbot()
+            print('Bug algorithm - %s' % self.controller.log.summary())
+            self.change_bug_state(2)
+            return
+        if self.front_dist <= fd:
+            self.nav.stopbot()
+            print('Time to change to wall')
+            self.change_bug_switch(WALL_FOLLOW)
+            return
         # bug_state change conditions
-        if math.fabs(err_yaw) > yaw_precision_:
-            #print ('Yaw error: [%s]' % err_yaw)
+        if math.fabs(err_yaw) > motion_control.drive_heading_error:
             self.change_bug_state(0)
-        if err_pos < dist_precision_:
-            self.stopbot()
-            self.change_bug_state(2)
- 
-    
-
-    def normalize_angle(self,angle):
-        if(math.fabs(angle) > math.pi):
-            angle = angle - (2 * math.pi * angle) / (math.fabs(angle))
-        return angle
+            return
+        linear, angular = self.controller.update(self.nav.x, self.nav.y, self.nav.yaw, self.clear_ahead)
+        twist_msg = Twist()
+        twist_msg.linear.x = linear
+        twist_msg.angular.z = angular
+        self.nav.publisher_.publish(twist_msg)
 
-    
     def check_whether_to_switch(self):
-            rclpy.spin_once(self)
-            desired_yaw = math.atan2(desired_position_.y - position_.y, desired_position_.x - position_.x)
-            err_yaw = self.normalize_angle(desired_yaw - yaw_)
-            # less than 30 degrees
-            if math.fabs(err_yaw) < (math.pi / 6) and \
-               regions_['front'] > 1.5 and regions_['fright'] > 1 and regions_['fleft'] > 1:
-                print('less than 30')
-                return 1            
-            # between 30 and 90
-            if err_yaw > 0 and \
-               math.fabs(err_yaw) > (math.pi / 6) and \
-               math.fabs(err_yaw) < (math.pi / 2) and \
-               regions_['left'] > 1.5 and regions_['fleft'] > 1:
-                print('between 30 and 90 - to the left')
-                return 1           
-            if err_yaw < 0 and \
-               math.fabs(err_yaw) > (math.pi / 6) and \
-               math.fabs(err_yaw) < (math.pi / 2) and \
-               regions_['right'] > 1.5 and regions_['fright'] > 1:
-                print('between 30 and 90 - to the right')
-                return 1
-            return 0
-            
-    def change_bug_switch(self,switch):
-        global bugSwitch
-        if switch == 0:
-            bugSwitch = False
-        elif switch ==1:
-            bugSwitch = True
-    
-    def change_bug_state(self,bug_state):
-        global bug_state_
-        if bug_state is not bug_state_:
+        # leave the wall once the way towards the goal is clear
+        err_yaw, _ = self.goal_error()
+        regions_ = self.regions_
+        # less than 30 degrees
+        if math.fabs(err_yaw) < (math.pi / 6) and \
+           regions_['front'] > 1.5 and regions_['fright'] > 1 and regions_['fleft'] > 1:
+            return True
+        # between 30 and 90
+        if err_yaw > 0 and \
+           math.fabs(err_yaw) > (math.pi / 6) and \
+           math.fabs(err_yaw) < (math.pi / 2) and \
+           regions_['left'] > 1.5 and regions_['fleft'] > 1:
+            return True
+        if err_yaw < 0 and \
+           math.fabs(err_yaw) > (math.pi / 6) and \
+           math.fabs(err_yaw) < (math.pi / 2) and \
+           regions_['right'] > 1.5 and regions_['fright'] > 1:
+            return True
+        return False
+
+    def change_bug_switch(self, mode):
+        if mode == GO_TO_GOAL and self.mode == WALL_FOLLOW:
+            print('Bug algorithm - [%s] - %s' % (3, bug_state_dict_[3]))
+            self.change_bug_state(0)
+        self.mode = mode
+
+    def change_bug_state(self, bug_state):
+        if bug_state != self.bug_state_:
             print('Bug algorithm - [%s] - %s' % (bug_state, bug_state_dict_[bug_state]))
-        bug_state_ = bug_state
-        
-    def stopbot(self):
-        #self.get_logger().info('In stopbot')
-        # publish to cmd_vel to move TurtleBot
-        twist = Twist()
-        twist.linear.x = 0.0
-        twist.angular.z = 0.0
-        # time.sleep(1)
-        self.bug_publisher_.publish(twist)     
+        self.bug_state_ = bug_state
 
 
-'''s
 def main(args=None):
-    global pub
-    #rclpy.init(args=args)
-    bug_nav = BugNav()
+    rclpy.init(args=args)
+    auto_nav = nav.AutoNav()
+    bug_nav = BugNav(auto_nav)
+    bug_nav.getTarget(*default_goal)
     bug_nav.start()
     # Destroy the node explicitly
     # (optional - otherwise it will be done automatically
     # when the garbage collector destroys the node object)
-    bug_nav.destroy_node()
-    #ssrclpy.shutdown()
+    auto_nav.destroy_node()
+    rclpy.shutdown()
 
 if __name__ == '__main__':
     main()
-'''
\ No newline at end of file
@@ -19,7 +19,7 @@ from geometry_msgs.msg import Twist, Point, Pose
 from rclpy.qos import qos_profile_sensor_data
 from sensor_msgs.msg import LaserScan
 from nav_msgs.msg import OccupancyGrid
-from std_msgs.msg import Float64MultiArray, String
+from std_msgs.msg import Float64MultiArray, Float64, String
 import numpy as np
 import tf2_ros
 from tf2_ros import LookupException, ConnectivityException, ExtrapolationException, TransformException
@@ -31,6 +31,9 @@ import matplotlib.pyplot as plt
 from PIL import Image
 import scipy.stats
 import os
+from heat_waypoints import HeatWaypointIndex
+import bug_planner
+import motion_control
 
 ## Stores known frames and offers frame graph requests
 from tf2_ros.buffer import Buffer
@@ -99,13 +102,11 @@ bug_state_dict_ = {
 bugSwitch = True
 isArrived = False
 fd = 0.3
-yaw_precision_ = math.pi / 90 # +/- 2 degree allowed
 dist_precision_ = 0.2
-#waypoint dictionary to track maximum temperature recorded and allows for overiding of same temps
-#key represents temperature, value represents the position
-waypoint_dict = {
-    1: 0.0,0.0,0.0
-}
+# when to leave the wall: 'bug0' region thresholds, 'bug2' M-line or 'tangent' tangent bug
+bug_planner_mode = 'tangent'
+## Heat waypoints, one per hot target reported by the RPi, hottest first
+waypoint_index = HeatWaypointIndex()
 
 
 # publishers
@@ -149,6 +150,16 @@ class AutoNav(Node):
             10)
         self.targeting_subscription  # prevent unused variable warning
 
+        # create subscription to the temperature of the detected target
+        self.temperature_subscription = self.create_subscription(
+            Float64,
+            'target_temperature',
+            self.temperature_callback,
+            10)
+        self.temperature_subscription  # prevent unused variable warning
+        self.target_temperature = 0.0
+        self.engaged_waypoint = None
+
         # create subscription to track orientation
         self.odom_subscription = self.create_subscription(
             Odometry,
@@ -196,6 +207,13 @@ class AutoNav(Node):
         self.bug_odom_subscription = self.create_subscription(Odometry, 'odom', self.clbk_odom, 10)
         self.bug_scan_subscription = self.create_subscription(LaserScan, 'scan', self.bug_scan_callback, qos_profile_sensor_data)
         self.laser_range = np.array([])
+        # whole scan for the bug planners, set by bug_scan_callback only
+        self.scan_geometry_ = None
+        self.range_max_ = 3.5
+        # position_ stays the module's Point() until the first odometry message
+        self.odom_received_ = False
+        self.planner_ = None
+        self.controller_ = None
         #self.tfBuffer = tf2_ros.Buffer()
         #self.tfListener = tf2_ros.TransformListener(self.tfBuffer, self)
         
@@ -212,24 +230,31 @@ class AutoNav(Node):
         self.timer = self.create_timer(timer_period, self.timer_callback)
 
     def target_callback(self, msg):
-        global isTargetDetected, isDoneShooting, waypoint_dict,position
+        global isTargetDetected, isDoneShooting, waypoint_index, position
         # communicates with mission code to receive status updates
         if (msg.data == 'Detected'):
             isTargetDetected = True
             isDoneShooting = False            
             
-            ## To put temperature detected and waypoint in a dictionary
-            waypoint_dict[2] = position #make RPi send temp, replace 2 with that temp
+            ## Drop a heat waypoint, repeated reports of the same target merge into one
+            self.engaged_waypoint = waypoint_index.add(self.target_temperature, position, time.time())
             self.change_state('C')
             
         elif (msg.data == 'FINISHED SHOOTING'):
             isDoneShooting = True
             isTargetDetected = False
+            if self.engaged_waypoint is not None:
+                waypoint_index.mark_visited(self.engaged_waypoint)
+                self.engaged_waypoint = None
             self.change_state('D')
             
         else:
             isTargetDetected = False
 
+    def temperature_callback(self, msg):
+        # sent by the mission code just ahead of each 'Detected' status
+        self.target_temperature = msg.data
+
     def odom_callback(self, msg):
         global position
         orientation_quat = msg.pose.pose.orientation
@@ -616,6 +641,10 @@ class AutoNav(Node):
         global regions_
         # create numpy array
         self.laser_range = np.array(msg.ranges)
+        # the whole scan for the bug2 and tangent bug planners
+        self.scan_geometry_ = bug_planner.scan_geometry(
+            msg.ranges, msg.angle_min, msg.angle_increment, msg.range_max)
+        self.range_max_ = msg.range_max
         # obtain distance from wall from different directions of turtlebot
         # replace 0's with nan
         self.laser_range[self.laser_range == 0] = np.nan
@@ -642,6 +671,30 @@ class AutoNav(Node):
         self.desired_position_.x = x_coord
         self.desired_position_.y = y_coord
         self.desired_position_.z = z_coord
+        goal = (x_coord, y_coord)
+        if bug_planner_mode == 'bug2':
+            self.planner_ = bug_planner.Bug2((position_.x, position_.y), goal)
+        elif bug_planner_mode == 'tangent':
+            self.planner_ = bug_planner.TangentBug(goal)
+        else:
+            self.planner_ = None
+        # steers and drives at once, and logs the time and path of the run
+        self.controller_ = motion_control.GoToGoal(dist_precision_)
+        self.controller_.start(position_.x, position_.y, goal)
+
+    # point to steer for, the goal or with tangent bug the best obstacle edge
+    def heading_target(self, des_pos):
+        if isinstance(self.planner_, bug_planner.TangentBug):
+            return self.planner_.motion(self.scan_geometry_, position_.x, position_.y, yaw_, self.range_max_)
+        return (des_pos.x, des_pos.y)
+
+    # hand over to the wall follower
+    def follow_wall(self):
+        self.stopbot()
+        if self.planner_ is not None:
+            self.planner_.hit(position_.x, position_.y)
+        self.change_bug_switch(0)
+        self.bugWall()
     
     #subscribe to current position
     def clbk_odom(self, msg):
@@ -655,54 +708,63 @@ class AutoNav(Node):
             msg.pose.pose.orientation.z,
             msg.pose.pose.orientation.w)
         yaw_ = euler[2]
+        self.odom_received_ = True
+        if self.controller_ is not None:
+            self.controller_.track(position_.x, position_.y)
 
-    # rotate on the spot to fix yaw
+    # rotate on the spot until the target is close enough ahead to drive at
     def fix_yaw(self,des_pos):
-        global yaw_, pub, yaw_precision_, bug_state_
+        global yaw_, pub, bug_state_
         rclpy.spin_once(self)
+        target = self.heading_target(des_pos)
+        if target is None:
+            # no way forward along the obstacle edges
+            self.follow_wall()
+            return
         # compute desired yaw and difference with current yaw
-        desired_yaw = math.atan2(des_pos.y - position_.y, des_pos.x - position_.x)
-        err_yaw = desired_yaw - yaw_
+        desired_yaw = math.atan2(target[1] - position_.y, target[0] - position_.x)
+        err_yaw = self.normalize_angle(desired_yaw - yaw_)
         twist_msg = Twist()
-        if math.fabs(err_yaw) > yaw_precision_:
-            # turn counter-clockwise if deired yaw -ve
-            # turn clockwise if deired yaw +ve
-            twist_msg.angular.z = 0.3 if err_yaw > 0 else -0.3
+        twist_msg.angular.z = motion_control.clamp(
+            motion_control.heading_gain * err_yaw, -motion_control.max_turn, motion_control.max_turn)
         self.bug_publisher_.publish(twist_msg)
         # state change conditions
-        if math.fabs(err_yaw) <= yaw_precision_:
-            #print ('Yaw error: [%s]' % err_yaw)
+        if math.fabs(err_yaw) <= motion_control.drive_heading_error:
             self.change_bug_state(1)
     
-    #move forward
+    # drive and steer towards the target together, slowing down for the
+    # heading error, for obstacles ahead and near the goal
     def go_straight_ahead(self,des_pos):
-        global yaw_, pub, yaw_precision_, bug_state_, fd, bugSwitch
-        # compute desired yaw and difference with current yaw
-        desired_yaw = math.atan2(des_pos.y - position_.y, des_pos.x - position_.x)
-        err_yaw = desired_yaw - yaw_
-        # compute difference in position
-        err_pos = math.sqrt(pow(des_pos.y - position_.y, 2) + pow(des_pos.x - position_.x, 2))
-        if err_pos > dist_precision_ and bugSwitch: 
-            rclpy.spin_once(self)
-            # move forward
-            if self.front_dist > fd:
-                twist_msg = Twist()
-                twist_msg.linear.x = 0.2
-                self.bug_publisher_.publish(twist_msg)
-            # switch to wall following algorithm if obstacle is detected in front of turtlebot
-            elif self.front_dist < fd:
-                self.stopbot()
-                self.change_bug_switch(0)
-                self.bugWall()
-                
-        # if drifting off course, change state to fix yaw
-        if math.fabs(err_yaw) > yaw_precision_:
-            #print ('Yaw error: [%s]' % err_yaw)
-            self.change_bug_state(0)
+        global yaw_, pub, bug_state_, fd, bugSwitch
+        rclpy.spin_once(self)
         # if arrived at target waypoint, halt
-        if err_pos < dist_precision_:
+        if self.controller_.arrived(position_.x, position_.y):
             self.stopbot()
+            print('Bug algorithm - %s' % self.controller_.log.summary())
             self.change_bug_state(2)
+            return
+        target = self.heading_target(des_pos)
+        if target is None:
+            self.follow_wall()
+            return
+        # switch to wall following algorithm if obstacle is detected in front of turtlebot
+        if self.front_dist < fd:
+            self.follow_wall()
+            return
+        # compute desired yaw and difference with current yaw
+        desired_yaw = math.atan2(target[1] - position_.y, target[0] - position_.x)
+        err_yaw = self.normalize_angle(desired_yaw - yaw_)
+        # the target swung round behind the robot, turn on the spot first
+        if math.fabs(err_yaw) > motion_control.drive_heading_error:
+            self.change_bug_state(0)
+            return
+        # free distance straight ahead for the robot's footprint
+        clear = bug_planner.free_distance(*self.scan_geometry_, bearing=0.0, range_max=self.range_max_)
+        linear, angular = self.controller_.update(position_.x, position_.y, yaw_, clear, target)
+        twist_msg = Twist()
+        twist_msg.linear.x = linear
+        twist_msg.angular.z = angular
+        self.bug_publisher_.publish(twist_msg)
  
     #normalising yaw to angle
     def normalize_angle(self,angle):
@@ -712,6 +774,9 @@ class AutoNav(Node):
 
     def check_whether_to_switch(self):
             rclpy.spin_once(self)
+            if self.planner_ is not None:
+                return self.planner_.should_leave(
+                    self.scan_geometry_, position_.x, position_.y, yaw_, self.range_max_)
             desired_yaw = math.atan2(self.desired_position_.y - position_.y, self.desired_position_.x - position_.x)
             err_yaw = self.normalize_angle(desired_yaw - yaw_)
             # less than 30 degrees
@@ -759,23 +824,23 @@ class AutoNav(Node):
 
     # main bug algorithm logic block
     def start_bug(self):
-        global isArrived, waypoint_dict
+        global isArrived, waypoint_index
         #This part is commented out to allow bug algo to work in gazebo
         #uncommend this part once you are able to get the RPi to drop waypoints in real life
         
-        #des_waypoint = (float(waypoint_dict[max(waypoint_dict)][0]),
-        #               float(waypoint_dict[max(waypoint_dict)][1]),
-        #              float(waypoint_dict[max(waypoint_dict)][2]))
-        #getTarget(des_waypoint)
+        #des_waypoint = waypoint_index.hottest_unvisited()
+        #self.getTarget(*des_waypoint.position)
         
-        #This part is short circuited
-        self.getTarget(0.5,0.0,0.0)
         try:
-            #ensure we have lidar data before continuing
+            #ensure we have lidar data and a pose before continuing
             rclpy.spin_once(self)
             print("Acquiring lidar data")
-            while (self.laser_range.size == 0):    
+            # scan_callback fills laser_range too, the planners need bug_scan_callback
+            while (self.laser_range.size == 0 or self.scan_geometry_ is None or not self.odom_received_):
                 rclpy.spin_once(self)
+            # the M-line and the run log start from the real pose
+            #This part is short circuited
+            self.getTarget(0.5,0.0,0.0)
             #While not at the target waypoint
             while not isArrived:
                 if bug_state_ == 0: #rotate to fix heading
@@ -797,7 +862,7 @@ class AutoNav(Node):
         # Ctrl-c detected
         finally:
             # stop moving
-            print(waypoint_dict)
+            print(list(waypoint_index))
             self.stopbot()
             
 def main(args=None):
@@ -0,0 +1,170 @@
+"""
+Kinematic benchmark of the bug algorithm leave conditions
+
+Random fields of round obstacles between a start and a goal, a 360 beam
+LDS-01 like scan, and a robot driving at the wall follower's speed.  Motion
+to goal stops when the front is within fd, then the robot circles the
+obstacle keeping it on its left as the left wall follower does, until the
+planner's leave test passes.  Compared:
+
+- bug0: the region thresholds of AutoNav.check_whether_to_switch
+- bug2: bug_planner.Bug2, M-line leave
+- tangent: bug_planner.TangentBug, tangent point motion and leave
+
+    python3 bug_benchmark.py [worlds]
+"""
+
+import math
+import sys
+
+import numpy as np
+
+import bug_planner
+
+
+## Benchmark settings
+speed = 0.2 # metres per second, speedchange of the navigation code
+step = 0.02 # metres per control step
+fd = 0.3 # front distance that hands over to the wall follower
+wall_distance = 0.35 # distance the wall follower keeps from the wall, d
+range_max = 3.5
+max_path = 60.0 # metres driven before a run counts as failed
+start = (0.0, 0.0)
+goal = (6.0, 0.0)
+
+beam_angles = np.radians(np.arange(360))
+
+
+def random_world(seed, count=3):
+    """Non-overlapping (x, y, radius) circles near the M-line, clear of the start and goal"""
+    rng = np.random.RandomState(seed)
+    circles = []
+    while len(circles) < count:
+        x, y, radius = rng.uniform(1.0, 5.0), rng.uniform(-0.8, 0.8), rng.uniform(0.3, 0.8)
+        # room for the wall follower to pass between two obstacles
+        if any(math.hypot(x - cx, y - cy) < radius + cr + 1.0 for cx, cy, cr in circles):
+            if rng.uniform() < 0.05:
+                circles = []
+            continue
+        if min(math.hypot(x - px, y - py) for px, py in (start, goal)) < radius + 0.6:
+            continue
+        circles.append((x, y, radius))
+    return circles
+
+
+def scan(circles, x, y, yaw):
+    """Ranges of 360 one degree beams from the heading, anti-clockwise, 0 for no return"""
+    angles = yaw + beam_angles
+    cos, sin = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    centres = np.array(circles)
+    dx, dy, radius = centres[:, 0] - x, centres[:, 1] - y, centres[:, 2]
+    along = dx * cos + dy * sin
+    across = dx * sin - dy * cos
+    inside = radius ** 2 - across ** 2
+    hit = (along > 0) & (inside > 0)
+    distance = np.where(hit, along - np.sqrt(np.where(hit, inside, 0.0)), np.inf)
+    ranges = distance.min(axis=1)
+    ranges[ranges > range_max] = 0.0
+    return ranges
+
+
+def bug0_leave(ranges, x, y, yaw):
+    """The region test of AutoNav.check_whether_to_switch"""
+    laser_range = np.where(ranges == 0, np.nan, ranges)
+    def mean(sector):
+        return 100 if np.all(np.isnan(sector)) else float(np.nanmean(sector))
+    def least(sector):
+        return 10 if np.all(np.isnan(sector)) else min(float(np.nanmin(sector)), 10)
+    regions = {
+        'right': least(laser_range[265:276]),
+        'fright': min(mean(laser_range[313:318]), 10),
+        'front': min(mean(np.append(laser_range[354:359], laser_range[0:6])), 10),
+        'fleft': min(mean(laser_range[43:48]), 10),
+        'left': least(laser_range[85:96]),
+    }
+    err_yaw = math.atan2(goal[1] - y, goal[0] - x) - yaw
+    err_yaw = math.atan2(math.sin(err_yaw), math.cos(err_yaw))
+    if abs(err_yaw) < math.pi / 6 and \
+       regions['front'] > 1.5 and regions['fright'] > 1 and regions['fleft'] > 1:
+        return True
+    if math.pi / 6 < err_yaw < math.pi / 2 and regions['left'] > 1.5 and regions['fleft'] > 1:
+        return True
+    if -math.pi / 2 < err_yaw < -math.pi / 6 and regions['right'] > 1.5 and regions['fright'] > 1:
+        return True
+    return False
+
+
+def run(circles, planner_name):
+    x, y = start
+    yaw = math.atan2(goal[1] - y, goal[0] - x)
+    if planner_name == 'bug2':
+        planner = bug_planner.Bug2(start, goal)
+    elif planner_name == 'tangent':
+        planner = bug_planner.TangentBug(goal)
+    else:
+        planner = None
+    following = None # circle being followed, None in motion to goal
+    travelled = 0.0
+    while math.hypot(goal[0] - x, goal[1] - y) > step:
+        if travelled > max_path:
+            return None
+        ranges = scan(circles, x, y, yaw)
+        geometry = bug_planner.scan_geometry(ranges, 0.0, math.radians(1), range_max)
+        if following is not None:
+            if planner is None:
+                leave = bug0_leave(ranges, x, y, yaw)
+            else:
+                leave = planner.should_leave(geometry, x, y, yaw, range_max)
+            if leave:
+                following = None
+        if following is None:
+            target = goal
+            if planner_name == 'tangent':
+                target = planner.motion(geometry, x, y, yaw, range_max)
+            if target is not None:
+                heading = math.atan2(target[1] - y, target[0] - x)
+                front = bug_planner.free_distance(*geometry, bearing=heading - yaw, range_max=range_max)
+            if target is None or front < fd - bug_planner.robot_radius:
+                # hand over to the wall follower on the nearest obstacle
+                following = min(circles, key=lambda c: math.hypot(c[0] - x, c[1] - y) - c[2])
+                orbit = following[2] + wall_distance
+                if planner is not None:
+                    planner.hit(x, y)
+        if following is not None:
+            # keep the obstacle on the left, anti-clockwise around it
+            cx, cy, _ = following
+            angle = math.atan2(y - cy, x - cx) + step / orbit
+            heading = angle + math.pi / 2
+        nx, ny = x + step * math.cos(heading), y + step * math.sin(heading)
+        if following is not None:
+            nx, ny = cx + orbit * math.cos(angle), cy + orbit * math.sin(angle)
+        travelled += math.hypot(nx - x, ny - y)
+        if any(math.hypot(nx - cx, ny - cy) < cr + bug_planner.robot_radius / 2 for cx, cy, cr in circles):
+            raise RuntimeError('%s drove into an obstacle at (%.2f, %.2f)' % (planner_name, nx, ny))
+        x, y, yaw = nx, ny, heading
+    return travelled
+
+
+def benchmark(worlds=20):
+    planners = ('bug0', 'bug2', 'tangent')
+    results = {name: [] for name in planners}
+    for seed in range(worlds):
+        circles = random_world(seed)
+        for name in planners:
+            results[name].append(run(circles, name))
+    print('%-8s %8s %10s %10s' % ('planner', 'reached', 'mean m', 'mean s'))
+    for name in planners:
+        paths = [path for path in results[name] if path is not None]
+        mean = sum(paths) / len(paths) if paths else float('nan')
+        print('%-8s %5d/%-2d %10.2f %10.1f' % (name, len(paths), worlds, mean, mean / speed))
+    # worlds every planner finished, so the means compare like with like
+    common = [seed for seed in range(worlds) if all(results[name][seed] is not None for name in planners)]
+    if common:
+        print('over the %d worlds all planners reached:' % len(common))
+        for name in planners:
+            mean = sum(results[name][seed] for seed in common) / len(common)
+            print('  %-8s %6.2f m %6.1f s' % (name, mean, mean / speed))
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,173 @@
+"""
+Bug2 and tangent-bug decisions for the bug algorithm in navigation_w_bug.py
+
+The original leave test only looks at a few averaged lidar regions against
+fixed thresholds.  These planners reason over every beam of the scan at
+once with numpy: free_distances() gives how far the robot's footprint can
+drive along every beam direction before touching any scan point, one
+(bearings x beams) array per scan.
+
+Bug2 leaves the wall on the M-line, the straight line from the start to the
+goal, once it is closer to the goal than where it hit the obstacle.  Tangent
+bug drives along the clear heading minimising the distance driven plus the
+distance left, the local tangent graph, which takes it past obstacle edges
+instead of into them, and leaves the wall as soon as a clear heading
+reaches closer to the goal than anything reached along the wall.
+"""
+
+import math
+
+import numpy as np
+
+
+## Adjustable variables
+robot_radius = 0.12 # metres, turtlebot3 burger footprint
+clearance = 0.1 # extra room kept around obstacle edges
+mline_tolerance = 0.1 # distance from the M-line counted as on it
+leave_margin = 0.05 # progress towards the goal needed before leaving the wall
+leave_clearance = 0.6 # free distance towards the goal needed to leave the M-line
+min_clear = 0.3 # free distance a heading needs to be driven along, fd of the bug algorithm
+edge_jump = 0.3 # rise in free distance over a neighbouring heading marking an obstacle edge
+
+
+def scan_geometry(ranges, angle_min, angle_increment, range_max):
+    """
+    Beam ranges and angles of a LaserScan, relative to the robot's heading
+    beams without a return (0, nan, inf or beyond range_max) are set to
+    range_max and flagged in the returned free mask
+    """
+    ranges = np.asarray(ranges, dtype=float)
+    with np.errstate(invalid='ignore'):
+        free = ~np.isfinite(ranges) | (ranges <= 0) | (ranges >= range_max)
+    ranges = np.where(free, range_max, ranges)
+    angles = angle_min + np.arange(ranges.size) * angle_increment
+    return ranges, angles, free
+
+
+def free_distances(ranges, angles, free, bearings, range_max, width=robot_radius):
+    """
+    Distance the robot can drive along each bearing, relative to its
+    heading, before a scan point comes within width of its centre line
+    every bearing against every beam in one (bearings x beams) array
+    """
+    offset = angles[None, :] - np.asarray(bearings, dtype=float)[:, None]
+    along = ranges * np.cos(offset)
+    across = np.abs(ranges * np.sin(offset))
+    blocking = ~free & (along > 0) & (across < width)
+    distance = np.where(blocking, along - width, range_max).min(axis=1)
+    return np.clip(distance, 0.0, range_max)
+
+
+def free_distance(ranges, angles, free, bearing, range_max, width=robot_radius):
+    """free_distances() along a single bearing"""
+    return float(free_distances(ranges, angles, free, [bearing], range_max, width)[0])
+
+
+def goal_in_robot_frame(x, y, yaw, goal):
+    dx, dy = goal[0] - x, goal[1] - y
+    return (dx * math.cos(yaw) + dy * math.sin(yaw),
+            -dx * math.sin(yaw) + dy * math.cos(yaw))
+
+
+class TangentBug:
+    """
+    Tangent bug over one goal
+    motion to goal drives along the clear heading whose end point gives
+    the least distance driven plus distance left, which skirts the edges
+    of obstacles; it hands over to the wall follower once that distance
+    stops falling
+    """
+    def __init__(self, goal):
+        self.goal = goal
+        self.best_heuristic = math.inf
+        self.followed_distance = math.inf
+
+    def candidates(self, scan, x, y, yaw, range_max):
+        """
+        End points, robot frame, of the headings of the local tangent graph:
+        headings clear all the way, to the goal or to the edge of the scan,
+        and headings skirting an obstacle edge, whose clear distance jumps
+        past a neighbour's, each driven until blocked or level with the goal
+        returns the end points and their distances to the goal
+        """
+        ranges, angles, free = scan
+        gx, gy = goal_in_robot_frame(x, y, yaw, self.goal)
+        goal_distance = math.hypot(gx, gy)
+        bearings = np.append(angles, math.atan2(gy, gx))
+        clear = free_distances(ranges, angles, free, bearings, range_max, robot_radius + clearance)
+        beams = clear[:-1]
+        # beams wrap around the robot, the goal heading has no neighbours
+        neighbour = np.minimum(np.roll(beams, 1), np.roll(beams, -1))
+        skirting = np.append(beams - neighbour > edge_jump, False)
+        unblocked = clear >= min(goal_distance, range_max) - 1e-6
+        usable = (unblocked | skirting) & (clear >= min(min_clear, goal_distance))
+        reach = np.minimum(clear, goal_distance)[usable]
+        bearings = bearings[usable]
+        points = np.stack([reach * np.cos(bearings), reach * np.sin(bearings)], axis=1)
+        return points, np.hypot(points[:, 0] - gx, points[:, 1] - gy)
+
+    def motion(self, scan, x, y, yaw, range_max):
+        """
+        World point to head for in motion to goal, or None once the robot
+        is at a local minimum of the heuristic and should follow the wall
+        """
+        points, to_goal = self.candidates(scan, x, y, yaw, range_max)
+        if not len(points):
+            return None
+        heuristic = np.hypot(points[:, 0], points[:, 1]) + to_goal
+        best = int(np.argmin(heuristic))
+        # the distance driven so far plus the best estimate left cannot go up
+        # while the obstacle is being skirted, a rise means a dead end
+        estimate = float(heuristic[best])
+        if estimate > self.best_heuristic + leave_margin:
+            return None
+        self.best_heuristic = min(self.best_heuristic, estimate)
+        px, py = points[best]
+        return (x + px * math.cos(yaw) - py * math.sin(yaw),
+                y + px * math.sin(yaw) + py * math.cos(yaw))
+
+    def hit(self, x, y):
+        """Record where the wall following began"""
+        self.followed_distance = math.hypot(self.goal[0] - x, self.goal[1] - y)
+
+    def should_leave(self, scan, x, y, yaw, range_max):
+        """
+        While following the wall, leave once a clear heading reaches closer
+        to the goal than the robot has been along the wall
+        """
+        distance = math.hypot(self.goal[0] - x, self.goal[1] - y)
+        self.followed_distance = min(self.followed_distance, distance)
+        _, to_goal = self.candidates(scan, x, y, yaw, range_max)
+        if len(to_goal) and to_goal.min() < self.followed_distance - leave_margin:
+            self.best_heuristic = math.inf
+            return True
+        return False
+
+
+class Bug2:
+    """Bug2 over the M-line from start to goal"""
+    def __init__(self, start, goal):
+        self.start = start
+        self.goal = goal
+        self.hit_distance = math.inf
+
+    def hit(self, x, y):
+        """Record where the wall following began"""
+        self.hit_distance = math.hypot(self.goal[0] - x, self.goal[1] - y)
+
+    def on_mline(self, x, y):
+        sx, sy = self.start
+        gx, gy = self.goal
+        length = math.hypot(gx - sx, gy - sy)
+        if length == 0:
+            return True
+        return abs((gx - sx) * (sy - y) - (sx - x) * (gy - sy)) / length < mline_tolerance
+
+    def should_leave(self, scan, x, y, yaw, range_max):
+        distance = math.hypot(self.goal[0] - x, self.goal[1] - y)
+        if distance >= self.hit_distance - leave_margin or not self.on_mline(x, y):
+            return False
+        ranges, angles, free = scan
+        gx, gy = goal_in_robot_frame(x, y, yaw, self.goal)
+        clear = free_distance(ranges, angles, free, math.atan2(gy, gx), range_max)
+        return clear >= min(distance, leave_clearance)
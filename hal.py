@@ -0,0 +1,340 @@
+"""
+Hardware abstraction layer for mission.py
+
+The real backend drives RPi.GPIO, pigpio and the shared I2C bus on the
+Raspberry Pi.  The simulated backend runs mission.py end to end on any
+Linux box with ROS 2: a virtual robot follows a route to the loading bay
+and then obeys cmd_vel, the thermal camera sees a synthetic hot target,
+the PN532 emulator finds a tag inside the loading zone, the loading
+button is pressed by a virtual operator, and servo/motor commands are
+recorded.
+
+Select the backend with MISSION_HARDWARE=sim (default: real), with the
+pn532 package on the path:
+
+    PYTHONPATH=RPi_Files/Modular_Codes/nfc MISSION_HARDWARE=sim python3 mission.py
+"""
+
+import math
+import os
+import threading
+import time
+
+from rclpy.node import Node
+from geometry_msgs.msg import Twist, Pose
+from nav_msgs.msg import Odometry, OccupancyGrid
+from sensor_msgs.msg import LaserScan
+
+from pn532.irq import FakeGPIO
+from pn532.bus import I2CBusScheduler, FakeI2CBus, FakeAMG8833, AMG8833_ADDRESS
+from pn532.i2c import I2C_ADDRESS
+from pn532.emulator import PN532Emulator, EmulatedI2CDevice
+
+
+## Simulated world, distances in metres and angles in radians
+sim_route = [(1.5, 0.0)] # waypoints driven from the origin to the loading bay
+sim_route_speed = 0.2 # speed along the route, as the wall follower would drive
+sim_loading_zone = (1.5, 0.0, 0.15) # x, y and radius of the NFC tag zone
+sim_target = (2.0, -1.0, 0.15) # x, y and radius of the hot target, passed on the right
+sim_target_temp = 40.0
+sim_ambient_temp = 22.0
+sim_press_delay = 2.0 # seconds the virtual operator takes to load the balls
+sim_update_period = 0.05 # odometry and scan period
+sim_scan_range = 3.5 # LDS-01 maximum range
+sim_map_bounds = (-1.0, -3.0, 4.0, 2.0) # x and y of the lower left and upper right map corners
+sim_map_resolution = 0.05 # cartographer's default cell size
+sim_map_period = 1.0 # cartographer publishes the map about once a second
+amg_field_of_view = math.radians(60)
+
+
+## Real backend
+
+class PigpioServo:
+    """Servo outputs through the pigpio daemon"""
+    def __init__(self):
+        import pigpio
+        self._pi = pigpio.pi()
+        self._output = pigpio.OUTPUT
+
+    def setup(self, pin, frequency=50):
+        self._pi.set_mode(pin, self._output)
+        self._pi.set_PWM_frequency(pin, frequency)
+
+    def pulsewidth(self, pin, width):
+        self._pi.set_servo_pulsewidth(pin, width)
+
+
+class Hardware:
+    """
+    The devices mission.py drives: the GPIO module, the servo, and the
+    scheduled I2C bus shared by the thermal camera and the PN532
+    """
+    def __init__(self, gpio, servo, i2c_bus, world=None):
+        self.gpio = gpio
+        self.servo = servo
+        self.i2c_bus = i2c_bus
+        self.world = world
+
+    @property
+    def simulated(self):
+        return self.world is not None
+
+    def attach_button(self, indicator_pin, button_pin):
+        # the virtual operator presses button_pin once indicator_pin lights up
+        if self.world is not None:
+            self.gpio.press_on(indicator_pin, button_pin, sim_press_delay)
+
+    def ros_nodes(self):
+        """Extra nodes to spin alongside the mission, call after rclpy.init"""
+        return [SimulatedRobot(self.world)] if self.world is not None else []
+
+    def report(self):
+        """Summary of the recorded actuator commands"""
+        if self.world is None:
+            return ''
+        lines = ['servo: %s' % ', '.join('%d us' % width for _, _, width in self.servo.commands)]
+        for pin, changes in sorted(self.gpio.history.items()):
+            lines.append('gpio %d: %s' % (pin, ', '.join(
+                '%d at %.1f s' % (level, stamp - self.world.started) for stamp, level in changes)))
+        x, y, yaw = self.world.pose
+        lines.append('robot at (%.2f, %.2f), yaw %.1f deg, %.2f m from target' % (
+            x, y, math.degrees(yaw), self.world.target_distance()))
+        return '\n'.join(lines)
+
+
+def real_hardware():
+    import RPi.GPIO as GPIO
+    return Hardware(GPIO, PigpioServo(), I2CBusScheduler())
+
+
+## Simulated backend
+
+class RecordingServo:
+    """Records (time, pin, pulse width) for every servo command"""
+    def __init__(self):
+        self.commands = []
+
+    def setup(self, pin, frequency=50):
+        pass
+
+    def pulsewidth(self, pin, width):
+        self.commands.append((time.monotonic(), pin, width))
+
+
+class SimulatedGPIO(FakeGPIO):
+    """FakeGPIO recording every output change, with a virtual operator"""
+    def __init__(self):
+        super().__init__()
+        self.history = {}
+        self._presses = {}
+
+    def output(self, pin, level):
+        level = int(bool(level))
+        if self.levels.get(pin) != level:
+            self.history.setdefault(pin, []).append((time.monotonic(), level))
+        super().output(pin, level)
+        if level and pin in self._presses:
+            button_pin, delay = self._presses[pin]
+            threading.Timer(delay, self._press, (button_pin,)).start()
+
+    def _press(self, pin):
+        self.set_input(pin, self.HIGH)
+        time.sleep(0.1)
+        self.set_input(pin, self.LOW)
+
+    def press_on(self, indicator_pin, button_pin, delay):
+        self._presses[indicator_pin] = (button_pin, delay)
+
+
+def wrap_angle(angle):
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+class SimulatedWorld:
+    """
+    Pose of the virtual robot and what its sensors see from there
+    the robot drives the route on its own, then integrates cmd_vel
+    """
+    def __init__(self, camera_offset, chip):
+        self.camera_offset = camera_offset
+        self.chip = chip
+        self.pose = (0.0, 0.0, 0.0)
+        self.route = list(sim_route)
+        self.velocity = (0.0, 0.0)
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self.step(0.0)
+
+    def step(self, dt):
+        with self._lock:
+            x, y, yaw = self.pose
+            if self.route:
+                # head straight for the next waypoint
+                wx, wy = self.route[0]
+                distance = math.hypot(wx - x, wy - y)
+                travel = sim_route_speed * dt
+                if travel >= distance:
+                    x, y = wx, wy
+                    self.route.pop(0)
+                else:
+                    yaw = math.atan2(wy - y, wx - x)
+                    x += travel * math.cos(yaw)
+                    y += travel * math.sin(yaw)
+            else:
+                linear, angular = self.velocity
+                yaw = wrap_angle(yaw + angular * dt)
+                x += linear * dt * math.cos(yaw)
+                y += linear * dt * math.sin(yaw)
+            self.pose = (x, y, yaw)
+        zx, zy, radius = sim_loading_zone
+        self.chip.tag_present = math.hypot(zx - x, zy - y) <= radius
+
+    def target_distance(self):
+        x, y, _ = self.pose
+        tx, ty, radius = sim_target
+        return math.hypot(tx - x, ty - y) - radius
+
+    def thermal_frame(self):
+        """8x8 temperatures, the target a blob spread over its angular size"""
+        x, y, yaw = self.pose
+        tx, ty, radius = sim_target
+        distance = math.hypot(tx - x, ty - y)
+        # bearing from the camera axis, positive to the left
+        bearing = wrap_angle(math.atan2(ty - y, tx - x) - (yaw - self.camera_offset))
+        column_width = amg_field_of_view / 8
+        # the AMG8833 optics blur a point source over about a pixel
+        spread = max(math.atan2(radius, distance), column_width)
+        row = []
+        for column in range(8):
+            offset = bearing - (3.5 - column) * column_width
+            if abs(bearing) > amg_field_of_view / 2 + spread:
+                row.append(sim_ambient_temp)
+            else:
+                heat = math.exp(-0.5 * (offset / spread) ** 2)
+                row.append(sim_ambient_temp + (sim_target_temp - sim_ambient_temp) * heat)
+        ambient = [sim_ambient_temp] * 8
+        return [ambient] * 2 + [row] * 4 + [ambient] * 2
+
+    def ranges(self):
+        """360 one-degree lidar ranges from the front, anti-clockwise, 0 for no return"""
+        x, y, yaw = self.pose
+        tx, ty, radius = sim_target
+        dx, dy = tx - x, ty - y
+        ranges = [0.0] * 360
+        for index in range(360):
+            angle = yaw + math.radians(index)
+            # nearest intersection of the beam with the target circle
+            along = dx * math.cos(angle) + dy * math.sin(angle)
+            across = dx * math.sin(angle) - dy * math.cos(angle)
+            if along > 0 and abs(across) < radius:
+                hit = along - math.sqrt(radius ** 2 - across ** 2)
+                if hit < sim_scan_range:
+                    ranges[index] = hit
+        return ranges
+
+
+    def occupancy(self):
+        """Occupancy grid of the target, row-major from the lower left corner"""
+        min_x, min_y, max_x, max_y = sim_map_bounds
+        width = int(round((max_x - min_x) / sim_map_resolution))
+        height = int(round((max_y - min_y) / sim_map_resolution))
+        tx, ty, radius = sim_target
+        data = []
+        for row in range(height):
+            y = min_y + (row + 0.5) * sim_map_resolution
+            for column in range(width):
+                x = min_x + (column + 0.5) * sim_map_resolution
+                data.append(100 if math.hypot(tx - x, ty - y) <= radius else 0)
+        return width, height, data
+
+
+class SimulatedCamera(FakeAMG8833):
+    """FakeAMG8833 whose pixel registers show the world from the robot's pose"""
+    def __init__(self, world):
+        super().__init__()
+        self.world = world
+
+    def read(self, count):
+        if self._pointer == 0x80:
+            self.set_frame(self.world.thermal_frame())
+        return super().read(count)
+
+
+class SimulatedRobot(Node):
+    """
+    Turtlebot stand-in: takes cmd_vel, publishes odom and scan, and stands
+    in for cartographer and the navigation code with map and /map2base
+    the map frame is the odom frame, the simulated odometry does not drift
+    """
+    def __init__(self, world):
+        super().__init__('simulated_robot')
+        self.world = world
+        self.create_subscription(Twist, 'cmd_vel', self.cmd_vel_callback, 10)
+        self.odom_publisher = self.create_publisher(Odometry, 'odom', 10)
+        self.scan_publisher = self.create_publisher(LaserScan, 'scan', 10)
+        self.map_publisher = self.create_publisher(OccupancyGrid, 'map', 10)
+        self.pose_publisher = self.create_publisher(Pose, '/map2base', 10)
+        self.create_timer(sim_update_period, self.update)
+        self.create_timer(sim_map_period, self.publish_map)
+        self.map = OccupancyGrid()
+        self.map.header.frame_id = 'map'
+        self.map.info.resolution = sim_map_resolution
+        self.map.info.width, self.map.info.height, self.map.data = world.occupancy()
+        self.map.info.origin.position.x, self.map.info.origin.position.y = sim_map_bounds[:2]
+        self.last_update = time.monotonic()
+
+    def cmd_vel_callback(self, msg):
+        self.world.velocity = (msg.linear.x, msg.angular.z)
+
+    def update(self):
+        now = time.monotonic()
+        self.world.step(now - self.last_update)
+        self.last_update = now
+        x, y, yaw = self.world.pose
+        stamp = self.get_clock().now().to_msg()
+
+        odom = Odometry()
+        odom.header.stamp = stamp
+        odom.header.frame_id = 'odom'
+        odom.pose.pose.position.x = x
+        odom.pose.pose.position.y = y
+        odom.pose.pose.orientation.z = math.sin(yaw / 2)
+        odom.pose.pose.orientation.w = math.cos(yaw / 2)
+        self.odom_publisher.publish(odom)
+        self.pose_publisher.publish(odom.pose.pose)
+
+        scan = LaserScan()
+        scan.header.stamp = stamp
+        scan.header.frame_id = 'base_scan'
+        scan.angle_min = 0.0
+        scan.angle_max = 2 * math.pi
+        scan.angle_increment = math.radians(1)
+        scan.range_min = 0.12
+        scan.range_max = sim_scan_range
+        scan.ranges = self.world.ranges()
+        self.scan_publisher.publish(scan)
+
+    def publish_map(self):
+        self.map.header.stamp = self.get_clock().now().to_msg()
+        self.map_publisher.publish(self.map)
+
+
+def simulated_hardware(camera_offset):
+    chip = PN532Emulator(latency=0.002)
+    world = SimulatedWorld(camera_offset, chip)
+    bus = FakeI2CBus({
+        AMG8833_ADDRESS: SimulatedCamera(world),
+        I2C_ADDRESS: EmulatedI2CDevice(chip, bus_hz=0),
+    })
+    return Hardware(SimulatedGPIO(), RecordingServo(), I2CBusScheduler(bus), world)
+
+
+def create(camera_offset):
+    """
+    Return the hardware selected by MISSION_HARDWARE, 'sim' or 'real'
+    camera_offset is how far clockwise of the robot's front the thermal
+    camera points, in radians
+    """
+    if os.environ.get('MISSION_HARDWARE', 'real') == 'sim':
+        return simulated_hardware(camera_offset)
+    return real_hardware()
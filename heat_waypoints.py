@@ -0,0 +1,174 @@
+"""
+Heat-signature waypoint index for the navigation code
+
+The RPi reports the temperature of every hot target it detects and the
+navigation node drops a waypoint at the robot's position.  Repeated reports
+of the same target, from the mission code's 2 Hz status messages or from a
+second pass along the wall, land within merge_radius of each other and are
+merged into one waypoint through a grid hash, so the index holds one entry
+per physical target however often it is seen.
+
+    index = HeatWaypointIndex()
+    index.add(temperature, (x, y, z), time.monotonic())
+    waypoint = index.hottest_unvisited()   # target to engage next
+    index.mark_visited(waypoint)
+"""
+
+import heapq
+import itertools
+import math
+
+
+## Adjustable variables
+merge_radius = 0.3 # observations closer than this, in metres, are the same target
+
+
+class HeatWaypoint:
+    """One hot target, its position averaged over the merged observations"""
+    __slots__ = ('id', 'temperature', 'position', 'timestamp', 'count', 'visited', 'cell')
+
+    def __init__(self, id, temperature, position, timestamp):
+        self.id = id
+        self.temperature = temperature
+        self.position = tuple(position)
+        self.timestamp = timestamp
+        self.count = 1
+        self.visited = False
+        self.cell = None
+
+    def __repr__(self):
+        return 'HeatWaypoint(%d, %.1f C at (%.2f, %.2f), %d observations%s)' % (
+            self.id, self.temperature, self.position[0], self.position[1], self.count,
+            ', visited' if self.visited else '')
+
+
+class HeatWaypointIndex:
+    """
+    Hot targets keyed by a grid hash of their position, with a max-heap on
+    temperature
+    each grid cell is merge_radius wide, so a merge only has to look at the
+    3x3 cells around an observation
+    heap entries go stale when a waypoint heats up or is visited, they are
+    dropped lazily when they reach the top
+    """
+    def __init__(self, radius=merge_radius):
+        self.radius = radius
+        self.waypoints = {}
+        self._cells = {}
+        self._heap = []
+        self._bounds = None # min and max occupied cell, x then y
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.waypoints)
+
+    def __iter__(self):
+        return iter(self.waypoints.values())
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.radius), math.floor(y / self.radius))
+
+    def _neighbours(self, cell, ring=1):
+        cx, cy = cell
+        for ix in range(cx - ring, cx + ring + 1):
+            for iy in range(cy - ring, cy + ring + 1):
+                # only the border of the ring, the inside was searched already
+                if ring and max(abs(ix - cx), abs(iy - cy)) != ring:
+                    continue
+                for waypoint in self._cells.get((ix, iy), ()):
+                    yield waypoint
+
+    def _push(self, waypoint):
+        heapq.heappush(self._heap, (-waypoint.temperature, waypoint.id))
+
+    def _move(self, waypoint):
+        cell = self._cell(*waypoint.position[:2])
+        if cell == waypoint.cell:
+            return
+        if waypoint.cell is not None:
+            self._cells[waypoint.cell].remove(waypoint)
+            if not self._cells[waypoint.cell]:
+                del self._cells[waypoint.cell]
+        self._cells.setdefault(cell, []).append(waypoint)
+        waypoint.cell = cell
+        if self._bounds is None:
+            self._bounds = cell + cell
+        else:
+            min_x, min_y, max_x, max_y = self._bounds
+            self._bounds = (min(min_x, cell[0]), min(min_y, cell[1]),
+                            max(max_x, cell[0]), max(max_y, cell[1]))
+
+    def add(self, temperature, position, timestamp):
+        """
+        Record a hot observation at position (x, y[, z]) and return its waypoint
+        an observation within radius of a known target is merged into it,
+        keeping the hottest temperature and the mean position
+        """
+        x, y = position[0], position[1]
+        nearest, nearest_distance = None, self.radius
+        cell = self._cell(x, y)
+        for waypoint in itertools.chain(self._neighbours(cell, 0), self._neighbours(cell, 1)):
+            distance = math.hypot(waypoint.position[0] - x, waypoint.position[1] - y)
+            if distance <= nearest_distance:
+                nearest, nearest_distance = waypoint, distance
+
+        if nearest is None:
+            waypoint = HeatWaypoint(next(self._ids), temperature, position, timestamp)
+            self.waypoints[waypoint.id] = waypoint
+            self._move(waypoint)
+            self._push(waypoint)
+            return waypoint
+
+        waypoint = nearest
+        waypoint.count += 1
+        weight = 1.0 / waypoint.count
+        waypoint.position = tuple(old + (new - old) * weight
+                                  for old, new in zip(waypoint.position, position))
+        waypoint.timestamp = max(waypoint.timestamp, timestamp)
+        self._move(waypoint)
+        if temperature > waypoint.temperature:
+            waypoint.temperature = temperature
+            if not waypoint.visited:
+                self._push(waypoint)
+        return waypoint
+
+    def hottest_unvisited(self):
+        """The hottest target not yet engaged, or None"""
+        heap = self._heap
+        while heap:
+            negative_temperature, id = heap[0]
+            waypoint = self.waypoints.get(id)
+            if waypoint is not None and not waypoint.visited and \
+               waypoint.temperature == -negative_temperature:
+                return waypoint
+            heapq.heappop(heap)
+        return None
+
+    def nearest(self, x, y, unvisited=True):
+        """
+        The target closest to (x, y), or None
+        the grid is searched in rings outwards from (x, y), stopping once
+        the next ring cannot hold anything closer than the best found
+        """
+        if not self.waypoints:
+            return None
+        cell = self._cell(x, y)
+        min_x, min_y, max_x, max_y = self._bounds
+        # no occupied cell lies beyond this ring
+        last_ring = max(cell[0] - min_x, max_x - cell[0], cell[1] - min_y, max_y - cell[1])
+        best, best_distance = None, math.inf
+        for ring in range(last_ring + 1):
+            # everything in this ring or further out is at least this far away
+            if (ring - 1) * self.radius >= best_distance:
+                break
+            for waypoint in self._neighbours(cell, ring):
+                if unvisited and waypoint.visited:
+                    continue
+                distance = math.hypot(waypoint.position[0] - x, waypoint.position[1] - y)
+                if distance < best_distance:
+                    best, best_distance = waypoint, distance
+        return best
+
+    def mark_visited(self, waypoint):
+        """Engaged, hottest_unvisited and nearest skip it from now on"""
+        waypoint.visited = True
@@ -1,30 +1,32 @@
 import time
+import threading
 
-## import thermal sensor requirements
-import busio
-import board
-import adafruit_amg88xx
+## import hardware abstraction, real or simulated motor, servo, button and sensors
+import hal
 
-## import motor requirements
-import RPi.GPIO as GPIO
+## import the heat layer projected onto the cartographer map
+import thermal_map
 
-## import NFC requirements
+## import NFC and thermal sensor requirements, both share one scheduled I2C bus
 from pn532 import *
-
-## import servo requirements
-import pigpio
+from pn532.bus import AMG8833_ADDRESS
+from pn532.i2c import I2C_ADDRESS
 
 ## import ros requirements
 import numpy as np
 import rclpy
 from rclpy.node import Node
-from std_msgs.msg import String
+from std_msgs.msg import String, Float64
 from geometry_msgs.msg import Twist, Pose
 from rclpy.qos import qos_profile_sensor_data
 from sensor_msgs.msg import LaserScan
-from nav_msgs.msg import Odometry
+from nav_msgs.msg import Odometry, OccupancyGrid
 import math
 import cmath
+import collections
+import concurrent.futures
+import json
+from rclpy.executors import SingleThreadedExecutor
 
 ## constants
 isDoneLoading = False
@@ -39,52 +41,375 @@ firing_threshold = 35.0
 # offset angle for ir (0:0 / 45:31 / 90:69)
 ir_offset = 31
 
+## Adjustable variables to calibrate target centering
+centre_column = 3.5 # midpoint between column 3 and 4 of the 8x8 array
+centre_kp = 0.25 # angular speed per column of error
+centre_ki = 0.05 # removes steady offset when the robot stalls near the deadband
+centre_tolerance = 0.5 # columns of error accepted as centred
+centre_settle_frames = 3 # consecutive centred frames before stopping
+centre_blob_band = 1.5 # pixels within this many degrees of the max form the hot blob
+centre_timeout = 15.0 # seconds before giving up on centering
+amg_frame_period = 0.1 # AMG8833 updates at 10 Hz
+amg_degrees_per_column = 7.5 # 60 degree field of view over 8 columns
+
+## Adjustable variables to calibrate target approach
+approach_kp = 1.5 # angular speed per radian of heading error
+approach_slow_zone = 0.5 # metres before the firing distance where speed ramps down
+approach_min_speed_fraction = 0.25 # fraction of speedchange kept inside the slow zone
+approach_max_heading_error = math.radians(20) # turn on the spot beyond this error
+approach_heading_tolerance = math.radians(2) # heading error accepted before firing
+approach_edge_margin = 0.5 # ignore blobs clipped by the frame edges
+approach_timeout = 30.0 # seconds before giving up on the approach
+
+## NFC detection
+nfc_irq_pin = None # BCM pin wired to the PN532 IRQ line, None polls the status byte
+nfc_wait_period = 0.1 # seconds to wait for a card between ROS spins
+
+## Loading confirmation button
+button_bouncetime = 200 # ms of contact bounce ignored after a press
+button_wait_period = 0.1 # longest ROS spin between checks of the button
+loading_timeout = None # seconds to wait for the operator, None waits indefinitely
+loading_clear_delay = 3.0 # seconds to let the operator clear the robot after loading
+
+## Concurrent mission
+sighting_cache_size = 20 # hot sightings kept while searching for the loading bay
+sighting_spacing = 0.05 # metres moved, or radians turned, between cached sightings
+sighting_min_spread = math.radians(3) # bearing spread needed to triangulate the target
+sighting_range = 1.0 # metres assumed to a target seen from a single pose
+spin_period = 0.05 # seconds between checks of the robot state while ROS spins in the background
+thermal_map_period = 1.0 # seconds between publishes of the heat layer
+thermal_frame_timeout = 1.0 # seconds without a new thermal frame before the camera is reported lost
+thermal_retry_delay = 0.1 # seconds before re-reading the camera after a bus error, doubling per failure
+thermal_retry_max_delay = 2.0 # longest wait between re-reads of a failing camera
+
+## Startup
+init_attempts = 3 # tries per device before reporting it missing
+init_retry_delay = 0.2 # seconds before the first retry, doubling per retry
+init_retry_max_delay = 1.0 # longest wait between retries
+require_all_devices = True # refuse to start the mission with a device missing
+
 ## messages sent
 NFC_found_msg = 'LOADING ZONE'
 load_finish_msg = 'FINISH LOADING'
 target_status = 'Not detected'
+target_temperature = 0.0 # hottest pixel of the detected target, sent with target_status
 target_detected_msg = 'Detected'
 finish_shooting_msg = "FINISHED SHOOTING"
 
-## INITIALISE IR SENSOR
-try:
-    i2c = busio.I2C(board.SCL, board.SDA)
-    amg = adafruit_amg88xx.AMG88XX(i2c)
-except:
-    print('Please check wiring of IR sensor')
-
-## INITIALISE NFC SENSOR
-try:
-    pn532 = PN532_I2C(debug=False, reset=4, req=17)
-    pn532.SAM_configuration()
-except:
-    print('Please check wiring of NFC sensor')
-
-## Set up Thermal Camera
-i2c = busio.I2C(board.SCL, board.SDA)
-amg = adafruit_amg88xx.AMG88XX(i2c)
-
-## Set up servo
+## INITIALISE HARDWARE, MISSION_HARDWARE=sim runs against the simulator
+hardware = hal.create(math.radians(ir_offset))
+GPIO = hardware.gpio
+
+## INITIALISE I2C BUS
+# the scheduler serialises the two sensors, thermal frames first and at a reserved rate
+i2c_bus = hardware.i2c_bus
+
+## Pins
 servo_pin = 14
-servo = pigpio.pi()
-servo.set_mode(servo_pin, pigpio.OUTPUT)
-servo.set_PWM_frequency(servo_pin,50)
-servo.set_servo_pulsewidth(servo_pin, 500)
-
-## Set up motor
-GPIO.setmode(GPIO.BCM)
-GPIO.setwarnings(False) # Ignore warning for now
 motor_pin1 = 13
 motor_pin2 = 19
-GPIO.setup(motor_pin1, GPIO.OUT)
-GPIO.setup(motor_pin2, GPIO.OUT)
-
-## Set up button
 button_pin_out = 23
 button_pin_in = 24
-GPIO.setup(button_pin_out, GPIO.OUT)
-GPIO.setup(button_pin_in, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-# Set pin 10 to be an input pin and set initial value to be pulled low (off)
+button_pressed = threading.Event()
+
+def button_callback(channel):
+    # bouncetime drops the repeat edges, a glitch already low again is ignored
+    if GPIO.input(channel) == GPIO.HIGH:
+        button_pressed.set()
+
+
+## Device initialisation, each device independent of the others
+
+def init_thermal():
+    return AMG8833(i2c_bus.client('amg8833', AMG8833_ADDRESS, PRIORITY_HIGH,
+                                  period=amg_frame_period))
+
+def init_nfc():
+    nfc = PN532_I2C(debug=False, reset=4, req=17, irq=nfc_irq_pin,
+                    i2c=i2c_bus.client('pn532', I2C_ADDRESS, PRIORITY_NORMAL))
+    nfc.SAM_configuration()
+    return nfc
+
+def init_servo():
+    servo = hardware.servo
+    servo.setup(servo_pin, 50)
+    servo.pulsewidth(servo_pin, 500)
+    return servo
+
+def init_gpio():
+    ## Set up motor
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False) # Ignore warning for now
+    GPIO.setup(motor_pin1, GPIO.OUT)
+    GPIO.setup(motor_pin2, GPIO.OUT)
+    ## Set up button
+    GPIO.setup(button_pin_out, GPIO.OUT)
+    GPIO.setup(button_pin_in, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+    # Set pin 10 to be an input pin and set initial value to be pulled low (off)
+    GPIO.add_event_detect(button_pin_in, GPIO.RISING, callback=button_callback,
+                          bouncetime=button_bouncetime)
+    hardware.attach_button(button_pin_out, button_pin_in)
+    return GPIO
+
+
+class DeviceStartup:
+    """
+    Initialises independent devices concurrently, retrying each failed
+    attempt after a bounded, growing delay
+    the outcome per device is kept for the health topic
+    """
+    def __init__(self, attempts=init_attempts, backoff=None):
+        self.attempts = attempts
+        self.backoff = backoff if backoff is not None else Backoff(
+            tight_polls=0, initial=init_retry_delay, maximum=init_retry_max_delay)
+        self.devices = {}
+        self.health = {}
+        self.elapsed = 0.0
+
+    def _init(self, name, init):
+        start_time = time.monotonic()
+        error = None
+        for attempt, delay in zip(range(1, self.attempts + 1), self.backoff):
+            try:
+                self.devices[name] = init()
+                break
+            except Exception as err: # any driver or bus error means the device is not there
+                error = '%s: %s' % (type(err).__name__, err)
+                if attempt < self.attempts:
+                    time.sleep(delay)
+        elapsed = time.monotonic() - start_time
+        ready = name in self.devices
+        self.health[name] = {'ready': ready, 'seconds': round(elapsed, 3),
+                             'attempts': attempt, 'error': None if ready else error}
+        if ready:
+            print('Mission - [0] - %s ready in %.2f s (%d attempts)' % (name, elapsed, attempt))
+        else:
+            print('Mission - [0] - %s NOT READY after %d attempts: %s' % (name, attempt, error))
+
+    def run(self, inits):
+        start_time = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(inits)) as pool:
+            for name, init in inits.items():
+                pool.submit(self._init, name, init)
+        self.elapsed = time.monotonic() - start_time
+        print('Mission - [0] - Hardware initialised in %.2f s, missing: %s' % (
+            self.elapsed, ', '.join(self.missing) or 'none'))
+
+    @property
+    def missing(self):
+        return sorted(name for name, health in self.health.items() if not health['ready'])
+
+    @property
+    def ready(self):
+        return not self.missing
+
+    def summary(self):
+        """JSON readiness summary published on the health topic"""
+        return json.dumps({'ready': self.ready, 'seconds': round(self.elapsed, 3),
+                           'devices': self.health}, sort_keys=True)
+
+
+startup = DeviceStartup()
+startup.run(collections.OrderedDict([
+    ('thermal', init_thermal),
+    ('nfc', init_nfc),
+    ('servo', init_servo),
+    ('gpio', init_gpio),
+]))
+amg = startup.devices.get('thermal')
+pn532 = startup.devices.get('nfc')
+servo = hardware.servo
+
+
+## Thermal target helpers
+
+def hot_centroid_column(screen):
+    """
+    Return the column centroid of the hottest blob in a thermal frame
+    and the maximum temperature of the frame
+    pixels within centre_blob_band of the max are weighted by how far they
+    exceed the band floor, so a blob spanning two columns lands between them
+    """
+    pixels = np.asarray(screen, dtype=float)
+    max_value = pixels.max()
+    weights = np.clip(pixels - (max_value - centre_blob_band), 0.0, None)
+    column_weights = weights.sum(axis=0)
+    total = column_weights.sum()
+    if total == 0:
+        # flat frame, every pixel is the max
+        return centre_column, max_value
+    centroid = float(np.dot(column_weights, np.arange(pixels.shape[1])) / total)
+    return centroid, max_value
+
+
+class CentringController:
+    """
+    PI controller turning the column error of the hot blob into an angular speed
+    positive error (blob to the left of centre) turns anti-clockwise
+    """
+    def __init__(self, kp=centre_kp, ki=centre_ki, max_speed=rotatechange,
+                 tolerance=centre_tolerance, settle_frames=centre_settle_frames):
+        self.kp = kp
+        self.ki = ki
+        self.max_speed = max_speed
+        self.tolerance = tolerance
+        self.settle_frames = settle_frames
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.settled = 0
+        self.iterations = 0
+
+    def update(self, centroid, dt):
+        """Return the angular speed for this frame, 0.0 once converged"""
+        self.iterations += 1
+        error = centre_column - centroid
+        if abs(error) <= self.tolerance:
+            self.settled += 1
+            # stop accumulating once inside the deadband to avoid overshoot
+            self.integral = 0.0
+            return 0.0
+        self.settled = 0
+        self.integral += error * dt
+        # anti-windup: keep the integral term within the speed limit
+        if self.ki > 0:
+            limit = self.max_speed / self.ki
+            self.integral = max(-limit, min(limit, self.integral))
+        speed = self.kp * error + self.ki * self.integral
+        return max(-self.max_speed, min(self.max_speed, speed))
+
+    @property
+    def converged(self):
+        return self.settled >= self.settle_frames
+
+
+# A hot frame, the odometry pose it was seen from and the world bearing of the blob
+Sighting = collections.namedtuple('Sighting', 'time x y yaw bearing max_value')
+
+
+class ThermalCameraError(Exception):
+    """No fresh thermal frame: the camera is missing or stopped answering"""
+
+
+class ThermalScanner:
+    """
+    Reads the thermal camera on its own thread at the camera frame rate
+    hot frames with the blob clear of the frame edges are cached as
+    Sightings every sighting_spacing of motion, so the target seen on the
+    way to the loading bay can be engaged straight after loading
+    """
+    def __init__(self, node, camera, period=amg_frame_period, cache_size=sighting_cache_size):
+        self.node = node
+        self.camera = camera
+        self.period = period
+        self.sightings = collections.deque(maxlen=cache_size)
+        self.frame = None
+        self.frame_count = 0
+        self.error = None # last read error, cleared by the next good frame
+        self._new_frame = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='thermal', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        next_time = time.monotonic()
+        retry_delays = None
+        while not self._stopping.is_set():
+            try:
+                pixels = self.camera.pixels
+            except Exception as err: # any driver or bus error, the camera may come back
+                if retry_delays is None:
+                    retry_delays = iter(Backoff(tight_polls=0, initial=thermal_retry_delay,
+                                                maximum=thermal_retry_max_delay))
+                delay = next(retry_delays)
+                self.error = '%s: %s' % (type(err).__name__, err)
+                self.node.get_logger().warning('Thermal camera read failed, retrying in %.2f s: %s' % (
+                    delay, self.error))
+                self._stopping.wait(delay)
+                next_time = time.monotonic()
+                continue
+            if retry_delays is not None:
+                self.node.get_logger().info('Thermal camera reading again')
+                retry_delays = None
+            self.error = None
+            map_pose = self.node.map_pose
+            if map_pose is not None:
+                self.node.heat_map.add_frame(pixels, *map_pose)
+            centroid, max_value = hot_centroid_column(pixels)
+            # a blob clipped by the frame edge gives a biased bearing
+            if max_value > detecting_threshold and \
+               approach_edge_margin <= centroid <= 7 - approach_edge_margin:
+                self._cache(centroid, max_value)
+            with self._new_frame:
+                self.frame = pixels
+                self.frame_count += 1
+                self._new_frame.notify_all()
+            next_time += self.period
+            self._stopping.wait(max(0.0, next_time - time.monotonic()))
+
+    def next_frame(self, timeout=thermal_frame_timeout):
+        """
+        Wait for a frame newer than the last one returned and return it
+        raises ThermalCameraError rather than hand back a stale frame
+        """
+        with self._new_frame:
+            count = self.frame_count
+            if not self._new_frame.wait_for(lambda: self.frame_count != count, timeout):
+                raise ThermalCameraError('no thermal frame for %.1f s%s' % (
+                    timeout, ', last error %s' % self.error if self.error else ''))
+            return self.frame
+
+    def _cache(self, centroid, max_value):
+        node = self.node
+        if self.sightings:
+            last = self.sightings[-1]
+            turned = abs(math.atan2(math.sin(node.yaw - last.yaw), math.cos(node.yaw - last.yaw)))
+            if math.hypot(node.x - last.x, node.y - last.y) < sighting_spacing and \
+               turned < sighting_spacing:
+                return
+        camera_bearing = math.radians((centre_column - centroid) * amg_degrees_per_column)
+        bearing = node.yaw - math.radians(ir_offset) + camera_bearing
+        self.sightings.append(Sighting(time.monotonic(), node.x, node.y, node.yaw,
+                                       bearing, max_value))
+
+    def best_sighting(self, x, y):
+        """Return the cached sighting seen closest to (x, y), the hottest on a tie"""
+        if not self.sightings:
+            return None
+        return min(self.sightings, key=lambda s: (math.hypot(s.x - x, s.y - y), -s.max_value))
+
+    def locate_target(self):
+        """
+        Return the (x, y) where the cached sighting bearings cross, by least
+        squares, or None if they are too close to parallel to triangulate
+        """
+        sightings = list(self.sightings)
+        if len(sightings) < 2:
+            return None
+        normal = np.zeros((2, 2))
+        offset = np.zeros(2)
+        for sighting in sightings:
+            direction = np.array([math.cos(sighting.bearing), math.sin(sighting.bearing)])
+            # projection onto the perpendicular of the bearing line
+            projection = np.eye(2) - np.outer(direction, direction)
+            normal += projection
+            offset += projection.dot([sighting.x, sighting.y])
+        if np.linalg.eigvalsh(normal)[0] / len(sightings) < math.sin(sighting_min_spread) ** 2:
+            return None
+        target = np.linalg.solve(normal, offset)
+        # the target has to lie ahead of every sighting
+        for sighting in sightings:
+            if (target[0] - sighting.x) * math.cos(sighting.bearing) + \
+               (target[1] - sighting.y) * math.sin(sighting.bearing) <= 0:
+                return None
+        return target
 
 
 
@@ -106,6 +431,13 @@ class mission(Node):
         timer_period = 0.5  # seconds
         self.firing_publish = self.create_timer(timer_period, self.send_firing_status)
 
+        ## Target temperature publisher, the navigation code keys its heat waypoints on it
+        self.temperature_publisher = self.create_publisher(Float64, 'target_temperature', 10)
+
+        ## Hardware health publisher
+        self.health_publisher = self.create_publisher(String, 'mission_health', 10)
+        self.health_publish = self.create_timer(timer_period, self.send_health)
+
         ## Lidar subscriber
         self.lidar_subscription = self.create_subscription(
             LaserScan,
@@ -121,15 +453,33 @@ class mission(Node):
             self.odom_callback,
             10)
         self.odom_subscription #prevent unused variable warning
-        '''
-        ## Position from map subscriber
+
+        ## Position from map subscriber, published by the navigation code
         self.pos_subscription = self.create_subscription(Pose, '/map2base', self.pos_callback, 10)
         self.pos_subscription  # prevent unused variable warning
+
+        ## Map subscriber and heat layer publisher
+        self.map_subscription = self.create_subscription(
+            OccupancyGrid,
+            'map',
+            self.map_callback,
+            qos_profile_sensor_data)
+        self.map_subscription  # prevent unused variable warning
+        self.heat_map = thermal_map.ThermalMap(math.radians(ir_offset), detecting_threshold)
+        self.map_info = None
+        self.heat_map_publisher = self.create_publisher(OccupancyGrid, 'thermal_map', 10)
+        self.heat_map_publish = self.create_timer(thermal_map_period, self.send_heat_map)
         # initialize variables
-        '''
         self.roll = 0.0
         self.pitch = 0.0
         self.yaw = 0.0
+        self.x = 0.0
+        self.y = 0.0
+        self.distance = 9999
+        self.map_pose = None # (x, y, yaw) in the map frame
+        # set by MissionOrchestrator when ROS and the camera run on their own threads
+        self.spin_thread = None
+        self.scanner = None
 
 
     ## Callback functions
@@ -147,17 +497,28 @@ class mission(Node):
         global target_status
         msg = String()
         msg.data = target_status
+        if target_status == target_detected_msg:
+            # ahead of the status so the waypoint is dropped with this temperature
+            temperature = Float64()
+            temperature.data = float(target_temperature)
+            self.temperature_publisher.publish(temperature)
         self.firing_publisher.publish(msg)
 
+    def send_health(self):
+        msg = String()
+        msg.data = startup.summary()
+        self.health_publisher.publish(msg)
+
     def lidar_callback(self, msg):
         laser_range = np.array(msg.ranges)
         laser_front = laser_range[0:4]
         np.append(laser_front, laser_range[-1:-4:-1])
         laser_front[laser_front==0] = np.nan
-        try:
-            self.distance = np.nanmin(laser_front)
-        except ValueError:
+        if np.all(np.isnan(laser_front)):
+            # nothing in front within range
             self.distance = 9999
+        else:
+            self.distance = np.nanmin(laser_front)
 
 
     def odom_callback(self, msg):
@@ -165,16 +526,53 @@ class mission(Node):
         # self.get_logger().info('In odom_callback')
         orientation_quat =  msg.pose.pose.orientation
         self.roll, self.pitch, self.yaw = self.euler_from_quaternion(orientation_quat.x, orientation_quat.y, orientation_quat.z, orientation_quat.w)
-    '''
+        self.x = msg.pose.pose.position.x
+        self.y = msg.pose.pose.position.y
     def pos_callback(self, msg):
-        global euler_from_quaternion, orientation_quat
-        orientation_quat =  msg.orientation
-        self.roll, self.pitch, self.yaw = self.euler_from_quaternion(orientation_quat.x, orientation_quat.y, orientation_quat.z, orientation_quat.w)
-    '''
+        orientation_quat = msg.orientation
+        _, _, yaw = self.euler_from_quaternion(orientation_quat.x, orientation_quat.y, orientation_quat.z, orientation_quat.w)
+        self.map_pose = (msg.position.x, msg.position.y, yaw)
+
+    def map_callback(self, msg):
+        info = msg.info
+        occupancy = np.array(msg.data, dtype=np.int8).reshape(info.height, info.width)
+        self.heat_map.set_grid(occupancy, info.resolution,
+                               info.origin.position.x, info.origin.position.y)
+        self.map_info = info
+
+    def send_heat_map(self):
+        if self.map_info is None:
+            return
+        msg = OccupancyGrid()
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.header.frame_id = 'map'
+        msg.info = self.map_info
+        msg.data = self.heat_map.to_occupancy(min_temp_threshold, max_temp_threshold).ravel().tolist()
+        self.heat_map_publisher.publish(msg)
 
     ################################################################
     ## Helper functions
 
+    def spin_once(self, timeout_sec=None):
+        # callbacks run on the spin thread when the orchestrator owns the node
+        if self.spin_thread is not None:
+            time.sleep(timeout_sec if timeout_sec is not None else spin_period)
+        else:
+            rclpy.spin_once(self, timeout_sec=timeout_sec)
+
+    def thermal_frame(self):
+        # wait for the next thermal frame, servicing ROS meanwhile
+        # raises ThermalCameraError when there is no fresh frame to steer by
+        if self.scanner is not None:
+            return self.scanner.next_frame()
+        self.spin_once(timeout_sec=amg_frame_period)
+        if amg is None:
+            raise ThermalCameraError('no thermal camera')
+        try:
+            return amg.pixels
+        except Exception as err: # any driver or bus error
+            raise ThermalCameraError('%s: %s' % (type(err).__name__, err))
+
     def stopbot(self):
         twist = Twist()
         twist.linear.x = 0.0
@@ -215,9 +613,9 @@ class mission(Node):
 
 
     def rotate(self, rot_angle):
-        rclpy.spin_once(self)
-        rclpy.spin_once(self)
-        rclpy.spin_once(self)
+        self.spin_once()
+        self.spin_once()
+        self.spin_once()
         print('rotating ', rot_angle)
         # self.get_logger().info('In rotatebot')
         # create Twist object
@@ -255,7 +653,7 @@ class mission(Node):
         count = 0
         while(c_change_dir * c_dir_diff > 0):
             # allow the callback functions to run
-            rclpy.spin_once(self)
+            self.spin_once()
             current_yaw = self.yaw
             #check if new current yaw differ by initial yaw by more than around 1 degree
             # (in radians)
@@ -294,7 +692,7 @@ class mission(Node):
     def move_servo(self, direction):
         global servo_pin
         duty = int((2000*direction/180)+500)
-        servo.set_servo_pulsewidth(servo_pin, duty)
+        servo.pulsewidth(servo_pin, duty)
         time.sleep(0.1)
 
 
@@ -302,13 +700,19 @@ class mission(Node):
     ## Phase 1 - Search for NFC
 
     def nfc_search(self):
-        rclpy.spin_once(self)
+        self.spin_once()
         loading_bay_found = False
+        armed = False
         print('Mission - [1] - Searching for loading bay')
         while not loading_bay_found:
-            # Check if a card is available to read
-            nfc_reading = pn532.read_passive_target(timeout=0.5)
-            print('.', end="")
+            # Arm the reader once, it keeps searching on its own until a card is in range
+            if not armed:
+                armed = pn532.listen_for_passive_target(timeout=0.5)
+                self.spin_once(timeout_sec=0)
+                continue
+            # Sleep on the IRQ edge (or status poll) for a short slice, then service ROS
+            nfc_reading = pn532.get_passive_target(timeout=nfc_wait_period)
+            self.spin_once(timeout_sec=0)
             # Try again if no card is available.
             if nfc_reading is None:
                 continue
@@ -320,33 +724,88 @@ class mission(Node):
         global isDoneLoading
 
         # Locate loading bay to retrieve payload
-        rclpy.spin_once(self)
+        self.spin_once()
         self.nfc_search()
 
-        # Loading balls
+        # Loading balls, sleeping on the button edge while ROS keeps publishing
+        button_pressed.clear()
         GPIO.output(button_pin_out, 1)
-        while not isDoneLoading:
-            if GPIO.input(button_pin_in) == GPIO.HIGH:
-                isDoneLoading = True
-                print('Mission - [3] - Balls loaded, resuming mission')
-                GPIO.output(button_pin_out, 0)
-                time.sleep(3)
+        if self.spin_until(button_pressed, loading_timeout):
+            print('Mission - [3] - Balls loaded, resuming mission')
+        else:
+            print('Mission - [3] - Loading timed out, resuming mission')
+        isDoneLoading = True
+        GPIO.output(button_pin_out, 0)
+        self.spin_until(threading.Event(), loading_clear_delay)
         self.send_nfc_status()
 
+    def spin_until(self, event, timeout=None):
+        # service ROS callbacks until event is set or timeout seconds pass
+        if self.spin_thread is not None:
+            return event.wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not event.is_set():
+            wait = button_wait_period
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+            rclpy.spin_once(self, timeout_sec=wait)
+        return True
+
     #################################################################
     ## Phase 2 - Search and destroy
 
     def find_target(self):
         # See if target found
-        global target_status, target_detected_msg
-        target_found = False
-
-        while not target_found:
-            for row in amg.pixels:
-                for temp in row:
-                    if temp > detecting_threshold:
-                        target_found = True
-
+        global target_status, target_detected_msg, target_temperature
+        sighting = self.scanner.best_sighting(self.x, self.y) if self.scanner else None
+        # heat gathered on the map while wall-following, in the map frame
+        map_pose = self.map_pose
+        heat_spot = self.heat_map.hottest() if map_pose is not None else None
+
+        if sighting is not None or heat_spot is not None:
+            # stop the wallfollower and turn the camera back onto the target seen before loading
+            target_status = target_detected_msg
+            target_temperature = sighting.max_value if sighting is not None else heat_spot[2]
+            self.send_firing_status()
+            self.stopbot()
+            location = self.scanner.locate_target() if sighting is not None else None
+            turn = None
+            if location is not None:
+                print('Mission - [4a] - Turning to target located at (%.2f, %.2f) from %d sightings' % (
+                    location[0], location[1], len(self.scanner.sightings)))
+            elif heat_spot is None and len(self.scanner.sightings) == 1:
+                # one bearing gives no range, assume one so the turn is made from where the robot is now
+                location = (sighting.x + sighting_range * math.cos(sighting.bearing),
+                            sighting.y + sighting_range * math.sin(sighting.bearing))
+                print('Mission - [4a] - Turning to target seen %.1f s ago, assumed at (%.2f, %.2f)' % (
+                    time.monotonic() - sighting.time, location[0], location[1]))
+            if location is not None:
+                bearing = math.atan2(location[1] - self.y, location[0] - self.x)
+                turn = bearing - (self.yaw - math.radians(ir_offset))
+            elif heat_spot is not None:
+                print('Mission - [4a] - Turning to %.1f C spot on the map at (%.2f, %.2f)' % (
+                    heat_spot[2], heat_spot[0], heat_spot[1]))
+                map_x, map_y, map_yaw = map_pose
+                bearing = math.atan2(heat_spot[1] - map_y, heat_spot[0] - map_x)
+                turn = bearing - (map_yaw - math.radians(ir_offset))
+            if turn is None:
+                # sightings that neither cross nor stand alone give no direction from here
+                print('Mission - [4b] - Cached sightings do not locate the target, searching')
+            else:
+                self.rotate(math.degrees(math.atan2(math.sin(turn), math.cos(turn))))
+                if self.frame_temperature() > detecting_threshold:
+                    return
+                # not in view any more, let the wallfollower resume the search
+                print('Mission - [4b] - Cached target not in view, searching')
+            target_status = 'Not detected'
+            self.send_firing_status()
+
+        while True:
+            target_temperature = self.frame_temperature()
+            if target_temperature > detecting_threshold:
+                break
 
         # Target found, communicate with wallfollower to stop working
         target_status = target_detected_msg
@@ -355,44 +814,92 @@ class mission(Node):
         self.stopbot()
         time.sleep(1)
 
+    def frame_temperature(self):
+        # hottest pixel of the next frame, cold while the camera is not answering
+        try:
+            return hot_centroid_column(self.thermal_frame())[1]
+        except ThermalCameraError as err:
+            self.get_logger().warning('Searching without a thermal frame: %s' % err)
+            return -math.inf
 
     def centre_target(self):
-        global target_found
-        centered = False
-
-        while not centered:
-            screen = amg.pixels
-            max_row = 0
-            max_column = 0
-            max_value = 0.0
-            for row in range(len(screen)):
-                for column in range(len(screen[row])):
-                    current_value = screen[row][column]
-                    if current_value > max_value:
-                        max_row = row
-                        max_column = column
-                        max_value = current_value
-            # centre max value between column 3 and 4
-            if max_column < 3:
-                # spin anti-clockwise
-                twist = Twist()
-                twist.linear.x = 0.0
-                twist.angular.z = rotatechange
-                self.vel_publisher.publish(twist)
-            elif max_column > 4:
-                # spin clockwise
-                twist = Twist()
+        # proportional-integral centering on the hot blob centroid
+        controller = CentringController()
+        twist = Twist()
+        twist.linear.x = 0.0
+        start_time = time.monotonic()
+        last_time = start_time
+
+        while not controller.converged:
+            now = time.monotonic()
+            if now - start_time > centre_timeout:
+                self.get_logger().info('Centering timed out after %d frames' % controller.iterations)
+                break
+            # wait for the next thermal frame instead of re-reading the same one
+            try:
+                centroid, max_value = hot_centroid_column(self.thermal_frame())
+            except ThermalCameraError as err:
+                # never steer on a frozen image
+                self.get_logger().error('Centering stopped: %s' % err)
+                break
+            twist.angular.z = controller.update(centroid, now - last_time)
+            last_time = now
+            self.vel_publisher.publish(twist)
+        self.stopbot()
+
+        if controller.converged:
+            print('Mission - [5] - Target Centered')
+        self.get_logger().info('Centering: %d iterations, %.2f s' % (
+            controller.iterations, time.monotonic() - start_time))
+
+    def approach_target(self):
+        # drive towards the centred target while steering from the live thermal frame
+        self.spin_once()
+        # the camera points ir_offset degrees clockwise of the robot's front
+        target_yaw = self.yaw - math.radians(ir_offset)
+        twist = Twist()
+        start_time = time.monotonic()
+        frames = 0
+
+        while time.monotonic() - start_time < approach_timeout:
+            try:
+                pixels = self.thermal_frame()
+            except ThermalCameraError as err:
+                # never steer on a frozen image
+                self.get_logger().error('Approach stopped: %s' % err)
+                break
+            frames += 1
+
+            # refine the target heading whenever the blob is clear of the frame edges
+            centroid, max_value = hot_centroid_column(pixels)
+            if max_value > detecting_threshold and \
+               approach_edge_margin <= centroid <= 7 - approach_edge_margin:
+                camera_bearing = math.radians((centre_column - centroid) * amg_degrees_per_column)
+                target_yaw = self.yaw - math.radians(ir_offset) + camera_bearing
+
+            # wrap heading error to [-pi, pi]
+            err_yaw = math.atan2(math.sin(target_yaw - self.yaw), math.cos(target_yaw - self.yaw))
+            arrived = self.distance <= self.d
+            if arrived and abs(err_yaw) <= approach_heading_tolerance:
+                break
+
+            # slow down near the firing distance and while badly misaligned
+            if arrived or abs(err_yaw) > approach_max_heading_error:
                 twist.linear.x = 0.0
-                twist.angular.z = rotatechange * -1
-                self.vel_publisher.publish(twist)
             else:
-                centered = True
-                print('Mission - [5] - Target Centered')
+                clearance = (self.distance - self.d) / approach_slow_zone
+                clearance = max(approach_min_speed_fraction, min(1.0, clearance))
+                twist.linear.x = speedchange * clearance * math.cos(err_yaw)
+            twist.angular.z = max(-rotatechange, min(rotatechange, approach_kp * err_yaw))
+            self.vel_publisher.publish(twist)
+        else:
+            self.get_logger().info('Approach timed out')
         self.stopbot()
+        self.get_logger().info('Approach: %d frames, %.2f s, %.2f m from target' % (
+            frames, time.monotonic() - start_time, self.distance))
 
     def targetting(self):
         global message_sent, servo_pin, motor_pin, ir_offset
-        self.rotate_angle = ir_offset
         self.d = 0.7
         print('Mission - [4] - Searching for "Hot target"...')
 
@@ -401,37 +908,10 @@ class mission(Node):
 
         # centre the target
         self.centre_target()
-        time.sleep(1)
-
-        # rotate to forward facing the target
-        print('Mission - [6] - Rotating')
-        self.rotate(-1) # problems with first time rotating on our robot
-        self.rotate(- self.rotate_angle)
-        time.sleep(1)
-        # move forward until close enough to target
-        rclpy.spin_once(self)
-        #print(self.distance)
-        if self.distance > self.d:
-            while self.distance > self.d:
-                print(self.distance)
-                rclpy.spin_once(self)
-                self.move_forward()
-            self.stopbot()
 
-            # Recheck center
-            print('Mission - [6] - Rotating')
-            rclpy.spin_once(self)
-            self.rotate(1)
-            self.rotate(self.rotate_angle)
-            time.sleep(1)
-            rclpy.spin_once(self)
-            print('Mission - [7] - Re-centering')
-            self.centre_target()
-            print('Mission - [6] - Rotating')
-            time.sleep(1)
-            rclpy.spin_once(self)
-            self.rotate(-1)
-            self.rotate(-self.rotate_angle)
+        # turn to face the target and close in to firing distance in one motion
+        print('Mission - [6] - Approaching target')
+        self.approach_target()
         print('Mission - [8] - Firing')
 
     def fire(self):
@@ -468,13 +948,80 @@ class mission(Node):
 
 
 
+class MissionOrchestrator:
+    """
+    Runs ROS spinning and thermal acquisition on background threads while
+    the mission phases run in order on the calling thread
+    the phases are gated as before, targetting only starts once loading is
+    done, but hot sightings on the way to the loading bay are already cached
+    """
+    def __init__(self, node, extra_nodes=()):
+        self.node = node
+        self.executor = SingleThreadedExecutor()
+        self.executor.add_node(node)
+        # the simulated robot when running under the simulator
+        for extra in extra_nodes:
+            self.executor.add_node(extra)
+        # no scanner without a camera, thermal_frame() then reports it missing
+        self.scanner = ThermalScanner(node, amg) if amg is not None else None
+        self.timings = []
+
+    def run(self):
+        node = self.node
+        node.spin_thread = threading.Thread(target=self.executor.spin, name='ros', daemon=True)
+        node.spin_thread.start()
+        node.scanner = self.scanner
+        if self.scanner is not None:
+            self.scanner.start()
+        try:
+            for phase in (node.search, node.targetting, node.fire):
+                start_time = time.monotonic()
+                phase()
+                self.timings.append((phase.__name__, time.monotonic() - start_time))
+                node.get_logger().info('%s: %.2f s, %d hot sightings cached' % (
+                    phase.__name__, self.timings[-1][1],
+                    len(self.scanner.sightings) if self.scanner is not None else 0))
+        finally:
+            print(self.report())
+            if self.scanner is not None:
+                self.scanner.stop()
+            node.scanner = None
+            self.executor.shutdown()
+            node.spin_thread.join()
+            node.spin_thread = None
+
+    def report(self):
+        """Per-phase timing, bus statistics and, under the simulator, the recorded commands"""
+        lines = ['Mission - timing']
+        for name, elapsed in self.timings:
+            lines.append('  %-12s %7.2f s' % (name, elapsed))
+        lines.append('  %-12s %7.2f s' % ('total', sum(elapsed for _, elapsed in self.timings)))
+        lines.append('Mission - I2C bus')
+        lines.extend('  ' + line for line in i2c_bus.report().splitlines())
+        if hardware.simulated:
+            lines.append('Mission - simulated hardware')
+            lines.extend('  ' + line for line in hardware.report().splitlines())
+        return '\n'.join(lines)
+
+
 def main(args=None):
     rclpy.init(args=args)
 
     MSN = mission()
-    MSN.search() #Continuously search for NFC
-    MSN.targetting()
-    MSN.fire()
+    if require_all_devices and not startup.ready:
+        # keep reporting health so the missing device shows up on the ground station
+        MSN.get_logger().error('Mission not started, missing: %s' % ', '.join(startup.missing))
+        try:
+            rclpy.spin(MSN)
+        finally:
+            MSN.destroy_node()
+            rclpy.shutdown()
+        return
+    # NFC search, thermal scanning and ROS callbacks run concurrently
+    extra_nodes = hardware.ros_nodes()
+    MissionOrchestrator(MSN, extra_nodes).run()
+    for node in extra_nodes:
+        node.destroy_node()
     MSN.destroy_node() #Destroy node explicitly, optional otherwise it will be done wh>
     rclpy.shutdown()
 
@@ -0,0 +1,252 @@
+"""
+Feedback controllers that steer and drive at the same time
+
+GoToGoal replaces the turn-on-the-spot then drive-straight alternation of
+the bug algorithm with unicycle feedback: the turn rate follows the heading
+error, and the speed falls off with the heading error, with the free
+distance ahead and near the goal, so the robot curves onto its heading
+instead of stopping for every couple of degrees of drift.
+
+PurePursuit follows a polyline of map points, such as a planned return to
+the loading bay or to a target, chasing a point a lookahead distance along
+the path.  The lookahead grows with speed, the speed is capped by the
+curvature of the arc to that point and of the path ahead, and the robot
+stops for anything the lidar sees in its way.
+
+Each run is timed and its path length integrated from every pose passed
+to track(), wall following included, so the bug planners can be compared
+on the robot as well as in bug_benchmark.py.
+"""
+
+import math
+import time
+
+import numpy as np
+
+
+## Adjustable variables
+max_speed = 0.2 # metres per second, speedchange of the navigation code
+max_turn = 0.8 # radians per second, turning_speed_wf_fast
+heading_gain = 1.5 # turn rate per radian of heading error
+drive_heading_error = math.radians(60) # no forward speed beyond this heading error
+stop_distance = 0.15 # free distance ahead at which the robot stops
+slow_distance = 0.6 # free distance ahead below which the robot slows down
+goal_slow_radius = 0.4 # distance from the goal below which the robot slows down
+min_speed_fraction = 0.25 # fraction of max_speed kept while slowing for the goal
+min_lookahead = 0.25 # metres, lookahead when crawling
+lookahead_time = 1.5 # seconds of travel added to the lookahead at speed
+max_lookahead = 0.6
+max_lateral_accel = 0.15 # metres per second squared, caps speed on curves
+max_decel = 0.2 # metres per second squared, braking towards the end of the path
+stall_distance = 0.05 # metres along the path that count as progress
+
+
+def normalize_angle(angle):
+    return math.atan2(math.sin(angle), math.cos(angle))
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+class RunLog:
+    """Time and path length of one drive to a goal"""
+    def __init__(self, x, y, goal):
+        self.start_time = time.monotonic()
+        self.start = (x, y)
+        self.goal = goal
+        self.last = (x, y)
+        self.path_length = 0.0
+        self.arrival_time = None
+        self.stop_reason = None
+
+    def update(self, x, y):
+        self.path_length += math.hypot(x - self.last[0], y - self.last[1])
+        self.last = (x, y)
+
+    def arrive(self):
+        self.arrival_time = time.monotonic() - self.start_time
+
+    def stop(self, reason):
+        """Record why the run ended short of the goal"""
+        self.stop_reason = reason
+
+    def summary(self):
+        straight = math.hypot(self.goal[0] - self.start[0], self.goal[1] - self.start[1])
+        elapsed = self.arrival_time if self.arrival_time is not None \
+            else time.monotonic() - self.start_time
+        if self.arrival_time is not None:
+            outcome = 'arrived'
+        elif self.stop_reason is not None:
+            outcome = 'stopped, %s,' % self.stop_reason
+        else:
+            outcome = 'stopped'
+        return '%s in %.1f s, path %.2f m for %.2f m straight line' % (
+            outcome, elapsed, self.path_length, straight)
+
+
+class GoToGoal:
+    """
+    Unicycle feedback towards a point
+    update() returns (linear, angular) for the current pose, given the free
+    distance along the robot's heading
+    """
+    def __init__(self, tolerance=0.2):
+        self.tolerance = tolerance
+        self.log = None
+
+    def start(self, x, y, goal):
+        self.log = RunLog(x, y, goal)
+
+    def track(self, x, y):
+        """Feed a pose to the run log, whatever is driving the robot"""
+        if self.log is not None and self.log.arrival_time is None:
+            self.log.update(x, y)
+
+    def distance(self, x, y, target):
+        return math.hypot(target[0] - x, target[1] - y)
+
+    def arrived(self, x, y):
+        if self.log is None:
+            return False
+        if self.distance(x, y, self.log.goal) >= self.tolerance:
+            return False
+        if self.log.arrival_time is None:
+            self.log.arrive()
+        return True
+
+    def update(self, x, y, yaw, clear, target=None):
+        """
+        Velocities towards target, by default the goal, with the goal still
+        used for the approach slow-down and the run log
+        """
+        log = self.log
+        target = target if target is not None else log.goal
+        error = normalize_angle(math.atan2(target[1] - y, target[0] - x) - yaw)
+        angular = clamp(heading_gain * error, -max_turn, max_turn)
+        # full speed straight ahead, none beyond drive_heading_error
+        heading_scale = clamp(1.0 - abs(error) / drive_heading_error, 0.0, 1.0)
+        clearance_scale = clamp((clear - stop_distance) / (slow_distance - stop_distance), 0.0, 1.0)
+        goal_scale = clamp(self.distance(x, y, log.goal) / goal_slow_radius, min_speed_fraction, 1.0)
+        linear = max_speed * heading_scale * clearance_scale * goal_scale
+        return linear, angular
+
+
+class PurePursuit:
+    """
+    Pure pursuit along a map frame polyline of (x, y) points
+    update() returns (linear, angular) for the current map pose, given the
+    free distance along the robot's heading, and sets done at the end
+    """
+    def __init__(self, path, tolerance=0.1):
+        path = np.asarray(path, dtype=float).reshape(-1, 2)
+        # repeated points would make zero length segments
+        keep = np.append(True, np.any(np.diff(path, axis=0) != 0, axis=1))
+        path = path[keep]
+        if len(path) < 2:
+            path = np.vstack([path, path])
+        self.path = path
+        self.tolerance = tolerance
+        segments = np.diff(path, axis=0)
+        self.segment_lengths = np.hypot(segments[:, 0], segments[:, 1])
+        self.segments = segments
+        # arc length at every vertex
+        self.arc = np.concatenate([[0.0], np.cumsum(self.segment_lengths)])
+        self.length = float(self.arc[-1])
+        # curvature at every vertex, turn angle over the mean of its two segments
+        headings = np.arctan2(segments[:, 1], segments[:, 0])
+        turns = np.abs(np.angle(np.exp(1j * np.diff(headings))))
+        spans = (self.segment_lengths[:-1] + self.segment_lengths[1:]) / 2
+        curvature = np.zeros(len(path))
+        curvature[1:-1] = turns / np.maximum(spans, 1e-6)
+        self.vertex_curvature = curvature
+        self.progress = 0.0 # arc length reached, never moves backwards
+        self.speed = 0.0
+        self.done = False
+        # last time the progress moved on by stall_distance
+        self.progress_mark = 0.0
+        self.progress_time = time.monotonic()
+        self.log = RunLog(path[0, 0], path[0, 1], tuple(path[-1]))
+
+    def track(self, x, y):
+        if not self.done:
+            self.log.update(x, y)
+
+    def stalled(self, timeout):
+        """
+        True once the progress along the path has not moved on for timeout
+        seconds, whether blocked, without a pose or turning in circles
+        """
+        return not self.done and time.monotonic() - self.progress_time > timeout
+
+    def project(self, x, y):
+        """Arc length of the point of the path nearest to (x, y), from the progress onwards"""
+        if self.progress >= self.length:
+            # on the last point already, or a path of a single point
+            return self.length
+        first = int(np.searchsorted(self.arc, self.progress, side='right')) - 1
+        first = min(max(first, 0), len(self.segments) - 1)
+        starts = self.path[first:-1]
+        segments = self.segments[first:]
+        lengths = self.segment_lengths[first:]
+        # position along every remaining segment at once, clipped to its ends
+        along = ((x - starts[:, 0]) * segments[:, 0] + (y - starts[:, 1]) * segments[:, 1]) \
+            / np.maximum(lengths, 1e-9) ** 2
+        along = np.clip(along, 0.0, 1.0)
+        nearest = starts + along[:, None] * segments
+        best = int(np.argmin(np.hypot(nearest[:, 0] - x, nearest[:, 1] - y)))
+        return max(self.progress, float(self.arc[first + best] + along[best] * lengths[best]))
+
+    def point_at(self, arc):
+        arc = min(arc, self.length)
+        return float(np.interp(arc, self.arc, self.path[:, 0])), float(np.interp(arc, self.arc, self.path[:, 1]))
+
+    def update(self, x, y, yaw, clear):
+        self.track(x, y)
+        self.progress = self.project(x, y)
+        if self.progress - self.progress_mark >= stall_distance:
+            self.progress_mark = self.progress
+            self.progress_time = time.monotonic()
+        end = self.path[-1]
+        to_end = math.hypot(end[0] - x, end[1] - y)
+        # off the path past its end, or on a single point path, the end is still to be driven to
+        remaining = max(self.length - self.progress, to_end if self.progress >= self.length else 0.0)
+        if remaining < self.tolerance and to_end < self.tolerance:
+            self.done = True
+            self.log.arrive()
+            self.speed = 0.0
+            return 0.0, 0.0
+
+        lookahead = clamp(min_lookahead + lookahead_time * self.speed, min_lookahead, max_lookahead)
+        px, py = self.point_at(self.progress + lookahead)
+        dx, dy = px - x, py - y
+        ahead = dx * math.cos(yaw) + dy * math.sin(yaw)
+        lateral = -dx * math.sin(yaw) + dy * math.cos(yaw)
+        distance = math.hypot(ahead, lateral)
+        if distance < 1e-6:
+            # the lookahead point is the end of the path under the robot
+            self.speed = 0.0
+            return 0.0, 0.0
+        error = math.atan2(lateral, ahead)
+        if abs(error) > drive_heading_error:
+            # the path is behind the robot, turn on the spot towards it
+            self.speed = 0.0
+            return 0.0, clamp(heading_gain * error, -max_turn, max_turn)
+
+        # arc through the lookahead point
+        curvature = 2.0 * lateral / distance ** 2
+        window = (self.arc >= self.progress) & (self.arc <= self.progress + max_lookahead + self.speed)
+        path_curvature = float(self.vertex_curvature[window].max()) if window.any() else 0.0
+        sharpest = max(abs(curvature), path_curvature)
+        linear = max_speed
+        if sharpest > 0:
+            linear = min(linear, math.sqrt(max_lateral_accel / sharpest))
+        linear = min(linear, math.sqrt(2 * max_decel * remaining))
+        # safety stop, slowing down from slow_distance and halting at stop_distance
+        linear *= clamp((clear - stop_distance) / (slow_distance - stop_distance), 0.0, 1.0)
+        angular = clamp(curvature * linear, -max_turn, max_turn)
+        if linear > 0 and abs(angular) == max_turn:
+            # keep to the arc when the turn rate saturates
+            linear = max_turn / abs(curvature)
+        self.speed = linear
+        return linear, angular
@@ -19,7 +19,7 @@ from geometry_msgs.msg import Twist, Point, Pose
 from rclpy.qos import qos_profile_sensor_data
 from sensor_msgs.msg import LaserScan
 from nav_msgs.msg import OccupancyGrid
-from std_msgs.msg import Float64MultiArray, String
+from std_msgs.msg import Float64MultiArray, Float64, String
 import numpy as np
 import tf2_ros
 from tf2_ros import LookupException, ConnectivityException, ExtrapolationException, TransformException
@@ -31,6 +31,9 @@ import matplotlib.pyplot as plt
 from PIL import Image
 import scipy.stats
 import os
+from heat_waypoints import HeatWaypointIndex
+import bug_planner
+import motion_control
 
 ## Stores known frames and offers frame graph requests
 from tf2_ros.buffer import Buffer
@@ -38,9 +41,6 @@ from tf2_ros.buffer import Buffer
 ## Easy way to request and receive coordinate frame transform information
 from tf2_ros.transform_listener import TransformListener
 
-## Open up rviz for lidar map everytime navigation is running
-os.system("gnome-terminal --command='ros2 launch turtlebot3_cartographer cartographer.launch.py'")
-
 
 ## Adjustable variables to calibrate wall follower
 d = 0.45 #Distance from wall
@@ -53,6 +53,12 @@ turning_speed_wf_slow = 0.45  #Slow rotate speed
 snaking_radius = d - 0.07  #Amount of variation accepted from wall
 cornering_speed_constant = 0.5 #percentage of speed change wwhen cornering
 
+## Adjustable variables for following planned paths
+path_tracking_period = 0.05 #Seconds between path tracking commands
+pose_timeout = 0.5 #Seconds without a map pose before the robot stops
+path_stall_timeout = 15.0 #Seconds without progress along the path before giving up on it
+lidar_range_max = 3.5 #LDS-01 range, scan_callback keeps only the ranges
+
 ## Variables for map file saved at the end of the mission
 scanfile = 'lidar.txt'
 mapfile = 'map.txt'
@@ -94,10 +100,8 @@ bug_state_dict_ = {
     2: 'Halt',
 }
 
-## Waypoint dictionary
-waypoint_dict = {
-    1: 'nil'
-}
+## Heat waypoints, one per hot target reported by the RPi, hottest first
+waypoint_index = HeatWaypointIndex()
 
 ## Convert a quarternion into euler angles
 # code from https://automaticaddison.com/how-to-convert-a-quaternion-into-euler-angles-in-python/
@@ -140,6 +144,16 @@ class AutoNav(Node):
             10)
         self.targeting_subscription  # prevent unused variable warning
 
+        # create subscription to the temperature of the detected target
+        self.temperature_subscription = self.create_subscription(
+            Float64,
+            'target_temperature',
+            self.temperature_callback,
+            10)
+        self.temperature_subscription  # prevent unused variable warning
+        self.target_temperature = 0.0
+        self.engaged_waypoint = None
+
         # create subscription to track orientation
         self.odom_subscription = self.create_subscription(
             Odometry,
@@ -151,6 +165,8 @@ class AutoNav(Node):
         self.roll = 0
         self.pitch = 0
         self.yaw = 0
+        self.x = 0.0
+        self.y = 0.0
 
         # create subscription to track occupancy
         self.occ_subscription = self.create_subscription(
@@ -190,33 +206,44 @@ class AutoNav(Node):
         self.tf_buffer = Buffer()
         self.tf_listener = TransformListener(self.tf_buffer,self, spin_thread=True)
         self.mapbase = None
+        self.mapbase_time = 0.0
         self.map2base = self.create_publisher(Pose, '/map2base', 10)
         timer_period = 0.05
         self.timer = self.create_timer(timer_period, self.timer_callback)
 
 
     def target_callback(self, msg):
-        global isTargetDetected, isDoneShooting, waypoint_dict,position
+        global isTargetDetected, isDoneShooting, waypoint_index, position
         # communicates with mission code to receive status updates
         if (msg.data == 'Detected'):
             isTargetDetected = True
             isDoneShooting = False
-            ## To put temperature detected and waypoint in a dictionary
-            waypoint_dict[2] = position #make RPi send temp, replace 2 with that temp
+            ## Drop a heat waypoint, repeated reports of the same target merge into one
+            self.engaged_waypoint = waypoint_index.add(self.target_temperature, position, time.time())
             self.change_state('C')
         elif (msg.data == 'FINISHED SHOOTING'):
             isDoneShooting = True
             isTargetDetected = False
+            if self.engaged_waypoint is not None:
+                waypoint_index.mark_visited(self.engaged_waypoint)
+                self.engaged_waypoint = None
             self.change_state('D')
         else:
             isTargetDetected = False
 
+    def temperature_callback(self, msg):
+        # sent by the mission code just ahead of each 'Detected' status
+        self.target_temperature = msg.data
+
     def odom_callback(self, msg):
         global position
         orientation_quat = msg.pose.pose.orientation
         self.roll, self.pitch, self.yaw = euler_from_quaternion(
             orientation_quat.x, orientation_quat.y, orientation_quat.z, orientation_quat.w)
         position = [round(msg.pose.pose.position.x,1),round(msg.pose.pose.position.y,1),round(msg.pose.pose.position.z,1)]
+        # unrounded, for behaviours sharing this node such as the bug algorithm
+        self.x = msg.pose.pose.position.x
+        self.y = msg.pose.pose.position.y
 
     def occ_callback(self, msg):
         global myoccdata
@@ -282,6 +309,7 @@ class AutoNav(Node):
             # self.get_logger().info(
                 # f'Could not transform {to_frame_rel} to {from_frame_rel}: {ex}')
             return
+        self.mapbase_time = time.time()
         msg.position.x = self.mapbase.transform.translation.x
         msg.position.y = self.mapbase.transform.translation.y
         msg.orientation = self.mapbase.transform.rotation
@@ -469,6 +497,44 @@ class AutoNav(Node):
         twist.angular.z = 0.0
         self.publisher_.publish(twist)
 
+    # follow a map frame path of (x, y) points, such as a planned return to the
+    # loading bay or to a target, with pure pursuit at a fixed rate from the
+    # map pose kept by timer_callback; returns the run log, whose arrival_time
+    # stays None when the robot gave up after path_stall_timeout without progress
+    def follow_path(self, path):
+        tracker = motion_control.PurePursuit(path)
+
+        def track():
+            # stop rather than steer on a pose the tf lookups stopped refreshing
+            if self.mapbase is None or time.time() - self.mapbase_time > pose_timeout \
+               or self.laser_range.size == 0:
+                self.stopbot()
+                return
+            translation = self.mapbase.transform.translation
+            rotation = self.mapbase.transform.rotation
+            yaw = euler_from_quaternion(rotation.x, rotation.y, rotation.z, rotation.w)[2]
+            # free distance straight ahead for the robot's footprint, beams from the heading
+            geometry = bug_planner.scan_geometry(
+                self.laser_range, 0.0, 2 * math.pi / self.laser_range.size, lidar_range_max)
+            clear = bug_planner.free_distance(*geometry, bearing=0.0, range_max=lidar_range_max)
+            twist = Twist()
+            twist.linear.x, twist.angular.z = tracker.update(translation.x, translation.y, yaw, clear)
+            self.publisher_.publish(twist)
+
+        timer = self.create_timer(path_tracking_period, track)
+        try:
+            while not tracker.done:
+                rclpy.spin_once(self)
+                # blocked for good or without a map pose, hand back to the caller
+                if tracker.stalled(path_stall_timeout):
+                    tracker.log.stop('no progress for %.0f s' % path_stall_timeout)
+                    break
+        finally:
+            self.destroy_timer(timer)
+            self.stopbot()
+        print('Path tracking - %s' % tracker.log.summary())
+        return tracker.log
+
     # function for bot to locate first wall to start wall following
     def initialmove(self):
         global d
@@ -574,6 +640,9 @@ class AutoNav(Node):
 
 
 def main(args=None):
+    ## Open up rviz for lidar map everytime navigation is running
+    # here rather than at import, so modules importing AutoNav do not launch it again
+    os.system("gnome-terminal --command='ros2 launch turtlebot3_cartographer cartographer.launch.py'")
     rclpy.init(args=args)
     auto_nav = AutoNav()
     auto_nav.mover()
@@ -0,0 +1,43 @@
+"""
+Degenerate paths for motion_control.PurePursuit, run with python3 -m pytest
+"""
+
+import math
+
+import motion_control
+
+
+def drive(tracker, x, y, yaw, steps=2000, dt=0.05):
+    """Kinematic unicycle following the tracker, returns True once it is done"""
+    for _ in range(steps):
+        linear, angular = tracker.update(x, y, yaw, 3.5)
+        if tracker.done:
+            return True
+        x += linear * math.cos(yaw) * dt
+        y += linear * math.sin(yaw) * dt
+        yaw += angular * dt
+    return False
+
+
+def test_past_the_end_of_the_path():
+    tracker = motion_control.PurePursuit([(0, 0), (1, 0)])
+    tracker.update(0.5, 0, 0, 3.5)
+    # progress reaches the end of the path without the robot being there
+    tracker.update(1.2, 0.3, 0, 3.5)
+    tracker.update(1.2, 0.3, 0, 3.5)
+    assert not tracker.done
+    assert drive(tracker, 1.2, 0.3, 0)
+
+
+def test_single_point_path():
+    assert drive(motion_control.PurePursuit([(1, 1)]), 0, 0, 0)
+
+
+def test_repeated_points_only():
+    assert drive(motion_control.PurePursuit([(0, 0), (0, 0), (0, 0)]), 0.5, 0, 0)
+
+
+def test_already_at_a_single_point():
+    tracker = motion_control.PurePursuit([(1, 1)])
+    assert tracker.update(1, 1.05, 0, 3.5) == (0.0, 0.0)
+    assert tracker.done
@@ -0,0 +1,143 @@
+"""
+Thermal layer over the cartographer occupancy grid
+
+Every AMG8833 column sees a 7.5 degree wedge in front of the camera.  The
+camera gives no range, so each hot column is cast as a fan of rays from
+the robot's map pose and the heat is put on the first occupied cell each
+ray meets, the wall or object radiating it.  Hits from frames taken along
+the wall-following path pile up on the target's cells, so the target can be
+located without stopping to scan.
+
+All rays of a frame are traced at once with numpy: one (rays x steps) array
+of cells, the first occupied step per ray found with argmax.
+"""
+
+import math
+import threading
+
+import numpy as np
+
+
+## Adjustable variables
+amg_field_of_view = math.radians(60)
+amg_columns = 8
+rays_per_column = 3 # rays fanned across each column's wedge
+max_range = 3.5 # metres traced along each ray, the LDS-01 range
+occupied_threshold = 65 # occupancy probability above which a cell is a wall
+min_hits = 3 # hot rays a cell needs before it is reported as the target
+
+
+class ThermalMap:
+    """
+    Heat accumulated on the cells of the occupancy grid
+    heat holds the hottest temperature cast onto each cell and hits the
+    number of hot rays that ended there, both shaped like the map
+    """
+    def __init__(self, camera_offset=0.0, hot_threshold=32.0,
+                 field_of_view=amg_field_of_view, max_range=max_range):
+        self.camera_offset = camera_offset
+        self.hot_threshold = hot_threshold
+        self.max_range = max_range
+        column_width = field_of_view / amg_columns
+        # ray bearings from the camera axis, positive to the left, column 0 leftmost
+        fan = (np.arange(rays_per_column) + 0.5) / rays_per_column - 0.5
+        centres = (amg_columns / 2 - 0.5 - np.arange(amg_columns)) * column_width
+        self.ray_bearings = (centres[:, None] + fan[None, :] * column_width).ravel()
+        self.occupied = None
+        self.resolution = None
+        self.origin = None
+        self.heat = None
+        self.hits = None
+        self._steps = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.occupied is not None
+
+    def set_grid(self, occupancy, resolution, origin_x, origin_y):
+        """
+        Take a new occupancy grid, (height, width) values from -1 to 100
+        cartographer grows the map as the robot explores, heat already
+        gathered is shifted onto the new grid where the two overlap
+        """
+        occupancy = np.asarray(occupancy)
+        with self._lock:
+            heat = np.zeros(occupancy.shape, dtype=np.float32)
+            hits = np.zeros(occupancy.shape, dtype=np.uint16)
+            if self.heat is not None and resolution == self.resolution:
+                # cell offset of the old grid inside the new one
+                col = int(round((self.origin[0] - origin_x) / resolution))
+                row = int(round((self.origin[1] - origin_y) / resolution))
+                old_rows, old_cols = self.heat.shape
+                top, left = max(row, 0), max(col, 0)
+                bottom = min(row + old_rows, heat.shape[0])
+                right = min(col + old_cols, heat.shape[1])
+                if top < bottom and left < right:
+                    heat[top:bottom, left:right] = self.heat[top-row:bottom-row, left-col:right-col]
+                    hits[top:bottom, left:right] = self.hits[top-row:bottom-row, left-col:right-col]
+            self.heat, self.hits = heat, hits
+            self.occupied = occupancy >= occupied_threshold
+            self.resolution = resolution
+            self.origin = (origin_x, origin_y)
+            # half-cell steps so a ray cannot slip diagonally through a wall corner
+            self._steps = np.arange(0.0, self.max_range, resolution / 2)
+
+    def add_frame(self, pixels, x, y, yaw):
+        """
+        Cast the hot columns of an 8x8 frame from the robot's map pose
+        returns the number of rays that landed on a wall
+        """
+        if self.occupied is None:
+            return 0
+        columns = np.asarray(pixels, dtype=float).max(axis=0)
+        temperatures = np.repeat(columns, rays_per_column)
+        hot = temperatures > self.hot_threshold
+        if not hot.any():
+            return 0
+        bearings = yaw - self.camera_offset + self.ray_bearings[hot]
+        temperatures = temperatures[hot]
+
+        with self._lock:
+            steps = self._steps
+            cols = np.floor((x + np.cos(bearings)[:, None] * steps - self.origin[0])
+                            / self.resolution).astype(int)
+            rows = np.floor((y + np.sin(bearings)[:, None] * steps - self.origin[1])
+                            / self.resolution).astype(int)
+            height, width = self.occupied.shape
+            inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+            wall = np.zeros(inside.shape, dtype=bool)
+            wall[inside] = self.occupied[rows[inside], cols[inside]]
+            # a ray leaving the map cannot hit anything further on
+            wall &= np.cumprod(inside, axis=1).astype(bool)
+            landed = wall.any(axis=1)
+            first = wall.argmax(axis=1)[landed]
+            ray = np.flatnonzero(landed)
+            cells = (rows[ray, first], cols[ray, first])
+            np.maximum.at(self.heat, cells, temperatures[landed])
+            np.add.at(self.hits, cells, 1)
+        return int(landed.sum())
+
+    def hottest(self, hits=min_hits):
+        """
+        Map (x, y) and temperature of the hottest cell hit by at least
+        `hits` hot rays, or None
+        """
+        if self.heat is None:
+            return None
+        with self._lock:
+            heat = np.where(self.hits >= hits, self.heat, -np.inf)
+            index = int(np.argmax(heat))
+            if not np.isfinite(heat.flat[index]):
+                return None
+            row, col = divmod(index, heat.shape[1])
+            x = self.origin[0] + (col + 0.5) * self.resolution
+            y = self.origin[1] + (row + 0.5) * self.resolution
+            return x, y, float(heat.flat[index])
+
+    def to_occupancy(self, low, high):
+        """The heat layer as OccupancyGrid data, low maps to 0 and high to 100, -1 unseen"""
+        with self._lock:
+            scaled = np.clip((self.heat - low) / (high - low) * 100, 0, 100).astype(np.int8)
+            scaled[self.hits == 0] = -1
+            return scaled